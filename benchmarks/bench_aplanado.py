@@ -0,0 +1,296 @@
+"""Mide el costo de las funciones que aplanan y validan las respuestas de la API.
+
+Genera un corpus reproducible de objetos con la forma de la API v2 (tweets,
+usuarios, media, polls y lugares) en dos variantes: 'minimo', con sólo los
+campos obligatorios, y 'completo', con métricas, referencias, geo y textos con
+saltos de línea. Para cada función reporta nanosegundos por registro (el mejor
+de varias repeticiones), los bloques de memoria que quedan vivos por registro y
+el pico de memoria medidos con tracemalloc.
+
+Las mediciones se pueden guardar como línea base y comparar después:
+
+    python benchmarks/bench_aplanado.py --guardar base.json
+    python benchmarks/bench_aplanado.py --comparar base.json --tolerancia 0.15
+
+con --comparar el script termina con código 1 si alguna función es más lenta
+o usa más memoria que la línea base por encima de la tolerancia."""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, raiz)
+
+import twigy
+
+idiomas = ['es', 'en', 'pt', 'und', 'fr']
+fuentes = ['Twitter for Android', 'Twitter for iPhone', 'Twitter Web App', 'TweetDeck']
+palabras = ['elección', 'México', 'hoy', 'la', 'de', 'votar', '#debate', '@alguien',
+            'https://t.co/abc123', 'datos', 'ciudad', 'lluvia', 'gracias', '🙂']
+
+def _id(azar):
+    return str(azar.randrange(10 ** 17, 10 ** 19))
+
+def _fecha(azar):
+    return '2021-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}.000Z'.format(
+        azar.randint(1, 12), azar.randint(1, 28), azar.randint(0, 23), azar.randint(0, 59), azar.randint(0, 59))
+
+def _texto(azar, n):
+    texto = ' '.join(azar.choice(palabras) for _ in range(n))
+    if azar.random() < 0.3:
+        texto = texto.replace(' ', '\n', 2)
+    return texto
+
+def generar_tweet(azar, variante):
+    tweet = {"id": _id(azar), "text": _texto(azar, azar.randint(5, 40))}
+    if variante == 'minimo':
+        return tweet
+    tweet.update({
+        "author_id": _id(azar),
+        "conversation_id": _id(azar),
+        "created_at": _fecha(azar),
+        "lang": azar.choice(idiomas),
+        "source": azar.choice(fuentes),
+        "public_metrics": {"retweet_count": azar.randint(0, 5000), "reply_count": azar.randint(0, 500),
+                           "like_count": azar.randint(0, 20000), "quote_count": azar.randint(0, 100)},
+        "entities": {"mentions": [{"start": 0, "end": 9, "username": "alguien"}]},
+    })
+    if azar.random() < 0.4:
+        tweet["in_reply_to_user_id"] = _id(azar)
+        tweet["referenced_tweets"] = [{"type": azar.choice(['retweeted', 'quoted', 'replied_to']), "id": _id(azar)}]
+    if azar.random() < 0.05:
+        tweet["geo"] = {"place_id": "01a9a39529b27f36",
+                        "coordinates": {"type": "Point", "coordinates": [-99.13 + azar.random(), 19.43 + azar.random()]}}
+    if azar.random() < 0.2:
+        tweet["attachments"] = {"media_keys": ['3_' + _id(azar)]}
+    return tweet
+
+def generar_user(azar, variante):
+    user = {"id": _id(azar), "name": _texto(azar, 2), "username": 'usuario_{}'.format(azar.randint(0, 99999))}
+    if variante == 'minimo':
+        return user
+    user.update({
+        "created_at": _fecha(azar),
+        "description": _texto(azar, azar.randint(0, 25)),
+        "location": azar.choice(['', 'CDMX', 'Guadalajara, Jalisco', 'Monterrey']),
+        "pinned_tweet_id": _id(azar) if azar.random() < 0.3 else None,
+        "protected": azar.random() < 0.05,
+        "verified": azar.random() < 0.02,
+        "public_metrics": {"followers_count": azar.randint(0, 10 ** 6), "following_count": azar.randint(0, 5000),
+                           "tweet_count": azar.randint(0, 10 ** 5), "listed_count": azar.randint(0, 1000)},
+    })
+    return user
+
+def generar_media(azar, variante):
+    media = {"media_key": '3_' + _id(azar), "type": azar.choice(['photo', 'video', 'animated_gif'])}
+    if variante == 'completo':
+        media.update({"duration_ms": azar.randint(1000, 120000), "height": 720, "width": 1280,
+                      "public_metrics": {"view_count": azar.randint(0, 10 ** 6)}})
+    return media
+
+def generar_poll(azar, variante):
+    opciones = azar.randint(2, 4)
+    poll = {"id": _id(azar),
+            "options": [{"position": k + 1, "label": _texto(azar, 2), "votes": azar.randint(0, 1000)}
+                        for k in range(opciones)]}
+    if variante == 'completo':
+        poll.update({"duration_minutes": 1440, "end_datetime": _fecha(azar), "voting_status": 'closed'})
+    return poll
+
+def generar_place(azar, variante):
+    place = {"id": '{:016x}'.format(azar.getrandbits(64)), "full_name": 'Ciudad de México, México'}
+    if variante == 'completo':
+        place.update({"name": 'Ciudad de México', "country": 'México', "country_code": 'MX',
+                      "place_type": 'city', "geo": {"type": 'Feature', "bbox": [-99.3, 19.1, -98.9, 19.6]}})
+    return place
+
+generadores = {
+    "tweet": generar_tweet,
+    "user": generar_user,
+    "media": generar_media,
+    "poll": generar_poll,
+    "place": generar_place,
+}
+
+def generar_corpus(tamano, semilla=2021):
+    """Regresa un dict (tipo, variante) -> lista de tamano objetos generados."""
+
+    corpus = {}
+    for variante in ('minimo', 'completo'):
+        for tipo, generador in generadores.items():
+            azar = random.Random('{}-{}-{}'.format(semilla, tipo, variante))
+            corpus[(tipo, variante)] = [generador(azar, variante) for _ in range(tamano)]
+    return corpus
+
+def _paginas(objetos, tamano=100):
+    return [objetos[k:k + tamano] for k in range(0, len(objetos), tamano)]
+
+def casos(corpus):
+    """Regresa una lista de (nombre, funcion, registros). Cada llamada a funcion
+    procesa registros elementos y regresa el resultado, que se mantiene vivo
+    durante la medición de memoria."""
+
+    fecha = datetime.now(timezone.utc)
+    resultado = []
+    procesadores = {
+        "tweet": (twigy.process_tweet, twigy.tweets_to_list),
+        "user": (twigy.process_user, twigy.users_to_list),
+        "media": (twigy.process_media, twigy.media_to_list),
+        "poll": (twigy.process_poll, twigy.polls_to_list),
+        "place": (twigy.process_place, twigy.places_to_list),
+    }
+    for (tipo, variante), objetos in corpus.items():
+        procesar, a_lista = procesadores[tipo]
+
+        def por_objeto(objetos=objetos, procesar=procesar):
+            return [procesar(objeto, fecha) for objeto in objetos]
+
+        def por_pagina(objetos=objetos, a_lista=a_lista):
+            lista = []
+            for pagina in _paginas(objetos):
+                a_lista(pagina, lista, fecha)
+            return lista
+
+        resultado.append(('{}[{}]'.format(procesar.__name__, variante), por_objeto, len(objetos)))
+        resultado.append(('{}[{}]'.format(a_lista.__name__, variante), por_pagina, len(objetos)))
+
+    for variante in ('minimo', 'completo'):
+        includes = [{"users": usuarios, "media": media, "polls": polls, "places": lugares}
+                    for usuarios, media, polls, lugares in zip(_paginas(corpus[('user', variante)]),
+                                                               _paginas(corpus[('media', variante)]),
+                                                               _paginas(corpus[('poll', variante)]),
+                                                               _paginas(corpus[('place', variante)]))]
+        registros = sum(len(lista) for include in includes for lista in include.values())
+
+        def con_includes(includes=includes):
+            listas = ([], [], [], [])
+            for include in includes:
+                twigy.includes_to_lists(include, fecha, *listas)
+            return listas
+
+        resultado.append(('includes_to_lists[{}]'.format(variante), con_includes, registros))
+
+    requester = twigy.Requester('token')
+    parametros = [
+        {"expansions": None, "tweet.fields": None, "user.fields": None, "media.fields": None,
+         "poll.fields": None, "place.fields": None, "max_results": '100', "pagination_token": None,
+         "since_id": None, "until_id": None, "start_time": None, "end_time": None, "exclude": None},
+        {"expansions": ['pinned_tweet_id'], "tweet.fields": [], "user.fields": None,
+         "max_results": '1000', "pagination_token": 'abcdefghijklmnop'},
+    ] * (len(corpus[('tweet', 'minimo')]) // 2)
+
+    def construir(parametros=parametros):
+        return [requester.construct_params(pre_params) for pre_params in parametros]
+
+    resultado.append(('construct_params', construir, len(parametros)))
+
+    azar = random.Random(7)
+    bloques = _paginas([_id(azar) for _ in range(len(corpus[('tweet', 'minimo')]))])
+
+    def validar(bloques=bloques):
+        return [twigy.check_id_list(bloque) for bloque in bloques]
+
+    resultado.append(('check_id_list', validar, sum(len(bloque) for bloque in bloques)))
+    return resultado
+
+def medir(funcion, registros, repeticiones, minimo=0.05):
+    """Regresa un dict con ns por registro (el mejor de las repeticiones), bloques
+    de memoria vivos por registro y el pico de memoria en bytes."""
+
+    vueltas = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(vueltas):
+            funcion()
+        if time.perf_counter() - inicio >= minimo:
+            break
+        vueltas = vueltas * 2
+
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(vueltas):
+            funcion()
+        transcurrido = (time.perf_counter() - inicio) / vueltas
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    resultado = funcion()
+    pico = tracemalloc.get_traced_memory()[1] - base
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    bloques = sum(diferencia.count_diff for diferencia in despues.compare_to(antes, 'filename'))
+    del resultado
+
+    return {"ns_registro": mejor * 1e9 / registros,
+            "bloques_registro": bloques / registros,
+            "pico_bytes": pico}
+
+def comparar(actual, base, tolerancia):
+    """Regresa la lista de textos que describen las regresiones de actual contra base."""
+
+    regresiones = []
+    for nombre, medicion in actual.items():
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        for metrica in ('ns_registro', 'pico_bytes'):
+            if anterior[metrica] > 0 and medicion[metrica] > anterior[metrica] * (1 + tolerancia):
+                regresiones.append("{}: {} {:.1f} -> {:.1f} (+{:.0%})".format(
+                    nombre, metrica, anterior[metrica], medicion[metrica],
+                    medicion[metrica] / anterior[metrica] - 1))
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamano', type=int, default=2000, help='objetos de cada tipo y variante en el corpus')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--filtro', default=None, help='mide sólo las funciones cuyo nombre contiene el texto')
+    parser.add_argument('--guardar', default=None, help='archivo JSON donde se guarda la línea base')
+    parser.add_argument('--comparar', default=None, help='archivo JSON con la línea base a comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.20,
+                        help='aumento relativo permitido antes de marcar una regresión')
+    args = parser.parse_args()
+
+    corpus = generar_corpus(args.tamano)
+    base = None
+    if args.comparar is not None:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)['mediciones']
+
+    mediciones = {}
+    print("{:<32} {:>12} {:>14} {:>12} {:>9}".format('función', 'ns/registro', 'bloques/reg', 'pico KiB', 'vs base'))
+    for nombre, funcion, registros in casos(corpus):
+        if args.filtro is not None and args.filtro not in nombre:
+            continue
+        medicion = medir(funcion, registros, args.repeticiones)
+        mediciones[nombre] = medicion
+        cambio = ''
+        if base is not None and nombre in base and base[nombre]['ns_registro'] > 0:
+            cambio = '{:+.0%}'.format(medicion['ns_registro'] / base[nombre]['ns_registro'] - 1)
+        print("{:<32} {:>12.1f} {:>14.2f} {:>12.1f} {:>9}".format(
+            nombre, medicion['ns_registro'], medicion['bloques_registro'], medicion['pico_bytes'] / 1024, cambio))
+
+    if args.guardar is not None:
+        with open(args.guardar, 'w', encoding='utf-8') as archivo:
+            json.dump({"python": sys.version.split()[0], "tamano": args.tamano,
+                       "mediciones": mediciones}, archivo, indent=1)
+        print("Línea base guardada en {}".format(args.guardar))
+
+    if base is not None:
+        regresiones = comparar(mediciones, base, args.tolerancia)
+        for regresion in regresiones:
+            print("REGRESIÓN " + regresion)
+        sys.exit(1 if len(regresiones) > 0 else 0)
+
+if __name__ == '__main__':
+    main()
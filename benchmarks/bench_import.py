@@ -0,0 +1,97 @@
+"""Mide el tiempo que tarda en importarse twigy en un intérprete nuevo.
+
+Cada medición se hace en un subproceso con `python -X importtime -c "import twigy"`
+para reproducir el arranque en frío de un worker. El script reporta la mediana
+del tiempo total del proceso y del tiempo acumulado de importación de twigy,
+así como los módulos pesados que quedaron importados.
+
+Se puede usar como guardia contra regresiones:
+
+    python benchmarks/bench_import.py --max-ms 50
+
+termina con código 1 si la mediana del tiempo de importación supera el límite
+o si alguno de los módulos prohibidos se importa al cargar twigy."""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencias de terceros que twigy importa hasta que se usan. Los módulos
+# de la biblioteca estándar que son baratos se importan al cargar twigy.
+prohibidos_default = ['requests', 'urllib3', 'charset_normalizer', 'idna', 'orjson', 'pyarrow',
+                      'pandas', 'numpy', 'aiohttp', 'duckdb']
+
+codigo = """
+import sys
+import twigy
+print('MODULOS ' + ','.join(sorted(sys.modules)))
+"""
+
+def medir(python):
+    """Importa twigy en un subproceso y regresa la tupla
+    (tiempo total en ms, tiempo acumulado de twigy en ms, módulos importados)."""
+
+    entorno = dict(os.environ)
+    entorno['PYTHONPATH'] = raiz + os.pathsep + entorno.get('PYTHONPATH', '')
+
+    inicio = time.perf_counter()
+    proceso = subprocess.run([python, '-X', 'importtime', '-c', codigo],
+                             capture_output=True, text=True, env=entorno, check=True)
+    total = (time.perf_counter() - inicio) * 1000
+
+    acumulado = None
+    for linea in proceso.stderr.splitlines():
+        partes = linea.split('|')
+        if len(partes) == 3 and partes[2].strip() == 'twigy':
+            acumulado = int(partes[1]) / 1000
+
+    modulos = []
+    for linea in proceso.stdout.splitlines():
+        if linea.startswith('MODULOS '):
+            modulos = linea[len('MODULOS '):].split(',')
+
+    return total, acumulado, modulos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='límite para la mediana del tiempo de importación de twigy')
+    parser.add_argument('--prohibidos', default=','.join(prohibidos_default),
+                        help='módulos que no deben importarse al cargar twigy')
+    parser.add_argument('--python', default=sys.executable)
+    args = parser.parse_args()
+
+    totales = []
+    acumulados = []
+    modulos = []
+    for _ in range(args.repeticiones):
+        total, acumulado, modulos = medir(args.python)
+        totales.append(total)
+        acumulados.append(acumulado)
+
+    mediana_total = statistics.median(totales)
+    mediana_twigy = statistics.median(acumulados)
+    print("Arranque del proceso: mediana {:.1f} ms".format(mediana_total))
+    print("Importación de twigy: mediana {:.1f} ms, mínimo {:.1f} ms".format(
+        mediana_twigy, min(acumulados)))
+
+    prohibidos = [m for m in args.prohibidos.split(',') if m]
+    importados = [m for m in prohibidos if m in modulos]
+    fallo = False
+    if len(importados) > 0:
+        print("Módulos pesados importados al cargar twigy: {}".format(', '.join(importados)))
+        fallo = True
+    if args.max_ms is not None and mediana_twigy > args.max_ms:
+        print("La importación de twigy supera el límite de {} ms".format(args.max_ms))
+        fallo = True
+
+    sys.exit(1 if fallo else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RespuestaFalsa():
+    """Respuesta con la interfaz de requests que usa twigy."""
+
+    def __init__(self, status_code, contenido=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self.content = json.dumps(contenido if contenido is not None else {}).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ApiFalsa():
+    """Sustituye al módulo requests. Cada petición se registra en peticiones y
+    se responde con manejador(url, parametros)."""
+
+    def __init__(self):
+        self.peticiones = []
+        self.manejador = None
+
+    def request(self, metodo, url, headers=None, params=None, **kwargs):
+        parametros = dict(params or {})
+        self.peticiones.append((url, parametros))
+        return self.manejador(url, parametros)
+
+
+def paginas_tweets(n_paginas, por_pagina=10, fallas=None):
+    """Manejador que regresa n_paginas de tweets. El token de cada página es su
+    número; fallas es un dict de número de página a status code."""
+
+    fallas = fallas if fallas is not None else {}
+
+    def manejador(url, parametros):
+        token = parametros.get('pagination_token') or parametros.get('next_token')
+        n = int(token) if token is not None else 0
+        if n in fallas:
+            return RespuestaFalsa(fallas[n])
+        meta = {"result_count": por_pagina}
+        if n < n_paginas - 1:
+            meta['next_token'] = str(n + 1)
+        datos = [{"id": str(n * 1000 + k), "text": "t", "author_id": "1"} for k in range(por_pagina)]
+        return RespuestaFalsa(200, {"data": datos, "meta": meta})
+
+    return manejador
+
+
+@pytest.fixture
+def api(monkeypatch):
+    falsa = ApiFalsa()
+    modulo = types.ModuleType('requests')
+    modulo.request = falsa.request
+    monkeypatch.setitem(sys.modules, 'requests', modulo)
+    return falsa
@@ -0,0 +1,45 @@
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+
+def manejador(url, parametros):
+    if url.endswith('users/by'):
+        datos = [{"id": str(len(u)), "username": u.upper()} for u in parametros['usernames'].split(',')]
+    else:
+        datos = [{"id": x} for x in parametros['ids'].split(',') if x != '999']
+    return RespuestaFalsa(200, {"data": datos})
+
+
+def test_agrupador_junta_hasta_maximo_solicitudes_por_peticion(api):
+    api.manejador = manejador
+    with twigy.Agrupador(twigy.Requester('token'), ventana=60) as agrupador:
+        futuros = [agrupador.user(str(x)) for x in range(1, 151)]
+        repetido = agrupador.user('1')
+        faltante = agrupador.user('999')
+    assert [futuro.result(timeout=5)['id'] for futuro in futuros] == [str(x) for x in range(1, 151)]
+    assert repetido.result(timeout=5) == {"id": "1"}
+    assert faltante.result(timeout=5) is None
+    assert len(api.peticiones) == 2
+    assert agrupador.solicitudes == 152 and agrupador.peticiones == 2
+
+
+def test_agrupador_usernames_sin_distinguir_mayusculas(api):
+    api.manejador = manejador
+    with twigy.Agrupador(twigy.Requester('token'), ventana=60) as agrupador:
+        primero = agrupador.user_by_uname('Twigy')
+        segundo = agrupador.user_by_uname('twigy')
+    assert primero.result(timeout=5) == segundo.result(timeout=5) == {"id": "5", "username": "TWIGY"}
+    assert [parametros['usernames'] for url, parametros in api.peticiones] == ['twigy']
+
+
+def test_agrupador_reparte_el_error_de_la_peticion(api):
+    api.manejador = lambda url, parametros: RespuestaFalsa(400)
+    with pytest.warns(UserWarning):
+        with twigy.Agrupador(twigy.Requester('token'), ventana=60) as agrupador:
+            futuros = [agrupador.tweet('1'), agrupador.tweet('2')]
+    assert len(api.peticiones) == 1
+    for futuro in futuros:
+        with pytest.raises(Exception, match='400'):
+            futuro.result(timeout=5)
@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def bench():
+    ruta = os.path.join(raiz, 'benchmarks', 'bench_aplanado.py')
+    spec = importlib.util.spec_from_file_location('bench_aplanado', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def test_el_corpus_es_reproducible(bench):
+    corpus = bench.generar_corpus(50)
+    assert corpus == bench.generar_corpus(50)
+    assert corpus != bench.generar_corpus(50, semilla=7)
+    assert set(corpus) == {(tipo, variante) for tipo in bench.generadores for variante in ('minimo', 'completo')}
+    assert all(len(objetos) == 50 for objetos in corpus.values())
+    assert all(set(tweet) == {'id', 'text'} for tweet in corpus[('tweet', 'minimo')])
+
+
+def test_los_casos_procesan_todo_el_corpus(bench):
+    casos = bench.casos(bench.generar_corpus(200))
+    nombres = [nombre for nombre, funcion, registros in casos]
+    assert len(nombres) == len(set(nombres))
+    assert {'process_tweet[completo]', 'tweets_to_list[minimo]', 'includes_to_lists[completo]',
+            'construct_params', 'check_id_list'} <= set(nombres)
+    for nombre, funcion, registros in casos:
+        resultado = funcion()
+        if nombre.startswith('includes_to_lists'):
+            assert sum(len(lista) for lista in resultado) == registros
+        elif nombre == 'check_id_list':
+            assert len(resultado) == registros // 100
+        else:
+            assert len(resultado) == registros
+
+
+def test_comparar_reporta_regresiones_de_tiempo_y_memoria(bench):
+    base = {"a": {"ns_registro": 100.0, "pico_bytes": 1000}, "b": {"ns_registro": 100.0, "pico_bytes": 1000}}
+    actual = {"a": {"ns_registro": 119.0, "pico_bytes": 1000}, "b": {"ns_registro": 100.0, "pico_bytes": 1300},
+              "c": {"ns_registro": 1.0, "pico_bytes": 1}}
+    regresiones = bench.comparar(actual, base, 0.2)
+    assert len(regresiones) == 1 and regresiones[0].startswith('b: pico_bytes')
+
+
+def test_guardar_y_comparar_desde_la_linea_de_comandos(tmp_path):
+    script = os.path.join(raiz, 'benchmarks', 'bench_aplanado.py')
+    ruta = str(tmp_path / 'base.json')
+    opciones = ['--tamano', '100', '--repeticiones', '1', '--filtro', 'process_user']
+    subprocess.run([sys.executable, script, '--guardar', ruta] + opciones, check=True, capture_output=True)
+    with open(ruta, encoding='utf-8') as archivo:
+        base = json.load(archivo)
+    assert sorted(base['mediciones']) == ['process_user[completo]', 'process_user[minimo]']
+
+    for medicion in base['mediciones'].values():
+        medicion['ns_registro'] = medicion['ns_registro'] / 100
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        json.dump(base, archivo)
+    proceso = subprocess.run([sys.executable, script, '--comparar', ruta] + opciones, capture_output=True, text=True)
+    assert proceso.returncode == 1 and 'REGRESIÓN process_user' in proceso.stdout
@@ -0,0 +1,71 @@
+import json
+
+import twigy
+from conftest import paginas_tweets
+
+
+def test_presupuesto_agotado_regresa_false(api):
+    api.manejador = paginas_tweets(5)
+    requester = twigy.Requester('token')
+    tweets = []
+    avances = []
+    assert requester.bulk_timeline('1', tweets, presupuesto=120, avance=avances.append) is False
+    assert avances == ['1', '2', '3']
+    resto = []
+    assert requester.bulk_timeline('1', resto, pagination_token=avances[-1]) is True
+    assert len(tweets) + len(resto) == 50
+
+
+def _ids(directorio):
+    with open(directorio / 'tweets.jsonl', encoding='utf-8') as archivo:
+        return [json.loads(linea)['id'] for linea in archivo]
+
+
+def test_trabajo_sin_presupuesto_se_reanuda_sin_repetir(api, tmp_path):
+    api.manejador = paginas_tweets(6)
+    salida = tmp_path / 'salida'
+    trabajo = {"id": "t", "endpoint": "timeline", "semillas": ['1', '2', '3'], "tokens": ['token'],
+               "presupuesto": 200, "salida": {"directorio": str(salida)}}
+    estado = twigy.EstadoTrabajo(str(tmp_path / 'estado'), 't')
+    assert not twigy.ejecutar_trabajo(trabajo, estado, intervalo=0.01)
+    assert estado.datos['completadas'] == ['1']
+    assert estado.datos['en_curso'] == {'2': '5'}
+    assert len(_ids(salida)) == 110
+
+    trabajo['presupuesto'] = 1000
+    estado = twigy.EstadoTrabajo(str(tmp_path / 'estado'), 't')
+    assert twigy.ejecutar_trabajo(trabajo, estado, intervalo=0.01)
+    assert sorted(estado.datos['completadas']) == ['1', '2', '3']
+    assert len(_ids(salida)) == 180
+    peticiones_semilla_2 = [parametros.get('pagination_token') for url, parametros in api.peticiones
+                            if url.endswith('users/2/tweets')]
+    assert peticiones_semilla_2 == [None, '1', '2', '3', '4', '5']
+
+
+def test_trabajador_cola_deja_pendiente_la_semilla_sin_presupuesto(api, tmp_path):
+    api.manejador = paginas_tweets(6)
+    cola = twigy.ColaSQLite(str(tmp_path / 'cola.sqlite'))
+    cola.agregar('t', ['1', '2'])
+    trabajo = {"id": "t", "endpoint": "timeline", "semillas": ['1', '2'], "tokens": ['token'], "presupuesto": 200}
+    sinks = {tipo: [] for tipo in twigy.tipos_sink}
+    trabajador = twigy.TrabajadorCola(cola, trabajo, twigy.Requester('token'), sinks, nombre='a')
+    assert trabajador.ejecutar() == 1
+    assert cola.resumen('t')['pendiente'] == 1
+    asignacion = cola.tomar('t', 'b')[0]
+    assert (asignacion.semilla, asignacion.cursor) == ('2', '5')
+    cola.close()
+
+
+def test_libro_cap_lee_el_archivo_una_vez_por_vigencia(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'cap.json')
+    libro = twigy.LibroCap(ruta, cap=1000, vigencia=60)
+    otro = twigy.LibroCap(ruta, cap=1000, vigencia=60)
+    libro.registrar(100)
+    assert libro.restante() == 900
+    otro.registrar(50)
+    lecturas = []
+    leer = libro._leer
+    monkeypatch.setattr(libro, '_leer', lambda: lecturas.append(1) or leer())
+    assert libro.restante() == 900 and twigy.LibroCap(ruta, cap=1000).restante() == 850
+    libro.vigencia = 0
+    assert libro.restante() == 850 and len(lecturas) == 1
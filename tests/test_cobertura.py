@@ -0,0 +1,107 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+
+@pytest.fixture
+def cobertura():
+    cobertura = twigy.Cobertura(minimo=0.05, presupuesto=0.05, token='alterno')
+    yield cobertura
+    cobertura.cerrar()
+
+
+def _lenta(api, monkeypatch, status_duplicado=200):
+    """Hace que la primera petición del usuario lento espere a que termine su
+    duplicado, o un segundo si no lo hay. Regresa la lista de (username, token) de las peticiones."""
+
+    duplicado = threading.Event()
+    lentas = []
+    peticiones = []
+    request = sys.modules['requests'].request
+
+    def manejador(url, parametros):
+        username = url.split('/')[-1]
+        if username == 'lento':
+            lentas.append(username)
+            if len(lentas) == 1:
+                duplicado.wait(1)
+                time.sleep(0.2)
+                return RespuestaFalsa(200, {"data": {"id": '1', "username": 'original'}})
+            duplicado.set()
+            return RespuestaFalsa(status_duplicado, {"data": {"id": '1', "username": 'duplicado'}})
+        return RespuestaFalsa(200, {"data": {"id": '2', "username": username}})
+
+    def registrar(metodo, url, headers=None, **kwargs):
+        peticiones.append((url.split('/')[-1], headers['Authorization']))
+        return request(metodo, url, headers=headers, **kwargs)
+
+    api.manejador = manejador
+    monkeypatch.setattr(sys.modules['requests'], 'request', registrar)
+    return peticiones
+
+
+def _calentar(requester, n=20):
+    for k in range(n):
+        requester.user_by_uname('rapido{}'.format(k))
+
+
+def test_no_duplica_sin_latencias_suficientes(api, monkeypatch, cobertura):
+    peticiones = _lenta(api, monkeypatch)
+    requester = twigy.Requester('token')
+    requester.set_cobertura(cobertura)
+    _calentar(requester, 19)
+    assert cobertura.umbral('users/by/username/{}') is None
+    assert requester.user_by_uname('lento').json()['data']['username'] == 'original'
+    assert cobertura.resumen()['duplicadas'] == 0 and len(peticiones) == 20
+
+
+def test_duplica_las_peticiones_lentas_con_el_token_alterno(api, monkeypatch, cobertura):
+    peticiones = _lenta(api, monkeypatch)
+    requester = twigy.Requester('token')
+    requester.set_cobertura(cobertura)
+    _calentar(requester)
+    assert cobertura.umbral('users/by/username/{}') == 0.05
+
+    respuesta = requester.user_by_uname('lento')
+    assert respuesta.json()['data']['username'] == 'duplicado'
+    assert [par for par in peticiones if par[0] == 'lento'] == [('lento', 'Bearer token'), ('lento', 'Bearer alterno')]
+    assert cobertura.resumen()['duplicadas'] == 1 and cobertura.resumen()['ganadas'] == 1
+    assert requester.last_petition['header']['Authorization'] == 'Bearer alterno'
+
+
+def test_si_el_duplicado_falla_se_usa_el_original(api, monkeypatch, cobertura):
+    _lenta(api, monkeypatch, status_duplicado=400)
+    requester = twigy.Requester('token')
+    requester.set_cobertura(cobertura)
+    _calentar(requester)
+    with pytest.warns(UserWarning):
+        respuesta = requester.user_by_uname('lento')
+    assert respuesta.json()['data']['username'] == 'original'
+    assert cobertura.resumen()['duplicadas'] == 1 and cobertura.resumen()['ganadas'] == 0
+
+
+def test_el_presupuesto_limita_los_duplicados(api, monkeypatch, cobertura):
+    peticiones = _lenta(api, monkeypatch)
+    requester = twigy.Requester('token')
+    requester.set_cobertura(cobertura)
+    _calentar(requester)
+    cobertura.peticiones = 0
+    requester.user_by_uname('lento')
+    assert cobertura.resumen()['duplicadas'] == 0
+    assert [par for par in peticiones if par[0] == 'lento'] == [('lento', 'Bearer token')]
+
+
+def test_no_duplica_si_la_ventana_del_token_alterno_se_agota(api, monkeypatch, cobertura):
+    _lenta(api, monkeypatch)
+    requester = twigy.Requester('token')
+    requester.set_cobertura(cobertura)
+    _calentar(requester)
+    cobertura._limites_alterno['users/by/username/{}'] = {"limite": 900, "restantes": 2,
+                                                                  "reinicio": time.time() + 60}
+    assert requester.user_by_uname('lento').json()['data']['username'] == 'original'
+    assert cobertura.resumen()['duplicadas'] == 0
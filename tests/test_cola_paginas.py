@@ -0,0 +1,23 @@
+import twigy
+
+
+def test_cola_paginas_derrama_en_orden(tmp_path):
+    cola = twigy.ColaPaginas(maximo=3, directorio=str(tmp_path))
+    for k in range(10):
+        cola.poner(k)
+    metricas = cola.metricas()
+    assert (metricas['en_memoria'], metricas['en_disco']) == (3, 7)
+    assert metricas['bytes_disco'] > 0
+
+    tomados = [cola.tomar() for _ in range(5)]
+    for k in range(10, 13):
+        cola.poner(k)
+    cola.cerrar()
+    while True:
+        elemento = cola.tomar()
+        if elemento is None:
+            break
+        tomados.append(elemento)
+    assert tomados == list(range(13))
+    assert cola.metricas()['en_disco'] == 0
+    assert cola.metricas()['maximo_en_disco'] == 8
@@ -0,0 +1,51 @@
+import time
+
+import twigy
+
+
+def _cola(tmp_path, **kwargs):
+    cola = twigy.ColaSQLite(str(tmp_path / 'cola.sqlite'), **kwargs)
+    cola.agregar('t', ['1', '2'])
+    return cola
+
+
+def test_cola_sqlite_asigna_cada_semilla_una_vez(tmp_path):
+    cola = _cola(tmp_path)
+    primera = cola.tomar('t', 'a')
+    segunda = cola.tomar('t', 'b')
+    assert [asignacion.semilla for asignacion in primera + segunda] == ['1', '2']
+    assert cola.tomar('t', 'c') == []
+    assert cola.avanzar(primera[0], '5')
+    assert cola.completar(primera[0])
+    assert not cola.completar(primera[0])
+    assert cola.resumen('t') == {"pendiente": 0, "asignada": 1, "completada": 1, "fallida": 0}
+    cola.close()
+
+
+def test_cola_sqlite_reasigna_vencidas_con_su_cursor(tmp_path):
+    cola = _cola(tmp_path, duracion=0.05)
+    vieja = cola.tomar('t', 'a')[0]
+    assert cola.avanzar(vieja, '3')
+    time.sleep(0.1)
+    nueva = cola.tomar('t', 'b')[0]
+    assert (nueva.semilla, nueva.cursor, nueva.intentos) == ('1', '3', 2)
+    assert not cola.avanzar(vieja, '4')
+    assert not cola.completar(vieja)
+    assert cola.completar(nueva)
+    cola.close()
+
+
+def test_cola_sqlite_fallar_y_liberar(tmp_path):
+    cola = _cola(tmp_path, max_intentos=2)
+    for intento in range(2):
+        asignacion = cola.tomar('t', 'a')[0]
+        cola.fallar(asignacion, 'error {}'.format(intento))
+    assert cola.errores('t') == {'1': 'error 1'}
+
+    asignacion = cola.tomar('t', 'a')[0]
+    assert asignacion.semilla == '2'
+    cola.avanzar(asignacion, '8')
+    cola.liberar(asignacion)
+    otra = cola.tomar('t', 'b')[0]
+    assert (otra.semilla, otra.cursor, otra.intentos) == ('2', '8', 1)
+    cola.close()
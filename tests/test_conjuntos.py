@@ -0,0 +1,41 @@
+import random
+
+import twigy
+
+
+def test_conjunto_ids_crece_y_se_guarda(tmp_path):
+    ruta = str(tmp_path / 'vistos.ids')
+    conjunto = twigy.ConjuntoIds(capacidad=8)
+    ids = random.Random(1).sample(range(1, 10 ** 18), 5000)
+    assert all(conjunto.agregar(str(x)) for x in ids)
+    assert not conjunto.agregar(ids[0])
+    assert len(conjunto) == 5000
+    conjunto.guardar(ruta)
+
+    cargado = twigy.ConjuntoIds(ruta)
+    assert len(cargado) == 5000
+    assert all(str(x) in cargado for x in ids)
+    assert 0 not in cargado and '123' not in cargado
+
+
+def test_conjunto_bloom_sin_falsos_negativos(tmp_path):
+    ruta = str(tmp_path / 'vistos.bloom')
+    conjunto = twigy.ConjuntoBloom(capacidad=1000, error=0.01)
+    ids = list(range(1, 5001))
+    conjunto.agregar_varios(ids)
+    conjunto.guardar(ruta)
+
+    cargado = twigy.ConjuntoBloom(ruta)
+    assert all(x in cargado for x in ids)
+    falsos = sum(1 for x in range(10 ** 9, 10 ** 9 + 5000) if x in cargado)
+    assert falsos < 250
+
+
+def test_conjunto_ids_agregar_varios_cuenta_los_nuevos():
+    conjunto = twigy.ConjuntoIds(capacidad=8)
+    assert conjunto.agregar_varios(['5', 5, 0, '0', 7]) == 3
+    ids = random.Random(2).sample(range(1, 10 ** 18), 3000)
+    assert conjunto.agregar_varios(ids) == 3000
+    assert conjunto.agregar_varios(str(x) for x in ids[:100] + [11]) == 1
+    assert len(conjunto) == 3004
+    assert all(x in conjunto for x in ids) and 0 in conjunto and 11 in conjunto
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import twigy
+
+pd = pytest.importorskip('pandas')
+
+fecha = datetime(2021, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+tweets = [
+    {"id": "1", "text": "hola\nmundo", "author_id": "9", "created_at": "2021-05-01T10:00:00.000Z",
+     "lang": "es", "source": "web", "public_metrics": {"retweet_count": 2, "reply_count": 0,
+                                                      "like_count": 5, "quote_count": 1},
+     "referenced_tweets": [{"type": "quoted", "id": "7"}],
+     "geo": {"coordinates": {"type": "Point", "coordinates": [-99.1, 19.4]}}},
+    {"id": "2", "text": "sin métricas", "author_id": "9", "created_at": "2021-05-01T11:30:00Z", "lang": "en"},
+]
+
+users = [
+    {"id": "9", "name": "Nombre\tcon tab", "username": "usuario", "created_at": "2010-01-01T00:00:00.000Z",
+     "protected": False, "public_metrics": {"followers_count": 10, "following_count": 3,
+                                            "tweet_count": 100, "listed_count": 0}},
+    {"id": "8", "username": "otro", "protected": True},
+]
+
+
+def test_tweets_a_dataframe_coincide_con_process_tweet():
+    directo = twigy.tweets_a_dataframe(tweets, fecha)
+    procesado = twigy.lista_a_dataframe([twigy.process_tweet(tweet, fecha) for tweet in tweets], 'tweets')
+    pd.testing.assert_frame_equal(directo, procesado)
+    assert str(directo['like_count'].dtype) == 'Int64' and directo['like_count'].isna().tolist() == [False, True]
+    assert isinstance(directo['lang'].dtype, pd.CategoricalDtype)
+    assert directo['text'][0] == 'hola mundo' and directo['quoted_id'][0] == '7'
+    assert directo['created_at'][1] == pd.Timestamp('2021-05-01T11:30:00Z')
+    assert (directo['fecha_peticion'] == pd.Timestamp(fecha)).all()
+
+
+def test_users_a_dataframe_coincide_con_process_user():
+    directo = twigy.users_a_dataframe(users, fecha)
+    procesado = twigy.lista_a_dataframe([twigy.process_user(usuario, fecha) for usuario in users], 'users')
+    pd.testing.assert_frame_equal(directo, procesado)
+    assert directo['name'][0] == 'Nombre con tab' and directo['followers'].isna().tolist() == [False, True]
+
+
+def test_pagina_a_dataframes_separa_data_e_includes():
+    contenido = {"data": tweets, "includes": {"users": users, "tweets": tweets[:1],
+                                              "media": [{"media_key": "3_1", "type": "photo"}]}}
+    frames = twigy.pagina_a_dataframes(contenido, fecha)
+    assert sorted(frames) == ['media', 'tweets', 'tweets_includes', 'users']
+    assert len(frames['tweets']) == 2 and len(frames['tweets_includes']) == 1
+
+    unido = twigy.unir_dataframes([frames['tweets'], frames['tweets_includes']])
+    assert len(unido) == 3 and isinstance(unido['lang'].dtype, pd.CategoricalDtype)
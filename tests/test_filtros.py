@@ -0,0 +1,22 @@
+import twigy
+from conftest import RespuestaFalsa
+
+
+def test_filtro_en_modo_ids_pide_las_metricas(api):
+    def manejador(url, parametros):
+        campos = parametros.get('user.fields', '')
+        usuarios = [{"id": "1", "public_metrics": {"followers_count": 5}},
+                    {"id": "2", "public_metrics": {"followers_count": 5000}}]
+        if 'public_metrics' not in campos:
+            usuarios = [{"id": usuario['id']} for usuario in usuarios]
+        return RespuestaFalsa(200, {"data": usuarios, "meta": {}})
+
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    ids = []
+    requester.bulk_followers('9', None, lista_ids=ids, filtro=twigy.FiltroMetricas(followers_count=1000))
+    assert ids == [2]
+    ids = []
+    requester.bulk_followers('9', None, lista_ids=ids)
+    assert api.peticiones[-1][1]['user.fields'] == 'id'
+    assert ids == [1, 2]
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+import twigy
+
+
+def _vecinos_esperados(aristas):
+    seguidos, seguidores = {}, {}
+    for origen, destino in aristas:
+        seguidos.setdefault(origen, set()).add(destino)
+        seguidores.setdefault(destino, set()).add(origen)
+    return seguidos, seguidores
+
+
+@pytest.mark.parametrize('numpy', [False, True])
+def test_grafo_csr_se_guarda_y_combina(tmp_path, monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip('numpy')
+    monkeypatch.setitem(twigy._extras_detectados, 'numpy', numpy)
+    ruta = str(tmp_path / 'red.csr')
+    azar = random.Random(2)
+    aristas = set()
+    grafo = twigy.GrafoSeguidores(ruta)
+    for ronda in range(3):
+        for _ in range(20):
+            user_id = azar.randrange(1, 50)
+            nuevos = [azar.randrange(1, 50) for _ in range(azar.randrange(1, 10))]
+            if azar.random() < 0.5:
+                grafo.agregar_seguidos(user_id, nuevos)
+                aristas.update((user_id, x) for x in nuevos)
+            else:
+                grafo.agregar_seguidores(user_id, nuevos)
+                aristas.update((x, user_id) for x in nuevos)
+        grafo.guardar()
+        grafo.cerrar()
+        grafo = twigy.GrafoSeguidores(ruta)
+
+    seguidos, seguidores = _vecinos_esperados(aristas)
+    assert grafo.num_aristas() == len(aristas)
+    for user_id in range(1, 50):
+        assert list(grafo.seguidos(user_id)) == sorted(seguidos.get(user_id, ()))
+        assert list(grafo.seguidores(user_id)) == sorted(seguidores.get(user_id, ()))
+    grafo.cerrar()
+
+
+def test_grafo_consulta_aristas_no_guardadas(tmp_path):
+    grafo = twigy.GrafoSeguidores(str(tmp_path / 'red.csr'))
+    grafo.agregar_seguidos(1, [3, 2])
+    grafo.guardar()
+    grafo.agregar_seguidos(1, [4, 2])
+    assert list(grafo.seguidos(1)) == [2, 3, 4]
+    assert grafo.num_aristas() == 2
+    grafo.cerrar()
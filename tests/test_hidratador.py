@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+# página: (data, tweets de includes); la página 2 falla
+paginas = {
+    0: ([{"id": "1", "text": "t", "author_id": "9", "referenced_tweets": [{"type": "quoted", "id": "77"}]},
+         {"id": "2", "text": "t", "author_id": "9", "referenced_tweets": [{"type": "retweeted", "id": "55"}]}],
+        [{"id": "55", "text": "t", "author_id": "8"}]),
+    1: ([{"id": "3", "text": "t", "author_id": "9", "referenced_tweets": [{"type": "quoted", "id": "66"}]}],
+        [{"id": "66", "text": "t", "author_id": "8"}]),
+}
+
+
+def manejador(url, parametros):
+    if url.endswith('api.twitter.com/2/tweets'):
+        ids = parametros['ids'].split(',')
+        return RespuestaFalsa(200, {"data": [{"id": x, "text": "t", "author_id": "7"} for x in ids]})
+    n = int(parametros.get('pagination_token') or 0)
+    if n not in paginas:
+        return RespuestaFalsa(400)
+    datos, incluidos = paginas[n]
+    return RespuestaFalsa(200, {"data": datos, "includes": {"tweets": incluidos},
+                                "meta": {"result_count": len(datos), "next_token": str(n + 1)}})
+
+
+def _pedidos(api):
+    return [parametros['ids'] for url, parametros in api.peticiones if url.endswith('2/tweets')]
+
+
+def test_las_referencias_pendientes_se_piden_aunque_la_paginacion_falle(api):
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    tweets = []
+    avances = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion):
+            requester.bulk_timeline('1', tweets, hidratar=True,
+                                    avance=lambda token: avances.append((token, [t['id'] for t in tweets])))
+    assert _pedidos(api) == ['77']
+    assert avances == [('1', ['1', '2', '55', '77']), ('2', ['1', '2', '55', '77', '3', '66'])]
+
+
+def test_sin_avance_las_referencias_se_piden_al_salir_por_el_error(api):
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    tweets = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion):
+            requester.bulk_timeline('1', tweets, hidratar=True)
+    assert _pedidos(api) == ['77']
+    assert [tweet['id'] for tweet in tweets] == ['1', '2', '55', '3', '66', '77']
+
+
+def test_vistos_evita_pedir_y_repetir_tweets(api):
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    vistos = twigy.ConjuntoIds()
+    vistos.agregar_varios(['2', '55', '77'])
+    tweets = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion):
+            requester.bulk_timeline('1', tweets, hidratar=True, vistos=vistos)
+    assert _pedidos(api) == []
+    assert [tweet['id'] for tweet in tweets] == ['1', '3', '66']
+    assert all(tweet_id in vistos for tweet_id in ('1', '3', '66'))
+
+
+def test_con_pool_los_tweets_de_includes_llegan_con_su_pagina(api):
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    with ThreadPoolExecutor(2) as pool:
+        requester.set_procesos(pool, trabajadores=2)
+        tweets = []
+        with pytest.warns(UserWarning):
+            with pytest.raises(twigy.ErrorPeticion):
+                requester.bulk_timeline('1', tweets, hidratar=True)
+    assert [tweet['id'] for tweet in tweets] == ['1', '2', '55', '3', '66', '77']
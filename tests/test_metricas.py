@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa, paginas_tweets
+
+
+def _manejador(cuentas):
+    """Manejador con usuarios cuyo tweet_count está en cuentas y timelines de una página."""
+
+    def manejador(url, parametros):
+        if url.endswith('2/users'):
+            datos = [{"id": x, "protected": False, "public_metrics": {"tweet_count": cuentas[x]}}
+                     for x in parametros['ids'].split(',')]
+            return RespuestaFalsa(200, {"data": datos})
+        return paginas_tweets(1)(url, parametros)
+
+    return manejador
+
+
+def _timelines(api):
+    return [url.split('/')[-2] for url, parametros in api.peticiones if url.endswith('/tweets')]
+
+
+def test_refrescar_solo_recolecta_las_cuentas_que_cambiaron(api, tmp_path):
+    cuentas = {'1': 10, '2': 20, '3': 30}
+    api.manejador = _manejador(cuentas)
+    ruta = str(tmp_path / 'metricas.bin')
+    requester = twigy.Requester('token')
+    tweets = []
+    assert requester.refrescar(['1', '2', '3'], 'bulk_timeline', twigy.MetricasUsuarios(ruta), tweets) == ['1', '2', '3']
+    assert _timelines(api) == ['1', '2', '3']
+
+    cuentas['2'] = 21
+    api.peticiones.clear()
+    metricas = twigy.MetricasUsuarios(ruta)
+    assert metricas.anteriores('2') == {'tweets': 20, 'followers': None, 'following': None, 'listed': None}
+    assert requester.refrescar(['1', '2', '3'], 'bulk_timeline', metricas, tweets) == ['2']
+    assert _timelines(api) == ['2']
+    assert twigy.MetricasUsuarios(ruta).anteriores('2')['tweets'] == 21
+
+
+def test_refrescar_guarda_las_metricas_aunque_falle(api, tmp_path):
+    manejador = _manejador({'1': 10, '2': 20, '3': 30})
+    api.manejador = lambda url, parametros: (RespuestaFalsa(400) if url.endswith('users/2/tweets')
+                                             else manejador(url, parametros))
+    ruta = str(tmp_path / 'metricas.bin')
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion):
+            twigy.Requester('token').refrescar(['1', '2', '3'], 'bulk_timeline', twigy.MetricasUsuarios(ruta), [])
+    metricas = twigy.MetricasUsuarios(ruta)
+    assert '1' in metricas and '2' not in metricas and '3' not in metricas
+
+
+def test_un_trabajo_guarda_las_metricas_con_el_estado(api, tmp_path):
+    ruta = str(tmp_path / 'metricas.bin')
+    manejador = _manejador({'1': 10, '2': 20, '3': 30})
+    guardadas = []
+
+    def esperar_metricas(url, parametros):
+        if url.endswith('users/3/tweets'):
+            limite = time.time() + 5
+            while time.time() < limite and not (os.path.exists(ruta) and '2' in twigy.MetricasUsuarios(ruta)):
+                time.sleep(0.01)
+            guardadas.append(len(twigy.MetricasUsuarios(ruta)))
+        return manejador(url, parametros)
+
+    api.manejador = esperar_metricas
+    trabajo = {"id": "t", "endpoint": "timeline", "semillas": ['1', '2', '3'], "tokens": ['token'],
+               "solo_cambios": ruta, "salida": {"directorio": str(tmp_path / 'salida')}}
+    estado = twigy.EstadoTrabajo(str(tmp_path / 'estado'), 't')
+    assert twigy.ejecutar_trabajo(trabajo, estado, intervalo=0.01)
+    assert guardadas == [2]
+    assert len(twigy.MetricasUsuarios(ruta)) == 3
@@ -0,0 +1,51 @@
+import pytest
+
+import twigy
+from conftest import paginas_tweets
+
+
+@pytest.mark.parametrize('profundidad', [0, 2])
+def test_paginador_sigue_los_tokens(api, profundidad):
+    api.manejador = paginas_tweets(4)
+    requester = twigy.Requester('token')
+    paginador = twigy.Paginador(requester, lambda token: requester.timeline('1', pagination_token=token),
+                                profundidad=profundidad)
+    with paginador:
+        tokens = [pagina.token for pagina in paginador]
+    assert tokens == [None, '1', '2', '3']
+    assert paginador.token_reanudar is None
+    assert len(api.peticiones) == 4
+
+
+@pytest.mark.parametrize('profundidad', [0, 2])
+def test_error_lanza_error_peticion_con_el_token_de_la_pagina(api, profundidad):
+    api.manejador = paginas_tweets(5, fallas={2: 400})
+    requester = twigy.Requester('token')
+    requester.set_prefetch(profundidad)
+    tweets = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion) as error:
+            requester.bulk_timeline('1', tweets)
+    assert error.value.status_code == 400
+    assert error.value.pagination_token == '2'
+    assert len(tweets) == 20
+
+
+def test_reanudar_desde_un_token_no_repite_paginas(api):
+    api.manejador = paginas_tweets(4)
+    requester = twigy.Requester('token')
+    tweets = []
+    requester.bulk_timeline('1', tweets, pagination_token='2')
+    assert [tweet['id'] for tweet in tweets][::10] == ['2000', '3000']
+
+
+def test_un_429_despues_de_esperar_lanza_error_peticion(api, monkeypatch):
+    monkeypatch.setattr(twigy.time, 'sleep', lambda segundos: None)
+    api.manejador = paginas_tweets(3, fallas={1: 429})
+    requester = twigy.Requester('token')
+    tweets = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion) as error:
+            requester.bulk_timeline('1', tweets)
+    assert error.value.status_code == 429 and error.value.pagination_token == '1'
+    assert len(api.peticiones) == 3 and len(tweets) == 10
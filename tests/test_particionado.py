@@ -0,0 +1,88 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import twigy
+
+
+def _leer(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return [json.loads(linea) for linea in archivo]
+
+
+def _registros(directorio):
+    registros = {}
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            registros[os.path.relpath(os.path.join(raiz, nombre), directorio)] = _leer(os.path.join(raiz, nombre))
+    return registros
+
+
+def test_sink_particionado_usa_directorios_tipo_hive(tmp_path):
+    directorio = str(tmp_path / 'tweets')
+    sink = twigy.SinkParticionado(directorio, ('dia', 'autor'), cubetas=16)
+    sink.append({"id": '1', "author_id": '42', "created_at": '2021-05-01T10:00:00.000Z'})
+    sink.append({"id": '2', "author_id": '42', "created_at": datetime(2021, 5, 2, tzinfo=timezone.utc)})
+    sink.append({"id": '3', "author_id": None, "fecha_peticion": '2021-05-03T00:00:00+00:00'})
+    sink.append({"id": '4'})
+    sink.close()
+
+    cubeta = twigy.SinkParticionado(directorio, ('autor',), cubetas=16)._valor('autor', {"author_id": '42'})
+    assert len(cubeta) == 2 and 0 <= int(cubeta) < 16
+    parte = 'parte-{}.jsonl'.format(sink.identificador)
+    sin = twigy._sin_particion
+    assert _registros(directorio) == {
+        os.path.join('dia=2021-05-01', 'autor=' + cubeta, parte): [{"id": '1', "author_id": '42',
+                                                                    "created_at": '2021-05-01T10:00:00.000Z'}],
+        os.path.join('dia=2021-05-02', 'autor=' + cubeta, parte): [{"id": '2', "author_id": '42',
+                                                                    "created_at": '2021-05-02T00:00:00+00:00'}],
+        os.path.join('dia=2021-05-03', 'autor=' + sin, parte): [{"id": '3', "author_id": None,
+                                                                 "fecha_peticion": '2021-05-03T00:00:00+00:00'}],
+        os.path.join('dia=' + sin, 'autor=' + sin, parte): [{"id": '4'}],
+    }
+    assert len(sink) == 4
+    assert sink.particiones_escritas() == sorted(os.path.dirname(os.path.join(directorio, ruta))
+                                                 for ruta in _registros(directorio))
+
+
+def test_particion_por_query_es_corta_y_estable(tmp_path):
+    sink = twigy.SinkParticionado(str(tmp_path), ('query',))
+    largo = 'from:alguien (#etiqueta OR "frase larga") ' * 10
+    nombre = os.path.basename(sink.ruta_particion({"query": largo}))
+    assert nombre.startswith('query=from_alguien') and len(nombre) == len('query=') + 40 + 1 + 12
+    assert nombre == os.path.basename(twigy.SinkParticionado(str(tmp_path), ('query',)).ruta_particion({"query": largo}))
+    assert nombre != os.path.basename(sink.ruta_particion({"query": largo + 'x'}))
+
+
+def test_sink_particionado_limita_los_archivos_abiertos(tmp_path):
+    directorio = str(tmp_path / 'tweets')
+    sink = twigy.SinkParticionado(directorio, ('dia',), max_abiertos=2, lote=1)
+    dias = ['2021-05-01', '2021-05-02', '2021-05-01', '2021-05-03', '2021-05-02', '2021-05-01']
+    for k, dia in enumerate(dias):
+        sink.append({"id": str(k), "created_at": dia})
+        assert len(sink._abiertos) <= 2
+    assert [os.path.basename(ruta) for ruta in sink._abiertos] == ['dia=2021-05-02', 'dia=2021-05-01']
+    sink.close()
+
+    parte = 'parte-{}.jsonl'.format(sink.identificador)
+    registros = _registros(directorio)
+    assert [registro['id'] for registro in registros[os.path.join('dia=2021-05-01', parte)]] == ['0', '2', '5']
+    assert [registro['id'] for registro in registros[os.path.join('dia=2021-05-02', parte)]] == ['1', '4']
+    assert [registro['id'] for registro in registros[os.path.join('dia=2021-05-03', parte)]] == ['3']
+
+
+def test_varios_sinks_escriben_en_el_mismo_directorio(tmp_path):
+    directorio = str(tmp_path / 'tweets')
+    sinks = [twigy.SinkParticionado(directorio, ('dia',)) for _ in range(2)]
+    for k, sink in enumerate(sinks):
+        sink.append({"id": str(k), "created_at": '2021-05-01'})
+        sink.close()
+    assert sorted(os.listdir(os.path.join(directorio, 'dia=2021-05-01'))) == sorted(
+        'parte-{}.jsonl'.format(sink.identificador) for sink in sinks)
+
+
+def test_particion_no_soportada():
+    with pytest.raises(Exception):
+        twigy.SinkParticionado('salida', ('mes',))
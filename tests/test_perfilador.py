@@ -0,0 +1,47 @@
+import json
+import os
+import threading
+
+import pytest
+
+import twigy
+from conftest import paginas_tweets
+
+
+def test_perfilador_reparte_el_tiempo_por_endpoint_y_categoria(api):
+    api.manejador = paginas_tweets(3)
+    perfilador = twigy.Perfilador()
+    requester = twigy.Requester('token')
+    requester.set_perfilador(perfilador)
+    requester.bulk_timeline('1', [])
+    assert len(perfilador.totales) == 1
+    totales = next(iter(perfilador.totales.values()))
+    assert set(totales) == set(twigy.Perfilador.categorias)
+    assert totales['red'] > 0 and totales['aplanado'] > 0 and totales['sink'] > 0
+    assert 'Tiempo transcurrido' in perfilador.resumen()
+
+
+def test_guardar_traza_escribe_eventos_de_chrome_trace(api, tmp_path):
+    api.manejador = paginas_tweets(2)
+    perfilador = twigy.Perfilador(traza=True)
+    requester = twigy.Requester('token')
+    requester.set_perfilador(perfilador)
+    requester.bulk_timeline('1', [])
+    perfilador.registrar('sink', 'otro', perfilador.inicio + 1, perfilador.inicio + 1.5)
+    ruta = str(tmp_path / 'traza.json')
+    perfilador.guardar_traza(ruta)
+
+    with open(ruta, encoding='utf-8') as archivo:
+        traza = json.load(archivo)
+    eventos = traza['traceEvents']
+    assert len(eventos) == len(perfilador.eventos)
+    assert {evento['name'] for evento in eventos} >= {'red', 'aplanado', 'sink'}
+    assert all(evento['ph'] == 'X' and evento['pid'] == os.getpid() and evento['tid'] == threading.get_ident()
+               and evento['dur'] >= 0 for evento in eventos)
+    assert eventos[-1]['cat'] == 'otro'
+    assert eventos[-1]['ts'] == pytest.approx(1e6) and eventos[-1]['dur'] == pytest.approx(5e5)
+
+
+def test_guardar_traza_requiere_traza():
+    with pytest.raises(Exception):
+        twigy.Perfilador().guardar_traza('traza.json')
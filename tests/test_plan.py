@@ -0,0 +1,19 @@
+import twigy
+
+
+def test_planear_reparte_semillas_entre_tokens():
+    usuarios = {'1': {'followers': 20500}, '2': {'followers': 3000}, '3': {'protected': True}}
+    plan = twigy.planear('bulk_followers', ['1', '2', '3'], tokens=2, usuarios=usuarios)
+    assert plan.peticiones == 21 + 3 + 1
+    assert plan.por_token == [21, 4]
+    assert plan.semilla_mayor == ('1', 21)
+    assert plan.duracion_minima == 900 + 6 * 0.5
+    assert plan.cap == 0
+
+
+def test_planear_estima_el_cap():
+    usuarios = {'1': {'tweets': 5000}, '2': {'tweets': 150}}
+    plan = twigy.planear('bulk_timeline', ['1', '2'], usuarios=usuarios, cap_restante=3000)
+    assert plan.elementos == 3200 + 150
+    assert plan.peticiones == 32 + 2
+    assert plan.cap == 3350 and plan.excede_cap()
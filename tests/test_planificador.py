@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa, paginas_tweets
+
+
+def test_limite_excedido_conserva_token_y_elementos_faltantes(api):
+    def manejador(url, parametros):
+        if parametros.get('pagination_token') == '1':
+            return RespuestaFalsa(429)
+        return paginas_tweets(3)(url, parametros)
+
+    api.manejador = manejador
+    requester = twigy.Requester('token')
+    requester.ceder_limites = True
+    tweets = []
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.LimiteExcedido) as error:
+            requester.bulk_timeline('1', tweets, max_tweets=25)
+    assert error.value.pagination_token == '1'
+    assert error.value.max_elementos == 15
+    assert len(tweets) == 10
+
+
+def _manejador_con_429(paginas):
+    cedidas = []
+
+    def manejador(url, parametros):
+        if parametros.get('pagination_token') == '1' and len(cedidas) == 0:
+            cedidas.append(parametros)
+            return RespuestaFalsa(429, headers={"x-rate-limit-limit": "1500", "x-rate-limit-remaining": "0",
+                                                "x-rate-limit-reset": str(int(time.time()) + 1)})
+        return paginas(url, parametros)
+
+    return manejador
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_planificador_reanuda_la_tarea_con_los_tweets_faltantes(api):
+    api.manejador = _manejador_con_429(paginas_tweets(5))
+    planificador = twigy.Planificador(twigy.Requester('token'), hilos_por_token=1)
+    tweets = []
+    tarea = planificador.agregar('bulk_timeline', '1', tweets, 25, presupuesto=1000)
+    planificador.ejecutar()
+    assert tarea.estado == 'terminada' and tarea.cesiones == 1
+    assert tarea.kwargs['max_tweets'] == 15
+    assert tarea.kwargs['pagination_token'] == '1'
+    assert tarea.kwargs['presupuesto'].consumidos == 30
+    assert len(tweets) == 30
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_planificador_reanuda_argumentos_posicionales(api):
+    api.manejador = _manejador_con_429(paginas_tweets(3))
+    planificador = twigy.Planificador(twigy.Requester('token'), hilos_por_token=1)
+    tweets = []
+    tarea = planificador.agregar('bulk_timeline', '1', tweets, None, None)
+    assert tarea.args == () and tarea.kwargs['lista_tweets'] is tweets
+    planificador.ejecutar()
+    assert tarea.estado == 'terminada'
+    assert len(tweets) == 30
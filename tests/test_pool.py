@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import twigy
+from conftest import paginas_tweets
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with ProcessPoolExecutor(2) as procesos:
+        yield procesos
+
+
+def _recolectar(requester, **opciones):
+    tweets = []
+    avances = []
+    requester.bulk_timeline('1', tweets, avance=lambda token: avances.append((token, len(tweets))), **opciones)
+    for tweet in tweets:
+        del tweet['fecha_peticion']
+    return tweets, avances
+
+
+def test_el_pool_entrega_los_mismos_registros_en_orden(api, pool):
+    api.manejador = paginas_tweets(6)
+    secuencial = _recolectar(twigy.Requester('token'))
+    requester = twigy.Requester('token')
+    requester.set_procesos(pool, trabajadores=2)
+    assert requester.trabajadores == 2 and requester.clonar().trabajadores == 2
+    assert _recolectar(requester) == secuencial
+    assert secuencial[1][-1] == (None, 60)
+
+
+def test_el_pool_aplica_filtro_y_vistos(api, pool):
+    api.manejador = paginas_tweets(3)
+    requester = twigy.Requester('token')
+    requester.set_procesos(pool, trabajadores=2)
+    vistos = {'0', '1000'}
+    tweets, avances = _recolectar(requester, vistos=vistos,
+                                  filtro=twigy.FiltroAutores(['1']))
+    ids = [tweet['id'] for tweet in tweets]
+    assert len(ids) == 28 and '0' not in ids and '1000' not in ids and ids == sorted(ids, key=int)
+    assert '2009' in vistos
+
+
+def test_etapa_limita_las_paginas_pendientes(api, pool):
+    api.manejador = paginas_tweets(5)
+    requester = twigy.Requester('token')
+    tweets = []
+    etapa = twigy.EtapaAplanado(pool, 'tweets', tweets, pendientes=2)
+    with twigy.Paginador(requester, lambda token: requester.timeline('1', pagination_token=token)) as paginador:
+        for pagina in paginador:
+            etapa.agregar(pagina)
+            assert len(etapa._futuros) <= 2
+    etapa.terminar()
+    assert [tweet['id'] for tweet in tweets][::10] == ['0', '1000', '2000', '3000', '4000']
@@ -0,0 +1,136 @@
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+# user_id: (protegido, ids que sigue)
+red = {
+    '1': (False, ['2', '3', '4']),
+    '2': (False, ['5']),
+    '3': (True, ['1']),
+    '4': (False, ['1', '6', '7']),
+    '5': (False, []),
+    '6': (False, ['1']),
+    '7': (False, []),
+}
+
+
+def _usuario(user_id):
+    protegido, seguidos = red[user_id]
+    return {"id": user_id, "protected": protegido,
+            "public_metrics": {"followers_count": 0, "following_count": len(seguidos)}}
+
+
+def manejador_red(url, parametros):
+    user_id = url.split('/')[-2]
+    token = parametros.get('pagination_token')
+    n = int(token) if token is not None else 0
+    seguidos = red[user_id][1]
+    meta = {"result_count": 2}
+    if n + 2 < len(seguidos):
+        meta['next_token'] = str(n + 2)
+    return RespuestaFalsa(200, {"data": [_usuario(x) for x in seguidos[n:n + 2]], "meta": meta})
+
+
+def _aristas(grafo):
+    return {(origen, destino) for origen in range(1, 8) for destino in grafo.seguidos(origen)}
+
+
+def test_rastreador_expande_hasta_la_profundidad_y_poda(api, tmp_path):
+    api.manejador = manejador_red
+    grafo = twigy.GrafoSeguidores(str(tmp_path / 'red.csr'))
+    aristas = []
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2, aristas=aristas)
+    resumen = rastreador.rastrear(['1'])
+    assert resumen['completados'] == 3 and resumen['podados'] == 1
+    assert _aristas(grafo) == {(1, 2), (1, 3), (1, 4), (2, 5), (4, 1), (4, 6), (4, 7)}
+    assert len(aristas) == 7
+    grafo.cerrar()
+
+
+def test_rastreador_reanuda_la_frontera(api, tmp_path):
+    api.manejador = manejador_red
+    ruta = str(tmp_path / 'red.csr')
+    estado = str(tmp_path / 'rastreo')
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2, ruta_estado=estado, max_nodos=1)
+    assert rastreador.rastrear(['1'])['frontera'] == 2
+    grafo.cerrar()
+
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2, ruta_estado=estado)
+    assert rastreador.rastrear()['completados'] == 3
+    assert _aristas(grafo) == {(1, 2), (1, 3), (1, 4), (2, 5), (4, 1), (4, 6), (4, 7)}
+    assert len([url for url, parametros in api.peticiones if url.endswith('users/1/following')]) == 2
+    grafo.cerrar()
+
+
+def test_rastreador_guarda_el_token_de_los_nodos_en_curso(api, tmp_path):
+    api.manejador = manejador_red
+    ruta = str(tmp_path / 'red.csr')
+    estado = str(tmp_path / 'rastreo')
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=1, ruta_estado=estado)
+    rastreador.agregar_semillas(['4'])
+    nodo = rastreador._tomar(rastreador._requesters[0], 'users/{}/following')
+    colector = twigy._ColectorVecinos(rastreador, nodo)
+    for user_id in red['4'][1][:2]:
+        colector.append(twigy.process_user(_usuario(user_id)))
+    colector.avanzar('2')
+    rastreador.guardar()
+    grafo.cerrar()
+
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=1, ruta_estado=estado)
+    assert [(user_id, token) for clave, orden, user_id, salto, token in rastreador.frontera] == [('4', '2')]
+    rastreador.rastrear()
+    assert [parametros.get('pagination_token') for url, parametros in api.peticiones] == ['2']
+    assert list(grafo.seguidos(4)) == [1, 6, 7]
+    grafo.cerrar()
+
+
+def _con_fallas(user_id, fallas, status_code):
+    """Manejador de la red que responde status_code a las primeras fallas
+    peticiones de los vecinos de user_id."""
+
+    restantes = [fallas]
+
+    def manejador(url, parametros):
+        if url.endswith('users/{}/following'.format(user_id)) and restantes[0] > 0:
+            restantes[0] = restantes[0] - 1
+            return RespuestaFalsa(status_code)
+        return manejador_red(url, parametros)
+
+    return manejador
+
+
+def test_un_error_5xx_regresa_el_nodo_a_la_frontera(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(twigy.time, 'sleep', lambda segundos: None)
+    api.manejador = _con_fallas('4', 10, 503)
+    grafo = twigy.GrafoSeguidores(str(tmp_path / 'red.csr'))
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2)
+    with pytest.warns(UserWarning):
+        resumen = rastreador.rastrear(['1'])
+    assert resumen['errores'] == 0 and resumen['completados'] == 3
+    assert _aristas(grafo) == {(1, 2), (1, 3), (1, 4), (2, 5), (4, 1), (4, 6), (4, 7)}
+    grafo.cerrar()
+
+
+def test_los_nodos_con_error_se_reintentan_al_reanudar(api, tmp_path):
+    api.manejador = _con_fallas('2', 1, 404)
+    ruta = str(tmp_path / 'red.csr')
+    estado = str(tmp_path / 'rastreo')
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2, ruta_estado=estado)
+    with pytest.warns(UserWarning):
+        assert rastreador.rastrear(['1'])['errores'] == 1
+    assert list(rastreador.errores) == ['2']
+    grafo.cerrar()
+
+    grafo = twigy.GrafoSeguidores(ruta)
+    rastreador = twigy.Rastreador(twigy.Requester('token'), grafo, profundidad=2, ruta_estado=estado)
+    assert [user_id for clave, orden, user_id, salto, token in rastreador.frontera] == ['2']
+    resumen = rastreador.rastrear()
+    assert resumen['errores'] == 0 and resumen['completados'] == 3
+    assert list(grafo.seguidos(2)) == [5]
+    grafo.cerrar()
@@ -0,0 +1,61 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import twigy
+from conftest import paginas_tweets
+
+ahora = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+
+def _tweet(tweet_id, fecha, **valores):
+    tweet = {"id": tweet_id, "text": 't', "author_id": '1', "fecha_peticion": fecha}
+    tweet.update(valores)
+    return tweet
+
+
+def _filas(ruta, consulta):
+    conexion = sqlite3.connect(ruta)
+    try:
+        return conexion.execute(consulta).fetchall()
+    finally:
+        conexion.close()
+
+
+def test_sink_base_datos_hace_upsert_por_id(tmp_path):
+    ruta = str(tmp_path / 'twigy.sqlite')
+    base = twigy.SinkBaseDatos(ruta)
+    tweets = base.tabla('tweets')
+    tweets.append(_tweet('1', ahora, like_count=3, lang='es'))
+    tweets.append(_tweet('2', ahora, like_count=1))
+    tweets.fin_pagina()
+    tweets.append(_tweet('1', ahora + timedelta(hours=1), like_count=5))
+    base.close()
+    assert _filas(ruta, 'SELECT id, like_count, lang, fecha_peticion FROM tweets ORDER BY id') == [
+        ('1', 5, 'es', (ahora + timedelta(hours=1)).isoformat()), ('2', 1, None, ahora.isoformat())]
+    assert len(tweets) == 3
+
+
+def test_sink_base_datos_no_sobrescribe_con_registros_viejos(tmp_path):
+    ruta = str(tmp_path / 'twigy.sqlite')
+    base = twigy.SinkBaseDatos(ruta)
+    tweets = base.tabla('tweets')
+    tweets.append(_tweet('1', ahora, like_count=5))
+    tweets.fin_pagina()
+    tweets.append(_tweet('1', ahora - timedelta(hours=1), like_count=3, lang='es'))
+    tweets.append(_tweet('1', ahora, like_count=6))
+    base.close()
+    assert _filas(ruta, 'SELECT like_count, lang, fecha_peticion FROM tweets') == [(6, None, ahora.isoformat())]
+
+
+def test_sink_base_datos_escribe_por_lote_y_recoleccion_repetida(api, tmp_path):
+    api.manejador = paginas_tweets(3)
+    ruta = str(tmp_path / 'twigy.sqlite')
+    base = twigy.SinkBaseDatos(ruta, lote=7)
+    requester = twigy.Requester('token')
+    escritos = []
+    requester.bulk_timeline('1', base.tabla('tweets'),
+                            avance=lambda token: escritos.append(_filas(ruta, 'SELECT COUNT(*) FROM tweets')[0][0]))
+    assert escritos == [10, 20, 30]
+    requester.bulk_timeline('1', base.tabla('tweets'))
+    base.close()
+    assert _filas(ruta, 'SELECT COUNT(*), COUNT(DISTINCT id) FROM tweets') == [(30, 30)]
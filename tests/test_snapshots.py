@@ -0,0 +1,14 @@
+from datetime import datetime, timedelta, timezone
+
+import twigy
+
+
+def test_snapshots_en_utc(tmp_path):
+    snapshots = twigy.SnapshotsSeguidores(str(tmp_path))
+    fecha = datetime(2024, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=-6)))
+    assert snapshots.guardar('1', ['5', 3, 5, 1], fecha) == datetime(2024, 1, 1, 18, 0, tzinfo=timezone.utc)
+    assert snapshots.listar('1') == [datetime(2024, 1, 1, 18, 0, tzinfo=timezone.utc)]
+    assert list(snapshots.cargar('1', fecha)) == [1, 3, 5]
+    snapshots.guardar('1', [1, 4], datetime(2024, 1, 2, tzinfo=timezone.utc))
+    ganados, perdidos = twigy.diferencia_ids(snapshots.cargar('1', fecha), snapshots.cargar('1'))
+    assert list(ganados) == [4] and list(perdidos) == [3, 5]
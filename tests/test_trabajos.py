@@ -0,0 +1,37 @@
+import time
+
+import twigy
+from conftest import paginas_tweets
+
+
+def test_avance_recibe_el_token_despues_de_escribir_cada_pagina(api):
+    api.manejador = paginas_tweets(3)
+    requester = twigy.Requester('token')
+    requester.set_prefetch(2)
+    tweets = []
+    avances = []
+    requester.bulk_timeline('1', tweets, avance=lambda token: avances.append((token, len(tweets))))
+    assert avances == [('1', 10), ('2', 20), (None, 30)]
+
+
+def test_estado_trabajo_guarda_cursores(tmp_path):
+    estado = twigy.EstadoTrabajo(str(tmp_path), 'trabajo')
+    estado.avanzar('1', '3')
+    estado.avanzar('2', '7')
+    estado.completar('2')
+    estado.guardar()
+
+    cargado = twigy.EstadoTrabajo(str(tmp_path), 'trabajo')
+    assert cargado.pendiente('1') and not cargado.pendiente('2')
+    assert cargado.cursor('1') == '3' and cargado.cursor('2') is None
+
+
+def test_el_trabajo_termina_sin_esperar_el_intervalo(api, tmp_path, capsys):
+    api.manejador = paginas_tweets(2)
+    trabajo = {"id": "t", "endpoint": "timeline", "semillas": ['1', '2'], "tokens": ['token'],
+               "salida": {"directorio": str(tmp_path / 'salida')}}
+    estado = twigy.EstadoTrabajo(str(tmp_path / 'estado'), 't')
+    inicio = time.time()
+    assert twigy.ejecutar_trabajo(trabajo, estado, intervalo=30)
+    assert time.time() - inicio < 10
+    assert estado.datos['completadas'] == ['1', '2']
@@ -0,0 +1,36 @@
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+
+def test_validar_ids_acepta_cadenas_y_enteros():
+    entrada = ['123', 45, '0012', 'abc', '', '1' * 20, 10 ** 19, -1, True, 3.5, '١٢٣', '123']
+    validos, reporte = twigy.validar_ids(iter(entrada), unicos=True, muestra=3)
+    assert validos == ['123', '45', '0012']
+    assert reporte.total == len(entrada) and reporte.validos == 3
+    assert reporte.duplicados == 1
+    assert reporte.motivos == {'patron': 6, 'tipo': 2}
+    assert reporte.ejemplos == [(3, 'abc'), (4, ''), (5, '1' * 20)]
+
+
+def test_validar_ids_acepta_enteros_de_numpy():
+    np = pytest.importorskip('numpy')
+    validos, reporte = twigy.validar_ids(np.array([7, 2 ** 62], dtype=np.int64))
+    assert validos == ['7', str(2 ** 62)] and reporte.rechazados == 0
+
+
+def test_validar_unames_descarta_repetidos_sin_distinguir_mayusculas():
+    validos, reporte = twigy.validar_unames(['Twitter', 'twitter', '_a_', 'con espacio', 'x' * 16, 5], unicos=True)
+    assert validos == ['Twitter', '_a_']
+    assert reporte.duplicados == 1 and reporte.motivos == {'patron': 2, 'tipo': 1}
+
+
+def test_bulk_users_emite_un_solo_warning_con_los_rechazados(api):
+    api.manejador = lambda url, parametros: RespuestaFalsa(200, {"data": [
+        {"id": x} for x in parametros['ids'].split(',')]})
+    usuarios = []
+    with pytest.warns(UserWarning) as avisos:
+        twigy.Requester('token').bulk_users([str(x) for x in range(1, 151)] + ['x', 'y'], usuarios)
+    assert len(avisos) == 1 and '2 de 152' in str(avisos[0].message)
+    assert len(usuarios) == 150 and len(api.peticiones) == 2
@@ -0,0 +1,99 @@
+import pytest
+
+import twigy
+from conftest import RespuestaFalsa
+
+
+def _buscador(feed, fallas=None):
+    """Manejador de recent_search sobre feed, un dict de query a la lista de
+    ids de sus tweets. Responde páginas de 10 tweets, del más reciente al más
+    viejo, con los ids mayores a since_id. fallas es un conjunto de tokens que
+    responden con error."""
+
+    def manejador(url, parametros):
+        assert url.endswith('tweets/search/recent')
+        token = parametros.get('next_token')
+        if fallas is not None and token in fallas:
+            return RespuestaFalsa(400)
+        since_id = int(parametros.get('since_id') or -1)
+        ids = sorted((x for x in feed[parametros['query']] if x > since_id), reverse=True)
+        n = int(token or 0)
+        meta = {"result_count": len(ids[n:n + 10])}
+        if len(ids) > 0:
+            meta['newest_id'] = str(ids[n])
+        if n + 10 < len(ids):
+            meta['next_token'] = str(n + 10)
+        datos = [{"id": str(x), "text": 't', "author_id": '1'} for x in ids[n:n + 10]]
+        return RespuestaFalsa(200, {"data": datos, "meta": meta} if datos else {"meta": meta})
+
+    return manejador
+
+
+def _vigilante(queries, tweets, **opciones):
+    return twigy.Vigilante(twigy.Requester('token'), queries, tweets, ventana=0, **opciones)
+
+
+def test_vigilante_pide_solo_lo_nuevo_desde_el_since_id(api, tmp_path):
+    feed = {'a': list(range(25))}
+    api.manejador = _buscador(feed)
+    ruta = str(tmp_path / 'vigilante.json')
+    tweets = []
+    vigilante = _vigilante(['a'], tweets, ruta_estado=ruta)
+    assert vigilante.consultar('a') == 10
+    assert vigilante.estados['a']['since_id'] == '24'
+    assert [tweet['query'] for tweet in tweets] == ['a'] * 10
+
+    feed['a'].extend(range(25, 48))
+    api.peticiones.clear()
+    vigilante = _vigilante(['a'], tweets, ruta_estado=ruta)
+    assert vigilante.estados['a']['since_id'] == '24'
+    assert vigilante.consultar('a') == 23
+    assert [parametros['since_id'] for url, parametros in api.peticiones] == ['24'] * 3
+    assert sorted(int(tweet['id']) for tweet in tweets[10:]) == list(range(25, 48))
+    assert vigilante.estados['a']['since_id'] == '47'
+
+
+def test_el_since_id_no_avanza_si_la_paginacion_falla(api):
+    feed = {'a': list(range(5))}
+    api.manejador = _buscador(feed, fallas={'10'})
+    vigilante = _vigilante(['a'], [])
+    vigilante.consultar('a')
+    feed['a'].extend(range(5, 30))
+    with pytest.warns(UserWarning):
+        with pytest.raises(twigy.ErrorPeticion):
+            vigilante.consultar('a')
+    assert vigilante.estados['a']['since_id'] == '4'
+
+
+def test_el_intervalo_se_adapta_a_la_tasa_de_cada_query(api, monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(twigy.time, 'time', lambda: reloj[0])
+    feed = {'activo': [0], 'inactivo': [0]}
+    api.manejador = _buscador(feed)
+    vigilante = _vigilante(['activo', 'inactivo'], [], objetivo=20, intervalo_min=30, intervalo_max=3600)
+    vigilante.consultar('activo')
+    vigilante.consultar('inactivo')
+    assert vigilante.resumen()['activo']['intervalo'] == 30
+
+    reloj[0] = 1100.0
+    feed['activo'].extend(range(1, 11))
+    vigilante.consultar('activo')
+    vigilante.consultar('inactivo')
+    resumen = vigilante.resumen()
+    assert resumen['activo']['tweets_por_minuto'] == pytest.approx(6)
+    assert resumen['activo']['intervalo'] == pytest.approx(200)
+    assert resumen['inactivo']['intervalo'] == 3600
+
+    reloj[0] = 1300.0
+    feed['activo'].extend(range(11, 211))
+    vigilante.consultar('activo')
+    assert vigilante.estados['activo']['tasa'] == pytest.approx(0.3 * 1 + 0.7 * 0.1)
+    assert vigilante.resumen()['activo']['intervalo'] == pytest.approx(20 / 0.37)
+
+
+def test_vigilar_consulta_los_queries_por_turnos(api):
+    feed = {'a': [0], 'b': [0]}
+    api.manejador = _buscador(feed)
+    vigilante = _vigilante(['a', 'b'], [], intervalo_min=0, intervalo_max=0)
+    vigilante.vigilar(max_peticiones=4)
+    assert [parametros['query'] for url, parametros in api.peticiones] == ['a', 'b', 'a', 'b']
@@ -1,11 +1,48 @@
-import requests
 import re
+import sys
+import operator
 import warnings
 import time
+import os
+import mmap
+import struct
+import zlib
+import json
+import threading
+import queue
+import heapq
+import math
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections import deque, OrderedDict
 from datetime import datetime, timezone
 
 api_url = 'https://api.twitter.com/2/'
 
+patron_id = re.compile("^[0-9]{1,19}$")
+patron_uname = re.compile("^[A-Za-z0-9_]{1,15}$")
+
+extras_opcionales = ('orjson', 'pyarrow', 'pandas', 'numpy', 'aiohttp', 'duckdb')
+_extras_detectados = {}
+
+def extras_disponibles(nombres=extras_opcionales):
+    """Regresa un dict que indica cuáles de las dependencias opcionales están instaladas.
+    La detección se hace con importlib.util.find_spec, por lo que los módulos no se
+    importan. El resultado se guarda para no repetir la búsqueda en cada llamada.
+
+    Las dependencias pesadas de twigy, incluyendo requests, se importan
+    hasta que se usan por primera vez."""
+
+    from importlib.util import find_spec
+
+    disponibles = {}
+    for nombre in nombres:
+        if nombre not in _extras_detectados:
+            _extras_detectados[nombre] = find_spec(nombre) is not None
+        disponibles[nombre] = _extras_detectados[nombre]
+    return disponibles
+
 class Requester():
     """Clase para un objeto que haga peticiones a la API de twitter."""
 
@@ -36,6 +73,22 @@ class Requester():
             "meta": None,
         }
 
+        self.limites = {}
+
+        self.libro_cap = None
+
+        self.ceder_limites = False
+
+        self.prefetch = 0
+
+        self.procesos = None
+
+        self.trabajadores = None
+
+        self.perfilador = None
+
+        self.cobertura = None
+
         self.default_parameters = {
             "expansions": ['attachments.poll_ids',
                         'attachments.media_keys',
@@ -107,13 +160,124 @@ class Requester():
         self.token = token
         self.header = {"Authorization": "Bearer {}".format(self.token)}
 
+    def set_prefetch(self, profundidad):
+        """Permite establecer cuántas páginas pueden pedirse por adelantado en las
+        funciones bulk mientras se procesa la página actual. Con 0 las páginas se
+        piden secuencialmente, sin hilos adicionales."""
+        self.prefetch = profundidad
+
+    def set_procesos(self, procesos, trabajadores=None):
+        """Permite establecer un pool de procesos en el que las funciones bulk
+        decodifican y aplanan las páginas con process_tweet y process_user, en lugar
+        de hacerlo en el proceso principal. procesos puede ser el número de procesos
+        del pool, un concurrent.futures.ProcessPoolExecutor ya creado o None para
+        aplanar en el proceso principal. Si se pasa un número, el pool debe cerrarse
+        con cerrar_procesos.
+
+        trabajadores es el número de procesos de un pool ya creado y determina
+        cuántas páginas se envían al pool por adelantado. Si no se indica se usa
+        el número de CPUs, que es el default de ProcessPoolExecutor."""
+
+        if isinstance(procesos, int):
+            from concurrent.futures import ProcessPoolExecutor
+            trabajadores = procesos
+            procesos = ProcessPoolExecutor(procesos)
+        elif procesos is not None and trabajadores is None:
+            trabajadores = os.cpu_count() or 1
+        self.procesos = procesos
+        self.trabajadores = trabajadores if procesos is not None else None
+
+    def cerrar_procesos(self):
+        """Cierra el pool de procesos del Requester, si es que tiene uno."""
+
+        if self.procesos is not None:
+            self.procesos.shutdown()
+            self.procesos = None
+            self.trabajadores = None
+
+    def set_perfilador(self, perfilador):
+        """Permite establecer un Perfilador que mide en qué se va el tiempo de las
+        peticiones y de las funciones bulk. Con None se deja de medir."""
+        self.perfilador = perfilador
+
+    def set_cobertura(self, cobertura):
+        """Permite establecer una Cobertura para las peticiones a user_by_uname,
+        users y tweets: si una petición tarda más que el percentil indicado de las
+        latencias observadas, se envía un duplicado y se usa la primera respuesta.
+        Las funciones bulk no se cubren. Con None se desactiva."""
+        self.cobertura = cobertura
+
+    def set_libro_cap(self, libro_cap):
+        """Permite establecer el LibroCap en el que se registran los tweets
+        obtenidos por los endpoints que consumen el cap del proyecto."""
+        self.libro_cap = libro_cap
+
+    def hay_cap(self, presupuesto=None, pagina=100):
+        """Indica si es posible hacer una petición más que consuma el cap.
+        Es falso si el presupuesto o el cap restante en el LibroCap son menores
+        al tamaño de una página de tweets. Si es verdadero, el tamaño de la página
+        queda reservado en el presupuesto hasta que se libere con su método liberar."""
+
+        if self.libro_cap is not None:
+            restante = self.libro_cap.restante()
+            if restante < pagina:
+                print("Cap mensual agotado, quedan {} tweets.".format(restante))
+                return False
+        if presupuesto is not None and not presupuesto.reservar(pagina):
+            print("Presupuesto agotado, {} tweets consumidos.".format(presupuesto.consumidos))
+            return False
+        return True
+
+    def clonar(self):
+        """Crea un nuevo Requester con el mismo token que comparte con este
+        el estado de las ventanas de rate limit y el LibroCap, pero que tiene
+        su propio last_petition. Sirve para usar un mismo token desde varios hilos."""
+
+        clon = Requester(self.token)
+        clon.default_parameters = self.default_parameters
+        clon.limites = self.limites
+        clon.libro_cap = self.libro_cap
+        clon.ceder_limites = self.ceder_limites
+        clon.prefetch = self.prefetch
+        clon.procesos = self.procesos
+        clon.trabajadores = self.trabajadores
+        clon.perfilador = self.perfilador
+        clon.cobertura = self.cobertura
+        return clon
+
+    def esperar_limite(self, peticiones, pagination_token=None, presupuesto=None):
+        """Se ejecuta cuando una petición de las funciones bulk recibe un status code 429.
+        Por default imprime el número de peticiones realizadas y descansa 900 segundos.
+
+        Si la propiedad ceder_limites es True, en lugar de esperar se lanza una excepción
+        LimiteExcedido con el endpoint, el momento en que se reinicia su ventana y el
+        token de paginación con el que se puede reanudar. Esto permite a un Planificador
+        usar el tiempo de espera en peticiones a otros endpoints. Antes de lanzar
+        la excepción se libera la página reservada en el presupuesto de la función."""
+
+        endpoint = nombre_endpoint(self.last_petition['url'])
+        if self.ceder_limites:
+            if presupuesto is not None:
+                presupuesto.liberar(100)
+            limite = self.limites.get(endpoint)
+            reinicio = time.time() + 900
+            if limite is not None and limite['reinicio'] > time.time():
+                reinicio = limite['reinicio']
+            raise LimiteExcedido(endpoint, reinicio, pagination_token)
+
+        print("Esperando, {} realizadas.".format(peticiones))
+        with medir(self.perfilador, 'espera', endpoint):
+            time.sleep(900)
+
     def construct_params(self, param_dict):
         """Procesa la lista de parámetros para las peticiones.
         Si un parámetro en el diccionario de entrada es None, 
         el valor se busca en los valores por default de los parametros.
         Estos valores por default están definidos en la instancia del objeto.
         Si el parámetro en el diccionario de entrada es None y no hay un valor por default
-        el parámetro no se agrega al conjunto de parámetros para la petición."""
+        el parámetro no se agrega al conjunto de parámetros para la petición.
+        Si el parámetro es una lista vacía tampoco se agrega, de esta forma es posible
+        omitir un parámetro que tiene valor por default."""
 
         parametros = {}
 
@@ -123,7 +287,8 @@ class Requester():
                     parametros[key] = ','.join(self.default_parameters[key])
             else:
                 if type(value) is list:
-                    parametros[key] = ','.join(value)
+                    if len(value) > 0:
+                        parametros[key] = ','.join(value)
                 else:
                     parametros[key] = value
 
@@ -159,10 +324,14 @@ class Requester():
     def user_by_uname(self, username, 
                       expansions = ['pinned_tweet_id'], 
                       tweet_fields = None, 
-                      user_fields = None):
+                      user_fields = None,
+                      cubrir = True):
         """Realiza una petición a la API de twitter.
         La petición tiene como objetivo obtener la información del usuario identificado con username
         
+        Si el Requester tiene una Cobertura y cubrir es True, la petición se
+        duplica cuando tarda más de lo usual, ver set_cobertura.
+
         Rate limit: 300 requests per 15-minute window (app auth)
         """
 
@@ -179,18 +348,22 @@ class Requester():
         }
         parametros = self.construct_params(pre_params)
 
-        respuesta = self.peticion(url, header, parametros)
+        respuesta = self.peticion_cubierta(url, header, parametros, cubrir)
 
         return respuesta
 
     def users(self, ids, 
               expansions = ['pinned_tweet_id'], 
               tweet_fields = None, 
-              user_fields = None):
+              user_fields = None,
+              cubrir = True):
         """Realiza una petición a la API de twitter.
         La petición tiene como objetivo obtener la información de máximo 100 usuarios
         identificados con los user_ids en la lista ids
         
+        Si el Requester tiene una Cobertura y cubrir es True, la petición se
+        duplica cuando tarda más de lo usual, ver set_cobertura.
+
         Rate limit: 300 requests per 15-minute window (app auth)
         """
 
@@ -208,7 +381,7 @@ class Requester():
         }
         parametros = self.construct_params(pre_params)
 
-        respuesta = self.peticion(url, header, parametros)
+        respuesta = self.peticion_cubierta(url, header, parametros, cubrir)
 
         return respuesta
 
@@ -281,11 +454,15 @@ class Requester():
               user_fields = None, 
               poll_fields = None,
               place_fields = None,
-              media_fields = None):
+              media_fields = None,
+              cubrir = True):
         """Realiza una petición a la API de twitter.
         La petición tiene como objetivo obtener la información de máximo 100 tweets
         identificados con los tweet_ids en la lista
         
+        Si el Requester tiene una Cobertura y cubrir es True, la petición se
+        duplica cuando tarda más de lo usual, ver set_cobertura.
+
         Rate limit: 300 requests per 15-minute window (app auth)
         """
 
@@ -306,7 +483,7 @@ class Requester():
         }
         parametros = self.construct_params(pre_params)
 
-        respuesta = self.peticion(url, header, parametros)
+        respuesta = self.peticion_cubierta(url, header, parametros, cubrir)
 
         return respuesta
 
@@ -614,7 +791,10 @@ class Requester():
 
 
     def bulk_followers(self, user_id, lista_usuarios, pagination_token = None, 
-                        lista_tweets = None):
+                        lista_tweets = None, grafo = None, lista_ids = None,
+                        filtro = None,
+                        vistos = None,
+                        avance = None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los followers de la cuenta
         identificada con user_id.
@@ -622,16 +802,21 @@ class Requester():
         Este endpoint es lento, admite 15 peticiones cada 15 minutos, cada petición
         puede obtener hasta 1,000 usuarios. Este tipo de petición no tiene cap.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
         La función no tiene regreso, los datos obtenidos se agregan a 
         lista_ususarios como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_usuarios
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. En este caso
@@ -640,38 +825,56 @@ class Requester():
         opcionales de acuerdo al tipo de información que se quiera almacenar:
 
         tweets - lista_tweets
+
+        Para redes grandes es posible recolectar únicamente las aristas pasando
+        un GrafoSeguidores en el parámetro grafo. En este modo lista_usuarios
+        puede ser None, los usuarios no se procesan con process_user y las
+        peticiones solicitan únicamente el campo id de cada usuario, salvo que se
+        pase un filtro, en cuyo caso se solicitan los campos por default para que
+        el filtro pueda evaluarse. De la misma forma es posible pasar en lista_ids
+        una lista o un array donde se agregan los ids de los usuarios como enteros.
+
+        El parámetro filtro permite conservar únicamente algunos usuarios. Es una
+        función que recibe cada usuario tal como lo regresa la API y regresa True si
+        debe conservarse, por ejemplo FiltroMetricas(followers_count=1000). Se evalúa
+        antes de aplanar el usuario con process_user y de agregarlo a las listas.
+
+        El parámetro vistos permite descartar usuarios ya recolectados. Es un
+        ConjuntoIds, un ConjuntoBloom o un set; los usuarios cuyo id ya está en
+        vistos no se agregan a lista_usuarios y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
         """
 
-        flag = 0
-        my_date = None
-        peticiones = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.followers(user_id, pagination_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.followers(user_id, pagination_token=pagination_token)
-                my_date = datetime.now(timezone.utc)
-                peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    users_to_list(datos, lista_usuarios, my_date)
-                if lista_tweets is not None and includes is not None:
-                    tweets = includes['tweets']
-                    if tweets is not None:
-                        tweets_to_list(tweets, lista_tweets, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
+        extra = {}
+        if lista_usuarios is None and lista_tweets is None:
+            extra = {"expansions": [], "tweet_fields": []}
+            if filtro is None:
+                extra["user_fields"] = ['id']
+
+        paginador = Paginador(self, lambda token: self.followers(user_id, pagination_token=token, **extra),
+                              pagination_token, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'users', lista_usuarios, lista_tweets=lista_tweets,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores)
+        with paginador, etapa:
+            for pagina in paginador:
+                if lista_ids is not None or grafo is not None:
+                    datos = pagina.datos or []
+                    if lista_ids is not None:
+                        lista_ids.extend(int(usuario['id']) for usuario in datos)
+                    if grafo is not None:
+                        grafo.agregar_seguidores(user_id, [usuario['id'] for usuario in datos])
+                etapa.agregar(pagina)
 
 
     def bulk_following(self, user_id, lista_usuarios, pagination_token = None,
-                        lista_tweets = None):
+                        lista_tweets = None, grafo = None, lista_ids = None,
+                        filtro = None,
+                        vistos = None,
+                        avance = None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los followings de la cuenta
         identificada con user_id.
@@ -679,16 +882,21 @@ class Requester():
         Este endpoint es lento, admite 15 peticiones cada 15 minutos, cada petición
         puede obtener hasta 1,000 usuarios. Este tipo de petición no tiene cap.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
         La función no tiene regreso, los datos obtenidos se agregan a 
         lista_ususarios como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_usuarios
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. En este caso
@@ -697,40 +905,250 @@ class Requester():
         opcionales de acuerdo al tipo de información que se quiera almacenar:
 
         tweets - lista_tweets
+
+        Para redes grandes es posible recolectar únicamente las aristas pasando
+        un GrafoSeguidores en el parámetro grafo. En este modo lista_usuarios
+        puede ser None, los usuarios no se procesan con process_user y las
+        peticiones solicitan únicamente el campo id de cada usuario, salvo que se
+        pase un filtro, en cuyo caso se solicitan los campos por default para que
+        el filtro pueda evaluarse. De la misma forma es posible pasar en lista_ids
+        una lista o un array donde se agregan los ids de los usuarios como enteros.
+
+        El parámetro filtro permite conservar únicamente algunos usuarios. Es una
+        función que recibe cada usuario tal como lo regresa la API y regresa True si
+        debe conservarse, por ejemplo FiltroMetricas(followers_count=1000). Se evalúa
+        antes de aplanar el usuario con process_user y de agregarlo a las listas.
+
+        El parámetro vistos permite descartar usuarios ya recolectados. Es un
+        ConjuntoIds, un ConjuntoBloom o un set; los usuarios cuyo id ya está en
+        vistos no se agregan a lista_usuarios y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
+        """
+
+        extra = {}
+        if lista_usuarios is None and lista_tweets is None:
+            extra = {"expansions": [], "tweet_fields": []}
+            if filtro is None:
+                extra["user_fields"] = ['id']
+
+        paginador = Paginador(self, lambda token: self.following(user_id, pagination_token=token, **extra),
+                              pagination_token, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'users', lista_usuarios, lista_tweets=lista_tweets,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores)
+        with paginador, etapa:
+            for pagina in paginador:
+                if lista_ids is not None or grafo is not None:
+                    datos = pagina.datos or []
+                    if lista_ids is not None:
+                        lista_ids.extend(int(usuario['id']) for usuario in datos)
+                    if grafo is not None:
+                        grafo.agregar_seguidos(user_id, [usuario['id'] for usuario in datos])
+                etapa.agregar(pagina)
+
+
+    def bulk_users(self, ids, lista_usuarios, lista_tweets = None, pagination_token = None,
+                    filtro = None):
+        """Realiza peticiones secuenciales a la API de twitter para obtener
+        la información de todos los usuarios en ids. Los ids se agrupan en
+        peticiones de 100 usuarios, el máximo que admite el endpoint users.
+
+        Rate limit: 300 requests per 15-minute window (app auth)
+
+        Cuando un bloque recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez.
+
+        Los ids se validan una sola vez con validar_ids, por lo que ids puede ser
+        cualquier iterable de cadenas o enteros sin límite de tamaño. Si hay ids
+        inválidos se emite un único warning con el resumen de los rechazados.
+
+        La función no tiene regreso, los datos obtenidos se agregan a 
+        lista_usuarios como efecto secundario. Opcionalmente se pueden
+        acumular los pinned_tweets de los usuarios en lista_tweets.
+
+        Para reanudar las peticiones el parámetro pagination_token indica la
+        posición dentro de los ids válidos a partir de la cual continuar. Si un
+        bloque regresa un status code distinto de 200 se lanza ErrorPeticion con
+        la posición del bloque que falló.
+
+        El parámetro filtro permite conservar únicamente algunos usuarios. Es una
+        función que recibe cada usuario tal como lo regresa la API y regresa True si
+        debe conservarse, por ejemplo FiltroMetricas(followers_count=1000). Se evalúa
+        antes de aplanar el usuario con process_user y de agregarlo a las listas.
         """
 
-        flag = 0
-        my_date = None
+        ids, reporte = validar_ids(ids)
+        if reporte.rechazados > 0:
+            warnings.warn(str(reporte))
+
         peticiones = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.following(user_id, pagination_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.following(user_id, pagination_token=pagination_token)
+        comienzo = int(pagination_token) if pagination_token is not None else 0
+        etapa = EtapaAplanado(self.procesos, 'users', lista_usuarios, lista_tweets=lista_tweets,
+                              perfilador=self.perfilador, trabajadores=self.trabajadores)
+        with etapa:
+            for inicio in range(comienzo, len(ids), 100):
+                bloque = ids[inicio:inicio + 100]
+                respuesta = self.users(bloque, cubrir=False)
+                my_date = datetime.now(timezone.utc)
+                peticiones = peticiones + 1
+                if respuesta.status_code == 429:
+                    self.esperar_limite(peticiones, str(inicio))
+                    respuesta = self.users(bloque, cubrir=False)
+                    my_date = datetime.now(timezone.utc)
+                    peticiones = peticiones + 1
+                if respuesta.status_code != 200 or not callable(getattr(respuesta, 'json', None)):
+                    raise ErrorPeticion(getattr(respuesta, 'endpoint_twigy', None), respuesta.status_code, str(inicio))
+                etapa.agregar(Pagina(respuesta, my_date, None, filtro))
+
+    def bulk_tweets(self, tweet_ids, lista_tweets, lista_users = None, lista_media = None,
+                    lista_polls = None, lista_places = None, pagination_token = None,
+                    filtro = None, vistos = None):
+        """Realiza peticiones secuenciales a la API de twitter para obtener
+        la información de todos los tweets en tweet_ids. Los ids se agrupan en
+        peticiones de 100 tweets, el máximo que admite el endpoint tweets.
+
+        Rate limit: 300 requests per 15-minute window (app auth)
+
+        Cuando un bloque recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez.
+
+        Los ids se validan una sola vez con validar_ids. La función no tiene regreso,
+        los datos obtenidos se agregan a lista_tweets como efecto secundario y la
+        información extendida a las listas opcionales lista_users, lista_media,
+        lista_polls y lista_places.
+
+        Para reanudar las peticiones el parámetro pagination_token indica la
+        posición dentro de los ids válidos a partir de la cual continuar. Si un
+        bloque regresa un status code distinto de 200 se lanza ErrorPeticion con
+        la posición del bloque que falló.
+
+        El parámetro filtro permite conservar únicamente algunos tweets. Es una
+        función que recibe cada tweet tal como lo regresa la API y regresa True si
+        debe conservarse, como FiltroIdioma, FiltroMetricas, FiltroGeo o
+        FiltroAutores. Se evalúa antes de aplanar el tweet con process_tweet y de
+        agregarlo a lista_tweets. Los objetos de includes no se filtran.
+
+        Si se pasa vistos, los tweets cuyo id ya está en vistos no se agregan a
+        lista_tweets y los nuevos se agregan a vistos.
+        """
+
+        tweet_ids, reporte = validar_ids(tweet_ids)
+        if reporte.rechazados > 0:
+            warnings.warn(str(reporte))
+
+        peticiones = 0
+        comienzo = int(pagination_token) if pagination_token is not None else 0
+        etapa = EtapaAplanado(self.procesos, 'tweets', lista_tweets, lista_users, lista_media,
+                              lista_polls, lista_places, perfilador=self.perfilador,
+                              vistos=vistos, trabajadores=self.trabajadores)
+        with etapa:
+            for inicio in range(comienzo, len(tweet_ids), 100):
+                bloque = tweet_ids[inicio:inicio + 100]
+                respuesta = self.tweets(bloque, cubrir=False)
                 my_date = datetime.now(timezone.utc)
                 peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    users_to_list(datos, lista_usuarios, my_date)
-                if lista_tweets is not None and includes is not None:
-                    tweets = includes['tweets']
-                    if tweets is not None:
-                        tweets_to_list(tweets, lista_tweets, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
+                if respuesta.status_code == 429:
+                    self.esperar_limite(peticiones, str(inicio))
+                    respuesta = self.tweets(bloque, cubrir=False)
+                    my_date = datetime.now(timezone.utc)
+                    peticiones = peticiones + 1
+                if respuesta.status_code != 200 or not callable(getattr(respuesta, 'json', None)):
+                    raise ErrorPeticion(getattr(respuesta, 'endpoint_twigy', None), respuesta.status_code, str(inicio))
+                etapa.agregar(Pagina(respuesta, my_date, None, filtro))
+
+    def snapshot_followers(self, user_id, snapshots):
+        """Obtiene todos los followers de la cuenta identificada con user_id
+        solicitando únicamente sus ids y los guarda como un nuevo snapshot
+        en el objeto SnapshotsSeguidores proporcionado.
+
+        Regresa la fecha del snapshot guardado."""
+
+        ids = array('q')
+        self.bulk_followers(user_id, None, lista_ids=ids)
+        return snapshots.guardar(user_id, ids)
+
+    def cambios_followers(self, user_id, snapshots, lista_ganados, lista_perdidos = None):
+        """Compara los dos snapshots más recientes de los followers de user_id
+        y obtiene la información únicamente de los usuarios que cambiaron.
+
+        Los usuarios que comenzaron a seguir a la cuenta se agregan a lista_ganados
+        y, si se proporciona, los que la dejaron de seguir se agregan a lista_perdidos.
+        Regresa la tupla (ganados, perdidos) con los arreglos de ids."""
+
+        fechas = snapshots.listar(user_id)
+        if len(fechas) < 2:
+            raise Exception("Se necesitan al menos dos snapshots de {} para compararlos".format(user_id))
+
+        anterior = snapshots.cargar(user_id, fechas[-2])
+        actual = snapshots.cargar(user_id, fechas[-1])
+        ganados, perdidos = diferencia_ids(anterior, actual)
+
+        if len(ganados) > 0:
+            self.bulk_users(ganados, lista_ganados)
+        if lista_perdidos is not None and len(perdidos) > 0:
+            self.bulk_users(perdidos, lista_perdidos)
+
+        return ganados, perdidos
+
+    def cambios_metricas(self, ids, metricas, campos = ('tweets',), lista_usuarios = None):
+        """Obtiene con bulk_users, en peticiones de 100 usuarios, las métricas
+        públicas de los usuarios en ids y las compara con las guardadas en el
+        objeto MetricasUsuarios proporcionado.
+
+        Regresa la lista de registros de process_user de los usuarios en los que
+        cambió alguno de los campos ('tweets', 'followers', 'following' o
+        'listed') o que no estaban en metricas. Las cuentas protegidas y las que no
+        regresa la API se omiten. Si se proporciona lista_usuarios, se agregan a
+        ella todos los usuarios obtenidos. metricas no se modifica."""
+
+        usuarios = []
+        self.bulk_users(ids, usuarios)
+        if lista_usuarios is not None:
+            for usuario in usuarios:
+                lista_usuarios.append(usuario)
+        return [usuario for usuario in usuarios
+                if not usuario.get('protected') and metricas.cambio(usuario, campos)]
+
+    def refrescar(self, ids, metodo, metricas, *args, campos = None, **kwargs):
+        """Ejecuta la función bulk metodo, por ejemplo 'bulk_timeline', solamente
+        para los usuarios de ids cuyas métricas cambiaron desde la última vez que
+        se recolectaron, según cambios_metricas. Revisar 100 cuentas cuesta una
+        petición a users, contra varias peticiones de timeline por cuenta.
+
+        Los argumentos extra se pasan a la función bulk. Si no se indican campos se
+        usan los de campos_cambio para el metodo. Después de recolectar cada cuenta
+        sus métricas se registran en metricas, que se guarda al terminar aunque
+        ocurra un error. Regresa la lista de ids recolectados."""
+
+        if campos is None:
+            if metodo not in campos_cambio:
+                raise Exception("Indica los campos a comparar para {}".format(metodo))
+            campos = campos_cambio[metodo]
+
+        cambiados = self.cambios_metricas(ids, metricas, campos)
+        recolectados = []
+        try:
+            for usuario in cambiados:
+                getattr(self, metodo)(usuario['id'], *args, **kwargs)
+                metricas.registrar(usuario)
+                recolectados.append(usuario['id'])
+        finally:
+            metricas.guardar()
+        return recolectados
 
     def bulk_timeline(self, user_id, lista_tweets, max_tweets = None, pagination_token = None,
                         lista_users=None, 
                         lista_media=None, 
                         lista_polls=None, 
-                        lista_places=None):
+                        lista_places=None,
+                        presupuesto=None,
+                        hidratar=False,
+                        filtro=None,
+                        vistos=None,
+                        avance=None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los tweets posibles
         correspondientes al timeline de la cuenta identificada con user_id.
@@ -744,16 +1162,22 @@ class Requester():
         cuentan para el cap total del proyecto en el API de twitter. Este cap es de 
         500,000 tweets al mes con una cuenta de tipo standard.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
-        La función no tiene regreso, los datos obtenidos se agregan a 
+        La función regresa True si la paginación terminó y False si se detuvo
+        antes por agotar el presupuesto o el cap. Los datos obtenidos se agregan a 
         lista_tweets como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_tweets
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. Para
@@ -764,56 +1188,66 @@ class Requester():
         media - lista_media
         polls - lista_polls
         places - lista_places
+
+        El parámetro presupuesto permite limitar el número de tweets del cap que
+        puede consumir la función. Puede ser un número o un objeto Presupuesto
+        compartido entre varias funciones. La función se detiene antes de hacer una
+        petición que pueda exceder el presupuesto o el cap restante en el LibroCap
+        del Requester, si es que tiene uno.
+
+        Si hidratar es True, los tweets referenciados (retweets, citas y respuestas)
+        que vienen en includes se agregan también a lista_tweets, y los tweets
+        referenciados y los usuarios de in_reply_to_user_id que no vinieron en la
+        respuesta se piden en peticiones de 100 ids con tweets y users. Cada objeto
+        se pide una sola vez aunque se referencie varias veces; con vistos, los
+        tweets ya vistos no se piden. Si hay función avance, los pendientes se
+        piden antes de cada llamada, y si la paginación termina con una excepción
+        también se piden antes de propagarla. Ver HidratadorReferencias.
+
+        El parámetro filtro permite conservar únicamente algunos tweets. Es una
+        función que recibe cada tweet tal como lo regresa la API y regresa True si
+        debe conservarse, como FiltroIdioma, FiltroMetricas, FiltroGeo o
+        FiltroAutores. Se evalúa antes de aplanar el tweet con process_tweet y de
+        agregarlo a lista_tweets. Los objetos de includes no se filtran.
+
+        El parámetro vistos permite descartar tweets ya recolectados, por ejemplo
+        en otras ejecuciones o en timelines que se traslapan. Es un ConjuntoIds,
+        un ConjuntoBloom o un set; los tweets cuyo id ya está en vistos no se
+        agregan a lista_tweets y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
         """
 
-        flag = 0
-        my_date = None
-        peticiones = 0
-        tweets_count = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.timeline(user_id, pagination_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.timeline(user_id, pagination_token=pagination_token)
-                my_date = datetime.now(timezone.utc)
-                peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    tweets_to_list(datos, lista_tweets, my_date)
-                    tweets_count = len(lista_tweets)
-                if lista_users is not None and includes is not None:
-                    usuarios = includes.get('users')
-                    if usuarios is not None:
-                        users_to_list(usuarios, lista_users, my_date)
-                if lista_media is not None and includes is not None:
-                    media = includes.get('media')
-                    if media is not None:
-                        media_to_list(media, lista_media, my_date)
-                if lista_polls is not None and includes is not None:
-                    polls = includes.get('polls')
-                    if polls is not None:
-                        polls_to_list(polls, lista_polls, my_date)
-                if lista_places is not None and includes is not None:
-                    places = includes.get('places')
-                    if places is not None:
-                        places_to_list(places, lista_places, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
-            if max_tweets is not None and tweets_count >= max_tweets:
-                pagination_token = None
+        presupuesto = como_presupuesto(presupuesto)
+        hidratador = None
+        if hidratar:
+            hidratador = HidratadorReferencias(self, lista_tweets, lista_users, lista_media,
+                                               lista_polls, lista_places, vistos=vistos)
+        paginador = Paginador(self, lambda token: self.timeline(user_id, pagination_token=token),
+                              pagination_token, max_elementos=max_tweets,
+                              presupuesto=presupuesto, cap=True, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'tweets', lista_tweets, lista_users, lista_media,
+                              lista_polls, lista_places,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores, hidratador=hidratador)
+        with paginador, etapa:
+            for pagina in paginador:
+                etapa.agregar(pagina)
+        return not paginador.agotado
+
 
     def bulk_mentions(self, user_id, lista_tweets, max_tweets = None, pagination_token = None,
                         lista_users=None, 
                         lista_media=None, 
                         lista_polls=None, 
-                        lista_places=None):
+                        lista_places=None,
+                        presupuesto=None,
+                        hidratar=False,
+                        filtro=None,
+                        vistos=None,
+                        avance=None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los tweets posibles
         correspondientes al timeline de la cuenta identificada con user_id.
@@ -827,16 +1261,22 @@ class Requester():
         cuentan para el cap total del proyecto en el API de twitter. Este cap es de 
         500,000 tweets al mes con una cuenta de tipo standard.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
-        La función no tiene regreso, los datos obtenidos se agregan a 
+        La función regresa True si la paginación terminó y False si se detuvo
+        antes por agotar el presupuesto o el cap. Los datos obtenidos se agregan a 
         lista_tweets como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_tweets
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. Para
@@ -847,56 +1287,65 @@ class Requester():
         media - lista_media
         polls - lista_polls
         places - lista_places
+
+        El parámetro presupuesto permite limitar el número de tweets del cap que
+        puede consumir la función. Puede ser un número o un objeto Presupuesto
+        compartido entre varias funciones. La función se detiene antes de hacer una
+        petición que pueda exceder el presupuesto o el cap restante en el LibroCap
+        del Requester, si es que tiene uno.
+
+        Si hidratar es True, los tweets referenciados (retweets, citas y respuestas)
+        que vienen en includes se agregan también a lista_tweets, y los tweets
+        referenciados y los usuarios de in_reply_to_user_id que no vinieron en la
+        respuesta se piden en peticiones de 100 ids con tweets y users. Cada objeto
+        se pide una sola vez aunque se referencie varias veces; con vistos, los
+        tweets ya vistos no se piden. Si hay función avance, los pendientes se
+        piden antes de cada llamada, y si la paginación termina con una excepción
+        también se piden antes de propagarla. Ver HidratadorReferencias.
+
+        El parámetro filtro permite conservar únicamente algunos tweets. Es una
+        función que recibe cada tweet tal como lo regresa la API y regresa True si
+        debe conservarse, como FiltroIdioma, FiltroMetricas, FiltroGeo o
+        FiltroAutores. Se evalúa antes de aplanar el tweet con process_tweet y de
+        agregarlo a lista_tweets. Los objetos de includes no se filtran.
+
+        El parámetro vistos permite descartar tweets ya recolectados, por ejemplo
+        en otras ejecuciones o en timelines que se traslapan. Es un ConjuntoIds,
+        un ConjuntoBloom o un set; los tweets cuyo id ya está en vistos no se
+        agregan a lista_tweets y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
         """
 
-        flag = 0
-        my_date = None
-        peticiones = 0
-        tweets_count = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.mentions(user_id, pagination_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.mentions(user_id, pagination_token=pagination_token)
-                my_date = datetime.now(timezone.utc)
-                peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    tweets_to_list(datos, lista_tweets, my_date)
-                    tweets_count = len(lista_tweets)
-                if lista_users is not None and includes is not None:
-                    usuarios = includes.get('users')
-                    if usuarios is not None:
-                        users_to_list(usuarios, lista_users, my_date)
-                if lista_media is not None and includes is not None:
-                    media = includes.get('media')
-                    if media is not None:
-                        media_to_list(media, lista_media, my_date)
-                if lista_polls is not None and includes is not None:
-                    polls = includes.get('polls')
-                    if polls is not None:
-                        polls_to_list(polls, lista_polls, my_date)
-                if lista_places is not None and includes is not None:
-                    places = includes.get('places')
-                    if places is not None:
-                        places_to_list(places, lista_places, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
-            if max_tweets is not None and tweets_count >= max_tweets:
-                pagination_token = None
+        presupuesto = como_presupuesto(presupuesto)
+        hidratador = None
+        if hidratar:
+            hidratador = HidratadorReferencias(self, lista_tweets, lista_users, lista_media,
+                                               lista_polls, lista_places, vistos=vistos)
+        paginador = Paginador(self, lambda token: self.mentions(user_id, pagination_token=token),
+                              pagination_token, max_elementos=max_tweets,
+                              presupuesto=presupuesto, cap=True, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'tweets', lista_tweets, lista_users, lista_media,
+                              lista_polls, lista_places,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores, hidratador=hidratador)
+        with paginador, etapa:
+            for pagina in paginador:
+                etapa.agregar(pagina)
+        return not paginador.agotado
+
 
     def bulk_liked(self, user_id, lista_tweets, max_tweets = 1000, pagination_token = None,
                         lista_users=None, 
                         lista_media=None, 
                         lista_polls=None, 
-                        lista_places=None):
+                        lista_places=None,
+                        presupuesto=None,
+                        filtro=None,
+                        vistos=None,
+                        avance=None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los tweets a los cuales
         les ha dado like la cuenta identificada con user_id.
@@ -910,16 +1359,22 @@ class Requester():
         cuentan para el cap total del proyecto en el API de twitter. Este cap es de 
         500,000 tweets al mes con una cuenta de tipo standard.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
-        La función no tiene regreso, los datos obtenidos se agregan a 
+        La función regresa True si la paginación terminó y False si se detuvo
+        antes por agotar el presupuesto o el cap. Los datos obtenidos se agregan a 
         lista_tweets como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_tweets
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. Para
@@ -930,57 +1385,53 @@ class Requester():
         media - lista_media
         polls - lista_polls
         places - lista_places
+
+        El parámetro presupuesto permite limitar el número de tweets del cap que
+        puede consumir la función. Puede ser un número o un objeto Presupuesto
+        compartido entre varias funciones. La función se detiene antes de hacer una
+        petición que pueda exceder el presupuesto o el cap restante en el LibroCap
+        del Requester, si es que tiene uno.
+
+        El parámetro filtro permite conservar únicamente algunos tweets. Es una
+        función que recibe cada tweet tal como lo regresa la API y regresa True si
+        debe conservarse, como FiltroIdioma, FiltroMetricas, FiltroGeo o
+        FiltroAutores. Se evalúa antes de aplanar el tweet con process_tweet y de
+        agregarlo a lista_tweets. Los objetos de includes no se filtran.
+
+        El parámetro vistos permite descartar tweets ya recolectados, por ejemplo
+        en otras ejecuciones o en timelines que se traslapan. Es un ConjuntoIds,
+        un ConjuntoBloom o un set; los tweets cuyo id ya está en vistos no se
+        agregan a lista_tweets y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
         """
 
-        flag = 0
-        my_date = None
-        peticiones = 0
-        tweets_count = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.liked(user_id, pagination_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.liked(user_id, pagination_token=pagination_token)
-                my_date = datetime.now(timezone.utc)
-                peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                tweets_count = tweets_count + len(datos)
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    tweets_to_list(datos, lista_tweets, my_date)
-                    tweets_count = len(lista_tweets)
-                if lista_users is not None and includes is not None:
-                    usuarios = includes.get('users')
-                    if usuarios is not None:
-                        users_to_list(usuarios, lista_users, my_date)
-                if lista_media is not None and includes is not None:
-                    media = includes.get('media')
-                    if media is not None:
-                        media_to_list(media, lista_media, my_date)
-                if lista_polls is not None and includes is not None:
-                    polls = includes.get('polls')
-                    if polls is not None:
-                        polls_to_list(polls, lista_polls, my_date)
-                if lista_places is not None and includes is not None:
-                    places = includes.get('places')
-                    if places is not None:
-                        places_to_list(places, lista_places, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
-            if max_tweets is not None and tweets_count >= max_tweets:
-                pagination_token = None
+        presupuesto = como_presupuesto(presupuesto)
+        paginador = Paginador(self, lambda token: self.liked(user_id, pagination_token=token),
+                              pagination_token, max_elementos=max_tweets,
+                              presupuesto=presupuesto, cap=True, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'tweets', lista_tweets, lista_users, lista_media,
+                              lista_polls, lista_places,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores)
+        with paginador, etapa:
+            for pagina in paginador:
+                etapa.agregar(pagina)
+        return not paginador.agotado
+
 
     def bulk_recent_search(self, query, lista_tweets, max_tweets = 1000, pagination_token = None,
                         lista_users=None, 
                         lista_media=None, 
                         lista_polls=None, 
-                        lista_places=None):
+                        lista_places=None,
+                        presupuesto=None,
+                        hidratar=False,
+                        filtro=None,
+                        vistos=None,
+                        avance=None):
         """Realiza peticiones secuenciales y paginadas a la API de twitter.
         La petición tiene como objetivo obtener todos los tweets que satisfagan 
         el query proporcionado. El query debe seguir los lineamientos de twitter
@@ -996,16 +1447,22 @@ class Requester():
         cuentan para el cap total del proyecto en el API de twitter. Este cap es de 
         500,000 tweets al mes con una cuenta de tipo standard.
 
-        Las peticiones se realizan secuencialmente hasta que se recibe un 
-        status code 429, en ese momento la función descansa las peticiones
-        900 segundos (15 minutos).
+        Cuando una petición recibe un status code 429 la función descansa 900
+        segundos (15 minutos) y repite la petición una vez; si el Requester tiene
+        ceder_limites, en lugar de descansar lanza LimiteExcedido. Si la respuesta
+        sigue siendo 429, o tiene cualquier otro status code distinto de 200, se
+        lanza ErrorPeticion. Los errores 5xx se reintentan antes hasta 3 veces.
 
-        La función no tiene regreso, los datos obtenidos se agregan a 
+        La función regresa True si la paginación terminó y False si se detuvo
+        antes por agotar el presupuesto o el cap. Los datos obtenidos se agregan a 
         lista_tweets como efecto secundario, esto debido al tiempo 
         prolongado en el que corre esta función. Si se quiebra, lista_tweets
-        tendrá la información recabada hasta ese momento. Reanudar las peticiones
-        es posible usando el token de paginación almacenado en la propiedad
-        last_petition del Requester si es que fue válida la última petición.
+        tendrá la información recabada hasta ese momento. Para reanudar las
+        peticiones se pasa como pagination_token el token de la excepción
+        ErrorPeticion o LimiteExcedido, que es el de la primera página que no
+        se agregó a las listas, o el último token que recibió la función avance.
+        Con prefetch, el token de last_petition puede ir adelante de las páginas
+        agregadas.
 
         La función tiene la posibilidad de modificar listas extra con información
         correspondiente a las extensiones usuales de la API de twitter. Para
@@ -1016,51 +1473,54 @@ class Requester():
         media - lista_media
         polls - lista_polls
         places - lista_places
+
+        El parámetro presupuesto permite limitar el número de tweets del cap que
+        puede consumir la función. Puede ser un número o un objeto Presupuesto
+        compartido entre varias funciones. La función se detiene antes de hacer una
+        petición que pueda exceder el presupuesto o el cap restante en el LibroCap
+        del Requester, si es que tiene uno.
+
+        Si hidratar es True, los tweets referenciados (retweets, citas y respuestas)
+        que vienen en includes se agregan también a lista_tweets, y los tweets
+        referenciados y los usuarios de in_reply_to_user_id que no vinieron en la
+        respuesta se piden en peticiones de 100 ids con tweets y users. Cada objeto
+        se pide una sola vez aunque se referencie varias veces; con vistos, los
+        tweets ya vistos no se piden. Si hay función avance, los pendientes se
+        piden antes de cada llamada, y si la paginación termina con una excepción
+        también se piden antes de propagarla. Ver HidratadorReferencias.
+
+        El parámetro filtro permite conservar únicamente algunos tweets. Es una
+        función que recibe cada tweet tal como lo regresa la API y regresa True si
+        debe conservarse, como FiltroIdioma, FiltroMetricas, FiltroGeo o
+        FiltroAutores. Se evalúa antes de aplanar el tweet con process_tweet y de
+        agregarlo a lista_tweets. Los objetos de includes no se filtran.
+
+        El parámetro vistos permite descartar tweets ya recolectados, por ejemplo
+        en otras ejecuciones o en timelines que se traslapan. Es un ConjuntoIds,
+        un ConjuntoBloom o un set; los tweets cuyo id ya está en vistos no se
+        agregan a lista_tweets y los nuevos se agregan a vistos.
+
+        El parámetro avance es una función que se llama con el token para reanudar
+        la paginación cada vez que los registros de una página terminan de
+        agregarse a las listas; después de la última página recibe None.
         """
 
-        flag = 0
-        my_date = None
-        peticiones = 0
-        tweets_count = 0
-        while pagination_token is not None or flag == 0:
-            flag = 1
-            respuesta = self.recent_search(query, next_token=pagination_token)
-            my_date = datetime.now(timezone.utc)
-            peticiones = peticiones + 1
-            if respuesta.status_code == 429:
-                print("Esperando, {} realizadas.".format(peticiones))
-                time.sleep(900)
-                respuesta = self.recent_search(query, next_token=pagination_token)
-                my_date = datetime.now(timezone.utc)
-                peticiones = peticiones + 1
-            if (respuesta.status_code == 200) and callable(getattr(respuesta, 'json', None)):
-                datos = respuesta.json().get('data')
-                tweets_count = tweets_count + len(datos)
-                meta = respuesta.json().get('meta')
-                includes = respuesta.json().get('includes')
-                if datos is not None:
-                    tweets_to_list(datos, lista_tweets, my_date)
-                    tweets_count = len(lista_tweets)
-                if lista_users is not None and includes is not None:
-                    usuarios = includes.get('users')
-                    if usuarios is not None:
-                        users_to_list(usuarios, lista_users, my_date)
-                if lista_media is not None and includes is not None:
-                    media = includes.get('media')
-                    if media is not None:
-                        media_to_list(media, lista_media, my_date)
-                if lista_polls is not None and includes is not None:
-                    polls = includes.get('polls')
-                    if polls is not None:
-                        polls_to_list(polls, lista_polls, my_date)
-                if lista_places is not None and includes is not None:
-                    places = includes.get('places')
-                    if places is not None:
-                        places_to_list(places, lista_places, my_date)
-                if meta is not None:
-                    pagination_token = meta.get('next_token')
-            if max_tweets is not None and tweets_count >= max_tweets:
-                pagination_token = None
+        presupuesto = como_presupuesto(presupuesto)
+        hidratador = None
+        if hidratar:
+            hidratador = HidratadorReferencias(self, lista_tweets, lista_users, lista_media,
+                                               lista_polls, lista_places, vistos=vistos)
+        paginador = Paginador(self, lambda token: self.recent_search(query, next_token=token),
+                              pagination_token, max_elementos=max_tweets,
+                              presupuesto=presupuesto, cap=True, filtro=filtro)
+        etapa = EtapaAplanado(self.procesos, 'tweets', lista_tweets, lista_users, lista_media,
+                              lista_polls, lista_places,
+                              perfilador=self.perfilador, vistos=vistos, avance=avance,
+                              trabajadores=self.trabajadores, hidratador=hidratador)
+        with paginador, etapa:
+            for pagina in paginador:
+                etapa.agregar(pagina)
+        return not paginador.agotado
 
 
     def peticion(self, url, header, parametros):
@@ -1069,14 +1529,26 @@ class Requester():
         indicados como input.
         
         Si la petición regresa un status_code igual a 503 la función espera 15 segundos
-        y vuelve a realizar la petición una segunda vez."""
+        y vuelve a realizar la petición una segunda vez.
 
-        twreq = requests.request("GET", url, headers=header, params=parametros)
+        Si el Requester tiene un LibroCap y el endpoint consume el cap del proyecto,
+        los tweets regresados se registran en él.
 
-        if twreq.status_code == 503:
-            time.sleep(15)
+        El módulo requests se importa hasta la primera petición para que importar
+        twigy sea rápido en procesos de corta duración."""
+
+        import requests
+
+        endpoint = nombre_endpoint(url)
+        with medir(self.perfilador, 'red', endpoint):
             twreq = requests.request("GET", url, headers=header, params=parametros)
 
+        if twreq.status_code == 503:
+            with medir(self.perfilador, 'espera', endpoint):
+                time.sleep(15)
+            with medir(self.perfilador, 'red', endpoint):
+                twreq = requests.request("GET", url, headers=header, params=parametros)
+
         if twreq.status_code != 200:
             warnings.warn("El código de status de la respuesta a la petición no es 200.")
 
@@ -1084,18 +1556,845 @@ class Requester():
         self.last_petition['header'] = header
         self.last_petition['parametros'] = parametros
         self.last_petition['status_code'] = twreq.status_code
+        twreq.endpoint_twigy = endpoint
         if twreq.status_code == 200:
-            self.last_petition['meta'] = twreq.json().get('meta')
+            with medir(self.perfilador, 'decodificacion', endpoint):
+                self.last_petition['meta'] = meta_json(twreq)
         else:
             self.last_petition['meta'] = None
 
+        if self.libro_cap is not None and twreq.status_code == 200:
+            if endpoint in endpoints_cap:
+                n = contar_datos(twreq)
+                if n > 0:
+                    self.libro_cap.registrar(n, endpoint)
+
+        self.registrar_limite(url, twreq)
+
         return twreq
 
+    def peticion_cubierta(self, url, header, parametros, cubrir=True):
+        """Realiza la petición con la Cobertura del Requester, si tiene una y cubrir
+        es True, o directamente con peticion en caso contrario."""
+
+        if self.cobertura is None or not cubrir:
+            return self.peticion(url, header, parametros)
+        return self.cobertura.ejecutar(self, url, header, parametros)
+
+    def registrar_limite(self, url, respuesta):
+        """Guarda en la propiedad limites el estado de la ventana de rate limit
+        del endpoint de url de acuerdo a los headers de la respuesta.
+        Para cada endpoint se guarda el límite de la ventana, las peticiones
+        restantes y el momento (epoch en segundos) en el que se reinicia."""
+
+        headers = getattr(respuesta, 'headers', None)
+        if headers is None or headers.get('x-rate-limit-remaining') is None:
+            return
+
+        self.limites[nombre_endpoint(url)] = {
+            "limite": int(headers.get('x-rate-limit-limit', 0)),
+            "restantes": int(headers.get('x-rate-limit-remaining')),
+            "reinicio": int(headers.get('x-rate-limit-reset', 0)),
+        }
+
+class LimiteExcedido(Exception):
+    """Excepción lanzada por las funciones bulk cuando un endpoint agota su ventana
+    de rate limit y el Requester tiene activada la propiedad ceder_limites.
+    Contiene el endpoint, el momento (epoch en segundos) en que se reinicia su
+    ventana y el token de paginación con el que se puede reanudar la función.
+    Si la función tenía un máximo de elementos, max_elementos es el número que
+    falta por obtener; si no, es None."""
+
+    def __init__(self, endpoint, reinicio, pagination_token=None, max_elementos=None):
+        super().__init__("Rate limit agotado en {}".format(endpoint))
+        self.endpoint = endpoint
+        self.reinicio = reinicio
+        self.pagination_token = pagination_token
+        self.max_elementos = max_elementos
+
+class ErrorPeticion(Exception):
+    """Excepción lanzada cuando una petición de una función bulk regresa un status
+    code distinto de 200, o un error 5xx después de agotar los reintentos.
+    Contiene el endpoint, el status code y el token de paginación con el que se
+    puede reanudar la función; las páginas anteriores ya se entregaron."""
+
+    def __init__(self, endpoint, status_code, pagination_token=None):
+        super().__init__("La petición a {} regresó el status code {}".format(endpoint, status_code))
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.pagination_token = pagination_token
+
+class Medicion():
+    """Bloque with que registra en un Perfilador el tiempo de una categoría."""
+
+    def __init__(self, perfilador, categoria, endpoint):
+        self.perfilador = perfilador
+        self.categoria = categoria
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.perfilador.registrar(self.categoria, self.endpoint, self.inicio, time.perf_counter())
+
+class SinMedicion():
+    """Bloque with que no hace nada, se usa cuando no hay Perfilador."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_sin_medicion = SinMedicion()
+
+def medir(perfilador, categoria, endpoint=None):
+    """Regresa un bloque with que mide el tiempo de categoria para endpoint en
+    perfilador, o un bloque que no hace nada si perfilador es None."""
+
+    if perfilador is None:
+        return _sin_medicion
+    return Medicion(perfilador, categoria, endpoint)
+
+class Perfilador():
+    """Mide en qué se va el tiempo de las funciones bulk de un Requester.
+
+    El tiempo se reparte por endpoint en las categorías espera (descansos por
+    rate limit y reintentos), red (peticiones HTTP), decodificacion (JSON),
+    aplanado (funciones process_*, o la espera a los procesos de set_procesos)
+    y sink (append a las listas o sinks). El tiempo que no cae en ninguna
+    categoría se reporta como otros. Con varios hilos los tiempos se suman,
+    por lo que pueden exceder el tiempo transcurrido.
+
+    Si traza es True se guarda cada medición para exportarla con guardar_traza
+    en el formato de Chrome trace, que puede abrirse en chrome://tracing,
+    Perfetto o speedscope."""
+
+    categorias = ('espera', 'red', 'decodificacion', 'aplanado', 'sink')
+
+    def __init__(self, traza=False):
+        self._lock = threading.Lock()
+        self._hilo = threading.get_ident
+        self.inicio = time.perf_counter()
+        self.totales = {}
+        self.eventos = [] if traza else None
+
+    def registrar(self, categoria, endpoint, inicio, fin):
+        """Agrega al total de categoria y endpoint el tiempo entre inicio y fin,
+        medidos con time.perf_counter."""
+
+        with self._lock:
+            totales = self.totales.get(endpoint)
+            if totales is None:
+                totales = {nombre: 0.0 for nombre in self.categorias}
+                self.totales[endpoint] = totales
+            totales[categoria] = totales[categoria] + fin - inicio
+            if self.eventos is not None:
+                self.eventos.append((categoria, endpoint, inicio, fin, self._hilo()))
+
+    def transcurrido(self):
+        return time.perf_counter() - self.inicio
+
+    def resumen(self):
+        """Regresa un texto con una tabla de segundos por endpoint y categoría."""
+
+        with self._lock:
+            totales = {endpoint: dict(valores) for endpoint, valores in self.totales.items()}
+        transcurrido = self.transcurrido()
+        lineas = ["{:<28}".format('endpoint') + ''.join("{:>15}".format(nombre) for nombre in self.categorias)]
+        medido = 0.0
+        for endpoint, valores in sorted(totales.items(), key=lambda par: str(par[0])):
+            medido = medido + sum(valores.values())
+            lineas.append("{:<28}".format(str(endpoint)) +
+                          ''.join("{:>15.3f}".format(valores[nombre]) for nombre in self.categorias))
+        lineas.append("Tiempo transcurrido {:.3f} s, medido {:.3f} s, otros {:.3f} s".format(
+            transcurrido, medido, max(transcurrido - medido, 0.0)))
+        return '\n'.join(lineas)
+
+    def imprimir(self):
+        print(self.resumen())
+
+    def guardar_traza(self, ruta):
+        """Escribe las mediciones en ruta en formato JSON de Chrome trace.
+        Requiere que el Perfilador se haya creado con traza=True."""
+
+        if self.eventos is None:
+            raise Exception("El Perfilador no guarda la traza, créalo con traza=True")
+        with self._lock:
+            eventos = list(self.eventos)
+        traza = [{"name": categoria, "cat": str(endpoint), "ph": "X", "pid": os.getpid(), "tid": hilo,
+                  "ts": (inicio - self.inicio) * 1e6, "dur": (fin - inicio) * 1e6}
+                 for categoria, endpoint, inicio, fin, hilo in eventos]
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump({"traceEvents": traza, "displayTimeUnit": "ms"}, archivo)
+
+def contenido_json(respuesta):
+    """Regresa el contenido de una respuesta decodificado como JSON.
+    El resultado se guarda en la respuesta para que el JSON se decodifique
+    una sola vez aunque lo usen varias funciones."""
+
+    contenido = getattr(respuesta, 'contenido_twigy', None)
+    if contenido is None:
+        contenido = respuesta.json()
+        respuesta.contenido_twigy = contenido
+    return contenido
+
+def _meta_final(contenido):
+    """Decodifica el objeto meta de un contenido JSON sin decodificar el resto,
+    buscándolo al final del contenido, que es donde lo coloca la API de twitter.
+    Regresa False si meta no es la última llave del objeto principal."""
+
+    if not isinstance(contenido, bytes):
+        return False
+    inicio = contenido.rfind(b'"meta"')
+    if inicio < 0 or contenido[:inicio].rstrip()[-1:] not in (b',', b'{'):
+        return False
+    texto = contenido[inicio + 6:].decode('utf-8').lstrip()
+    if not texto.startswith(':'):
+        return False
+    texto = texto[1:].lstrip()
+    try:
+        meta, fin = json.JSONDecoder().raw_decode(texto)
+    except ValueError:
+        return False
+    if texto[fin:].strip() != '}':
+        return False
+    return meta
+
+def meta_json(respuesta):
+    """Regresa el objeto meta del contenido JSON de una respuesta.
+    Si el contenido no se ha decodificado se decodifica únicamente meta, de forma
+    que data e includes pueden decodificarse en otro proceso."""
+
+    contenido = getattr(respuesta, 'contenido_twigy', None)
+    if contenido is not None:
+        return contenido.get('meta')
+    meta = getattr(respuesta, 'meta_twigy', False)
+    if meta is False:
+        meta = _meta_final(getattr(respuesta, 'content', None))
+        if meta is False:
+            return contenido_json(respuesta).get('meta')
+        respuesta.meta_twigy = meta
+    return meta
+
+def contar_datos(respuesta):
+    """Regresa el número de objetos en data de una respuesta. Se usa result_count
+    de meta cuando existe para no decodificar el contenido completo."""
+
+    meta = meta_json(respuesta)
+    if meta is not None and meta.get('result_count') is not None:
+        return meta['result_count']
+    datos = contenido_json(respuesta).get('data')
+    return 0 if datos is None else len(datos)
+
+class Pagina():
+    """Página exitosa de resultados de un endpoint paginado.
+    Contiene la fecha de la petición, el token con el que se pidió, el endpoint,
+    los objetos data, includes y meta de la respuesta, y el token de la siguiente página.
+    data e includes se decodifican hasta que se usan por primera vez.
+    Si hay filtro, datos contiene únicamente los objetos que lo cumplen."""
+
+    def __init__(self, respuesta, fecha, token, filtro=None):
+        self.respuesta = respuesta
+        self.fecha = fecha
+        self.token = token
+        self.filtro = filtro
+        self._filtrados = None
+        self.endpoint = getattr(respuesta, 'endpoint_twigy', None)
+        self.meta = meta_json(respuesta)
+        self.siguiente = None
+        if self.meta is not None:
+            self.siguiente = self.meta.get('next_token')
+
+    @property
+    def datos(self):
+        datos = contenido_json(self.respuesta).get('data')
+        if self.filtro is None or datos is None:
+            return datos
+        if self._filtrados is None:
+            self._filtrados = [objeto for objeto in datos if self.filtro(objeto)]
+        return self._filtrados
+
+    @property
+    def includes(self):
+        return contenido_json(self.respuesta).get('includes')
+
+    @property
+    def num_datos(self):
+        return contar_datos(self.respuesta)
+
+class Paginador():
+    """Itera sobre las páginas de un endpoint paginado.
+
+    pedir es una función que recibe un token de paginación (None para la primera
+    página) y regresa la respuesta de la petición. El paginador sigue los tokens
+    hasta que no hay más páginas, hasta obtener max_elementos objetos en data o
+    hasta agotar el presupuesto. Cuando una petición recibe un status code 429 se
+    llama a esperar_limite del Requester y se repite la petición, hasta esperas
+    veces seguidas. Los errores 5xx se reintentan hasta reintentos veces;
+    cualquier otro status code, un 429 después de las esperas o un 5xx después de
+    los reintentos lanza ErrorPeticion con el token de la página que falló.
+
+    Si profundidad es mayor a 0, un hilo pide las páginas siguientes en cuanto se
+    conoce su token, mientras la página actual se procesa, con máximo profundidad
+    páginas pedidas por adelantado. Si es None se usa la propiedad prefetch del
+    Requester. Con prefetch, last_petition puede ir adelante de la página que se
+    está procesando; el token para reanudar la paginación es token_reanudar.
+
+    Si cap es True las páginas consumen el cap del proyecto: antes de cada petición
+    se verifica el presupuesto y el LibroCap del Requester con hay_cap. Si la
+    paginación se detiene porque no alcanzan, la propiedad agotado es True.
+
+    filtro es una función que recibe cada objeto de data tal como lo regresa la
+    API y regresa True si debe conservarse; las páginas entregan en datos
+    únicamente los objetos que la cumplen. max_elementos cuenta los objetos
+    recibidos, no los conservados, porque son los que consumen el cap.
+
+    El paginador debe cerrarse con close o usarse con with para detener el hilo
+    de prefetch si la iteración se interrumpe."""
+
+    def __init__(self, requester, pedir, pagination_token=None, profundidad=None,
+                 max_elementos=None, presupuesto=None, cap=False, reintentos=3, filtro=None,
+                 esperas=1):
+        self.requester = requester
+        self.pedir = pedir
+        self.filtro = filtro
+        self.profundidad = requester.prefetch if profundidad is None else profundidad
+        self.max_elementos = max_elementos
+        self.presupuesto = presupuesto
+        self.cap = cap
+        self.reintentos = reintentos
+        self.esperas = esperas
+        self.token_reanudar = pagination_token
+        self.peticiones = 0
+        self.agotado = False
+        self._token = pagination_token
+        self._elementos = 0
+        self._detener = False
+        self._espacio = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._detener = True
+        if self._espacio is not None:
+            self._espacio.release()
+
+    def _pedir_pagina(self):
+        """Realiza la petición de la siguiente página. Regresa la Pagina o None
+        si la paginación terminó. Lanza ErrorPeticion si la petición falla."""
+
+        if self._detener:
+            return None
+        if self.max_elementos is not None and self._elementos >= self.max_elementos:
+            return None
+        presupuesto = self.presupuesto if self.cap else None
+        if self.cap and not self.requester.hay_cap(presupuesto):
+            self.agotado = True
+            return None
+
+        token = self._token
+        intentos = 0
+        esperas = 0
+        while True:
+            respuesta = self.pedir(token)
+            fecha = datetime.now(timezone.utc)
+            self.peticiones = self.peticiones + 1
+            if respuesta.status_code == 429 and esperas < self.esperas:
+                esperas = esperas + 1
+                try:
+                    self.requester.esperar_limite(self.peticiones, token, presupuesto)
+                except LimiteExcedido as error:
+                    if self.max_elementos is not None:
+                        error.max_elementos = self.max_elementos - self._elementos
+                    raise
+                continue
+            if respuesta.status_code >= 500 and intentos < self.reintentos:
+                intentos = intentos + 1
+                with medir(self.requester.perfilador, 'espera', getattr(respuesta, 'endpoint_twigy', None)):
+                    time.sleep(5 * intentos)
+                continue
+            break
+
+        if presupuesto is not None:
+            presupuesto.liberar(100)
+        if respuesta.status_code != 200 or not callable(getattr(respuesta, 'json', None)):
+            self._detener = True
+            raise ErrorPeticion(getattr(respuesta, 'endpoint_twigy', None), respuesta.status_code, token)
+
+        pagina = Pagina(respuesta, fecha, token, self.filtro)
+        n = pagina.num_datos
+        self._elementos = self._elementos + n
+        if presupuesto is not None and n > 0:
+            presupuesto.consumir(n)
+        self._token = pagina.siguiente
+        if self._token is None:
+            self._detener = True
+        return pagina
+
+    def __iter__(self):
+        if self.profundidad <= 0:
+            while True:
+                pagina = self._pedir_pagina()
+                if pagina is None:
+                    return
+                self.token_reanudar = pagina.siguiente
+                yield pagina
+        else:
+            yield from self._iterar_prefetch()
+
+    def _iterar_prefetch(self):
+        cola = queue.Queue()
+        self._espacio = threading.Semaphore(self.profundidad)
+        hilo = threading.Thread(target=self._prefetch, args=(cola,), daemon=True)
+        hilo.start()
+        while True:
+            tipo, valor = cola.get()
+            self._espacio.release()
+            if tipo == 'fin':
+                return
+            if tipo == 'error':
+                raise valor
+            self.token_reanudar = valor.siguiente
+            yield valor
+
+    def _prefetch(self, cola):
+        try:
+            while True:
+                self._espacio.acquire()
+                pagina = self._pedir_pagina()
+                if pagina is None:
+                    cola.put(('fin', None))
+                    return
+                cola.put(('pagina', pagina))
+        except Exception as error:
+            cola.put(('error', error))
+
+class HidratadorReferencias():
+    """Obtiene los tweets referenciados y los usuarios a los que responden los tweets
+    de una recolección que no vinieron incluidos en las respuestas.
+
+    El hidratador se pasa a la EtapaAplanado de la recolección, que llama a
+    observar con cada página al recibirla y a entregar cuando los registros de
+    esa página ya se agregaron a las listas, en el orden de las páginas.
+
+    Por cada página observada se registran como vistos los tweets de data y de
+    includes y los usuarios de includes. Los tweets de includes que no se habían
+    visto se agregan a lista_tweets al entregar la página. Los ids de
+    referenced_tweets y de in_reply_to_user_id que no se han visto se acumulan y
+    se piden en bloques de 100 con bulk_tweets y bulk_users cuando se juntan 100
+    o al llamar a terminar. Los resultados se agregan a las mismas listas de la
+    recolección.
+
+    Si se pasa vistos, los tweets cuyo id ya está en vistos no se piden ni se
+    agregan a lista_tweets y los nuevos se agregan a vistos, igual que los
+    tweets de data en las funciones bulk.
+
+    Si el Requester tiene activada la propiedad ceder_limites y tweets o users
+    agotan su ventana, el hidratador espera a que se reinicie y continúa el
+    bloque desde su posición, en lugar de dejar escapar el LimiteExcedido, cuyo
+    token no correspondería a la paginación de la recolección."""
+
+    def __init__(self, requester, lista_tweets, lista_users=None, lista_media=None,
+                 lista_polls=None, lista_places=None, vistos=None):
+        self.requester = requester
+        self.lista_tweets = lista_tweets
+        self.lista_users = lista_users
+        self.lista_media = lista_media
+        self.lista_polls = lista_polls
+        self.lista_places = lista_places
+        self.vistos = vistos
+        self._nuevos = FiltroNuevos(vistos) if vistos is not None else None
+        self.tweets_vistos = ConjuntoIds()
+        self.users_vistos = ConjuntoIds()
+        self.tweets_pendientes = []
+        self.users_pendientes = []
+
+    def _referencias(self, tweets):
+        for tweet in tweets:
+            for referencia in tweet.get('referenced_tweets') or []:
+                tweet_id = referencia.get('id')
+                if tweet_id is None or (self.vistos is not None and tweet_id in self.vistos):
+                    continue
+                if self.tweets_vistos.agregar(tweet_id):
+                    self.tweets_pendientes.append(tweet_id)
+            user_id = tweet.get('in_reply_to_user_id')
+            if self.lista_users is not None and user_id is not None and self.users_vistos.agregar(user_id):
+                self.users_pendientes.append(user_id)
+
+    def observar(self, pagina):
+        """Registra los objetos de una página y regresa sus tweets de includes
+        que no se habían visto, que se agregan a lista_tweets con entregar."""
+
+        datos = pagina.datos or []
+        includes = pagina.includes or {}
+        self.tweets_vistos.agregar_varios([tweet['id'] for tweet in datos])
+        self.users_vistos.agregar_varios([usuario['id'] for usuario in includes.get('users', [])])
+
+        nuevos = [tweet for tweet in includes.get('tweets', []) if self.tweets_vistos.agregar(tweet['id'])]
+        self._referencias(datos)
+        self._referencias(nuevos)
+        return nuevos
+
+    def entregar(self, nuevos, fecha, vaciar=False):
+        """Agrega a lista_tweets los tweets de includes que regresó observar para
+        una página y pide los faltantes si ya hay 100, o todos si vaciar es True."""
+
+        if self._nuevos is not None:
+            nuevos = [tweet for tweet in nuevos if self._nuevos(tweet)]
+        tweets_to_list(nuevos, self.lista_tweets, fecha)
+        self._pedir(1 if vaciar else 100)
+
+    def _pedir(self, minimo):
+        if len(self.tweets_pendientes) >= minimo:
+            bloque = self.tweets_pendientes
+            self.tweets_pendientes = []
+            usuarios = []
+            self._bulk('bulk_tweets', bloque, self.lista_tweets, usuarios, self.lista_media,
+                       self.lista_polls, self.lista_places, vistos=self.vistos)
+            nuevos = [usuario for usuario in usuarios if self.users_vistos.agregar(usuario['id'])]
+            if self.lista_users is not None:
+                for usuario in nuevos:
+                    self.lista_users.append(usuario)
+        if len(self.users_pendientes) >= minimo:
+            bloque = self.users_pendientes
+            self.users_pendientes = []
+            self._bulk('bulk_users', bloque, self.lista_users)
+
+    def _bulk(self, metodo, bloque, *listas, **opciones):
+        token = None
+        while True:
+            try:
+                getattr(self.requester, metodo)(bloque, *listas, pagination_token=token, **opciones)
+                return
+            except LimiteExcedido as error:
+                token = error.pagination_token
+                espera = error.reinicio - time.time()
+                if espera > 0:
+                    with medir(self.requester.perfilador, 'espera', error.endpoint):
+                        time.sleep(espera)
+
+    def terminar(self):
+        """Pide todos los objetos faltantes que quedan pendientes."""
+
+        self._pedir(1)
+
+class FiltroIdioma():
+    """Filtro para las funciones bulk que conserva los tweets cuyo lang está en idiomas."""
+
+    def __init__(self, *idiomas):
+        self.idiomas = frozenset(idiomas)
+
+    def __call__(self, tweet):
+        return tweet.get('lang') in self.idiomas
+
+class FiltroMetricas():
+    """Filtro para las funciones bulk que conserva los tweets o usuarios cuyas
+    public_metrics son mayores o iguales a los mínimos indicados, por ejemplo
+    FiltroMetricas(like_count=10) o FiltroMetricas(followers_count=1000).
+    Los objetos sin la métrica no se conservan."""
+
+    def __init__(self, **minimos):
+        self.minimos = tuple(minimos.items())
+
+    def __call__(self, objeto):
+        metricas = objeto.get('public_metrics')
+        if metricas is None:
+            return False
+        for metrica, minimo in self.minimos:
+            valor = metricas.get(metrica)
+            if valor is None or valor < minimo:
+                return False
+        return True
+
+class FiltroGeo():
+    """Filtro para las funciones bulk que conserva los tweets con geo, ya sea
+    un lugar o coordenadas."""
+
+    def __call__(self, tweet):
+        return bool(tweet.get('geo'))
+
+class FiltroAutores():
+    """Filtro para las funciones bulk que conserva los tweets cuyo author_id está en autores."""
+
+    def __init__(self, autores):
+        self.autores = frozenset(str(autor) for autor in autores)
+
+    def __call__(self, tweet):
+        return tweet.get('author_id') in self.autores
+
+class FiltroTodos():
+    """Filtro para las funciones bulk que conserva los objetos que cumplen todos los filtros."""
+
+    def __init__(self, *filtros):
+        self.filtros = filtros
+
+    def __call__(self, objeto):
+        for filtro in self.filtros:
+            if not filtro(objeto):
+                return False
+        return True
+
+class FiltroNuevos():
+    """Filtro que conserva los objetos cuyo id no está en vistos y los agrega a
+    vistos, de forma que cada id se conserva una sola vez. vistos puede ser un
+    ConjuntoIds, un ConjuntoBloom o un set."""
+
+    def __init__(self, vistos):
+        self.vistos = vistos
+        self._agregar = getattr(vistos, 'agregar', None)
+
+    def __call__(self, objeto):
+        objeto_id = objeto.get('id')
+        if self._agregar is not None:
+            return self._agregar(objeto_id)
+        if objeto_id in self.vistos:
+            return False
+        self.vistos.add(objeto_id)
+        return True
+
+def crear_filtro(especificacion):
+    """Crea un filtro a partir de un dict con las llaves opcionales idiomas,
+    metricas (dict de mínimos), geo y autores, como el de la llave filtro de los
+    archivos de trabajo. Regresa None si la especificación está vacía."""
+
+    if not especificacion:
+        return None
+    filtros = []
+    if especificacion.get('idiomas'):
+        filtros.append(FiltroIdioma(*especificacion['idiomas']))
+    if especificacion.get('metricas'):
+        filtros.append(FiltroMetricas(**especificacion['metricas']))
+    if especificacion.get('geo'):
+        filtros.append(FiltroGeo())
+    if especificacion.get('autores'):
+        filtros.append(FiltroAutores(especificacion['autores']))
+    if len(filtros) == 1:
+        return filtros[0]
+    return FiltroTodos(*filtros)
+
+def empaquetar_registros(registros):
+    """Empaqueta una lista de registros aplanados en un lote por columnas que es
+    más barato de serializar entre procesos que la lista de dicts. Los registros
+    con las mismas llaves comparten un grupo de columnas y el orden se conserva
+    en la lista de índices de grupo."""
+
+    grupos = {}
+    columnas = []
+    indices = []
+    for registro in registros:
+        llaves = tuple(registro)
+        indice = grupos.get(llaves)
+        if indice is None:
+            indice = len(columnas)
+            grupos[llaves] = indice
+            columnas.append([[] for llave in llaves])
+        for columna, valor in zip(columnas[indice], registro.values()):
+            columna.append(valor)
+        indices.append(indice)
+    return list(grupos), columnas, indices
+
+def desempaquetar_registros(lote):
+    """Reconstruye en orden los registros de un lote creado con empaquetar_registros."""
+
+    llaves, columnas, indices = lote
+    filas = [zip(*grupo) for grupo in columnas]
+    return [dict(zip(llaves[indice], next(filas[indice]))) for indice in indices]
+
+def aplanar_objeto(objeto, fecha, tipo, salidas, filtro=None):
+    """Aplana los objetos del contenido JSON decodificado de una respuesta.
+    tipo indica si data son 'tweets' o 'users' y salidas es la lista de objetos
+    a aplanar: 'datos' y los tipos de includes. Si hay filtro, solo se aplanan
+    los objetos de data que lo cumplen. Regresa un dict con la lista de
+    registros de cada salida con objetos."""
+
+    includes = objeto.get('includes') or {}
+    procesar = {
+        "tweets": process_tweet,
+        "users": process_user,
+        "media": process_media,
+        "polls": process_poll,
+        "places": process_place,
+    }
+    registros = {}
+    for salida in salidas:
+        if salida == 'datos':
+            objetos, funcion = objeto.get('data'), procesar[tipo]
+            if filtro is not None and objetos:
+                objetos = [elemento for elemento in objetos if filtro(elemento)]
+        else:
+            objetos, funcion = includes.get(salida), procesar[salida]
+        if objetos:
+            registros[salida] = [funcion(elemento, fecha) for elemento in objetos]
+    return registros
+
+def aplanar_contenido(contenido, fecha, tipo, salidas, filtro=None):
+    """Decodifica el contenido en bytes de una respuesta y aplana sus objetos con
+    aplanar_objeto. Regresa un dict con un lote de empaquetar_registros por cada
+    salida con objetos.
+
+    Es la función que ejecutan los procesos de EtapaAplanado, por lo que debe
+    estar definida a nivel de módulo. Por lo mismo filtro debe poder
+    serializarse con pickle, como los filtros de twigy."""
+
+    registros = aplanar_objeto(json.loads(contenido), fecha, tipo, salidas, filtro)
+    return {salida: empaquetar_registros(lista) for salida, lista in registros.items()}
+
+class EtapaAplanado():
+    """Etapa de las funciones bulk que aplana las páginas y agrega los registros
+    a las listas de la recolección: data a lista_datos y cada tipo de includes a
+    su lista, si no es None. tipo indica si data son 'tweets' o 'users'.
+
+    Si procesos es None las páginas se aplanan en el proceso principal al
+    agregarlas. Si es un pool de concurrent.futures, el contenido en bytes de cada
+    página se envía a aplanar_contenido en el pool y los registros se agregan a
+    las listas en el orden de las páginas, con máximo pendientes páginas en
+    proceso, por default el doble de trabajadores, el número de procesos del
+    pool. Al terminar, o al salir del bloque with, se esperan las páginas
+    pendientes.
+
+    Después de agregar los registros de cada página se llama al método
+    fin_pagina de las listas que lo tengan, como los sinks de SinkBaseDatos, y
+    a la función avance, si la hay, con el token de la página siguiente.
+
+    Si se pasa un HidratadorReferencias, cada página se le pasa a observar al
+    agregarla y sus tweets de includes se agregan a las listas después de los
+    registros de la página. Si hay función avance, antes de llamarla se piden
+    todas las referencias pendientes, para que el token guardado nunca deje
+    atrás referencias sin pedir; sin avance se piden en bloques de 100 y el
+    resto al terminar. Al salir del bloque with por una excepción también se
+    piden las pendientes; si eso falla se muestra un mensaje y se conserva la
+    excepción original.
+
+    Si se pasa vistos, los objetos de data cuyo id ya está en vistos se
+    descartan y los nuevos se agregan a vistos. Con procesos los objetos
+    repetidos se aplanan en el pool pero no llegan a las listas."""
+
+    def __init__(self, procesos, tipo, lista_datos, lista_users=None, lista_media=None,
+                 lista_polls=None, lista_places=None, lista_tweets=None, pendientes=None,
+                 perfilador=None, vistos=None, avance=None, trabajadores=None, hidratador=None):
+        self.procesos = procesos
+        self.avance = avance
+        self.hidratador = hidratador
+        self.perfilador = perfilador
+        self._nuevos = FiltroNuevos(vistos) if vistos is not None else None
+        self.tipo = tipo
+        self.listas = {
+            "datos": lista_datos,
+            "users": lista_users,
+            "tweets": lista_tweets,
+            "media": lista_media,
+            "polls": lista_polls,
+            "places": lista_places,
+        }
+        self.salidas = [salida for salida, lista in self.listas.items() if lista is not None]
+        if pendientes is None:
+            pendientes = 2 * (trabajadores or os.cpu_count() or 1)
+        self.pendientes = pendientes
+        self._futuros = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        try:
+            self.terminar()
+        except Exception as error:
+            if valor is None:
+                raise
+            print("No se pudieron completar las páginas pendientes: {}".format(error))
+
+    def agregar(self, pagina):
+        """Aplana una página o la envía al pool de procesos."""
+
+        incluidos = None
+        if self.hidratador is not None:
+            incluidos = (self.hidratador.observar(pagina), pagina.fecha)
+        if len(self.salidas) == 0:
+            self._hidratar(incluidos)
+            self._avanzar(pagina.siguiente)
+            return
+        if self.procesos is None:
+            filtro = pagina.filtro
+            if self._nuevos is not None:
+                filtro = self._nuevos if filtro is None else FiltroTodos(filtro, self._nuevos)
+            with medir(self.perfilador, 'decodificacion', pagina.endpoint):
+                objeto = contenido_json(pagina.respuesta)
+            with medir(self.perfilador, 'aplanado', pagina.endpoint):
+                registros = aplanar_objeto(objeto, pagina.fecha, self.tipo, self.salidas, filtro)
+            self._escribir(registros, pagina.endpoint, pagina.siguiente, incluidos)
+            return
+
+        futuro = self.procesos.submit(aplanar_contenido, pagina.respuesta.content,
+                                      pagina.fecha, self.tipo, self.salidas, pagina.filtro)
+        self._futuros.append((futuro, pagina.endpoint, pagina.siguiente, incluidos))
+        while len(self._futuros) > self.pendientes or (self._futuros and self._futuros[0][0].done()):
+            self._entregar(*self._futuros.popleft())
+
+    def _entregar(self, futuro, endpoint, siguiente, incluidos):
+        with medir(self.perfilador, 'aplanado', endpoint):
+            registros = {salida: desempaquetar_registros(lote) for salida, lote in futuro.result().items()}
+            if self._nuevos is not None and 'datos' in registros:
+                registros['datos'] = [registro for registro in registros['datos'] if self._nuevos(registro)]
+        self._escribir(registros, endpoint, siguiente, incluidos)
+
+    def _escribir(self, registros, endpoint, siguiente, incluidos=None):
+        with medir(self.perfilador, 'sink', endpoint):
+            for salida, lista in registros.items():
+                destino = self.listas[salida]
+                for registro in lista:
+                    destino.append(registro)
+        self._hidratar(incluidos)
+        with medir(self.perfilador, 'sink', endpoint):
+            self._fin_pagina()
+        self._avanzar(siguiente)
+
+    def _hidratar(self, incluidos):
+        if incluidos is not None:
+            self.hidratador.entregar(*incluidos, vaciar=self.avance is not None)
+
+    def _avanzar(self, siguiente):
+        if self.avance is not None:
+            self.avance(siguiente)
+
+    def _fin_pagina(self):
+        for lista in self.listas.values():
+            fin_pagina = getattr(lista, 'fin_pagina', None)
+            if fin_pagina is not None:
+                fin_pagina()
+
+    def terminar(self):
+        """Espera las páginas pendientes y agrega sus registros a las listas.
+        Si hay un hidratador, pide después los objetos que le quedan pendientes."""
+
+        while self._futuros:
+            self._entregar(*self._futuros.popleft())
+        if self.hidratador is not None:
+            self.hidratador.terminar()
+            self._fin_pagina()
+
+def nombre_endpoint(url):
+    """Regresa el nombre genérico del endpoint al que corresponde url,
+    reemplazando los ids y usernames por {}. Por ejemplo, la url de la
+    petición de timeline de un usuario corresponde a 'users/{}/tweets'."""
+
+    if url.startswith(api_url):
+        url = url[len(api_url):]
+    if url.startswith('users/by/username/'):
+        return 'users/by/username/{}'
+    return '/'.join('{}' if parte.isdigit() else parte for parte in url.split('/'))
+
 def check_id(user_id):
     """Checa que la cadena user_id cumpla con 
     el patrón especificado para ids en la API de twitter '^[0-9]{1,19}$'"""
 
-    test = bool(re.match("^[0-9]{1,19}$", user_id))
+    test = bool(patron_id.match(user_id))
     if not test:
         raise Exception("El id no satisface el patrón especificado por la API de twitter '^[0-9]{1,19}$'")
 
@@ -1103,7 +2402,7 @@ def check_uname(username):
     """Checa que la cadena username cumpla con 
     el patrón especificado para usernames en la API de twitter '^[A-Za-z0-9_]{1,15}$'"""
 
-    test = bool(re.match("^[A-Za-z0-9_]{1,15}$", username))
+    test = bool(patron_uname.match(username))
     if not test:
         raise Exception("El id no satisface el patrón especificado por la API de twitter '^[A-Za-z0-9_]{1,15}$'")
 
@@ -1114,7 +2413,7 @@ def check_id_list(users_ids):
     if len(users_ids) > 100:
         raise Exception("El número de ids es mayor que 100")
 
-    users_ids_filtered = list(filter(lambda x: bool(re.match("^[0-9]{1,19}$", x)), users_ids))
+    users_ids_filtered = [x for x in users_ids if patron_id.match(x)]
 
     if len(users_ids_filtered) == 0:
         raise Exception("Ninguno de los ids satisface el patrón especificado por la API de twitter '^[0-9]{1,19}$'")
@@ -1131,7 +2430,7 @@ def check_uname_list(usernames):
     if len(usernames) > 100:
         raise Exception("El número de ids es mayor que 100")
 
-    usernames_filtered = list(filter(lambda x: bool(re.match("^[A-Za-z0-9_]{1,15}$", x)), usernames))
+    usernames_filtered = [x for x in usernames if patron_uname.match(x)]
 
     if len(usernames_filtered) == 0:
         raise Exception("Ninguno de los ids satisface el patrón especificado por la API de twitter '^[A-Za-z0-9_]{1,15}$'")
@@ -1141,6 +2440,119 @@ def check_uname_list(usernames):
 
     return usernames_filtered
 
+class ReporteValidacion():
+    """Resumen compacto de una validación en bloque de ids o usernames.
+    Guarda el total de elementos revisados, el número de válidos, el número de
+    rechazados por motivo y una muestra de los primeros rechazados junto con
+    su posición en la entrada."""
+
+    def __init__(self, tipo, muestra=10):
+        self.tipo = tipo
+        self.total = 0
+        self.validos = 0
+        self.rechazados = 0
+        self.duplicados = 0
+        self.motivos = {}
+        self.ejemplos = []
+        self._muestra = muestra
+
+    def rechazar(self, posicion, valor, motivo):
+        self.rechazados = self.rechazados + 1
+        self.motivos[motivo] = self.motivos.get(motivo, 0) + 1
+        if len(self.ejemplos) < self._muestra:
+            self.ejemplos.append((posicion, valor))
+
+    def __str__(self):
+        texto = "{} de {} {} no satisfacen el patrón especificado por la API de twitter".format(
+            self.rechazados, self.total, self.tipo)
+        if self.rechazados > 0:
+            texto = texto + " {}, ejemplos: {}".format(self.motivos, self.ejemplos)
+        return texto
+
+    def __repr__(self):
+        return "ReporteValidacion(total={}, validos={}, rechazados={}, duplicados={})".format(
+            self.total, self.validos, self.rechazados, self.duplicados)
+
+def validar_ids(ids, unicos=False, muestra=10):
+    """Valida en bloque un iterable de ids de cualquier tamaño, por ejemplo una lista,
+    un generador que lee un archivo o un array de NumPy.
+
+    A diferencia de check_id_list no tiene límite de 100 elementos y no emite warnings.
+    Las cadenas se revisan sin expresiones regulares y los enteros, incluyendo los
+    enteros de NumPy, se revisan por rango. Si unicos es True los ids repetidos se
+    descartan y se cuentan en el reporte.
+
+    Regresa la tupla (validos, reporte) donde validos es la lista de ids válidos como
+    cadenas, lista para pasarse a bulk_users o a las peticiones de 100 ids, y reporte
+    es un ReporteValidacion."""
+
+    validos = []
+    reporte = ReporteValidacion('ids', muestra)
+    vistos = set() if unicos else None
+    posicion = -1
+    for posicion, valor in enumerate(ids):
+        if isinstance(valor, str):
+            if not (len(valor) <= 19 and valor.isdigit() and valor.isascii()):
+                reporte.rechazar(posicion, valor, 'patron')
+                continue
+        elif isinstance(valor, bool):
+            reporte.rechazar(posicion, valor, 'tipo')
+            continue
+        else:
+            try:
+                entero = operator.index(valor)
+            except TypeError:
+                reporte.rechazar(posicion, valor, 'tipo')
+                continue
+            if not (0 <= entero < 10000000000000000000):
+                reporte.rechazar(posicion, valor, 'patron')
+                continue
+            valor = str(entero)
+        if vistos is not None:
+            if valor in vistos:
+                reporte.duplicados = reporte.duplicados + 1
+                continue
+            vistos.add(valor)
+        validos.append(valor)
+
+    reporte.total = posicion + 1
+    reporte.validos = len(validos)
+    return validos, reporte
+
+def validar_unames(usernames, unicos=False, muestra=10):
+    """Valida en bloque un iterable de usernames de cualquier tamaño.
+
+    A diferencia de check_uname_list no tiene límite de 100 elementos y no emite
+    warnings. Si unicos es True los usernames repetidos, sin distinguir mayúsculas,
+    se descartan y se cuentan en el reporte.
+
+    Regresa la tupla (validos, reporte) donde validos es la lista de usernames
+    válidos y reporte es un ReporteValidacion."""
+
+    validos = []
+    reporte = ReporteValidacion('usernames', muestra)
+    vistos = set() if unicos else None
+    posicion = -1
+    for posicion, valor in enumerate(usernames):
+        if not isinstance(valor, str):
+            reporte.rechazar(posicion, valor, 'tipo')
+            continue
+        sin_guiones = valor.replace('_', '')
+        if not (0 < len(valor) <= 15 and valor.isascii() and (sin_guiones == '' or sin_guiones.isalnum())):
+            reporte.rechazar(posicion, valor, 'patron')
+            continue
+        if vistos is not None:
+            llave = valor.lower()
+            if llave in vistos:
+                reporte.duplicados = reporte.duplicados + 1
+                continue
+            vistos.add(llave)
+        validos.append(valor)
+
+    reporte.total = posicion + 1
+    reporte.validos = len(validos)
+    return validos, reporte
+
 def process_user(user,date=None):
     """Procesa la información de un usuario entregando solamente info desanidada.
     El objetivo es obtener estructuras de datos que pueden procesarse en un DataFrame
@@ -1198,6 +2610,13 @@ def process_tweet(tweet,date=None):
     salida['in_reply_to_user_id'] = tweet.get('in_reply_to_user_id')
     salida['lang'] = tweet.get('lang')
     salida['source'] = tweet.get('source')
+    salida['retweeted_id'] = None
+    salida['quoted_id'] = None
+    salida['replied_to_id'] = None
+    for referencia in tweet.get('referenced_tweets') or []:
+        tipo = referencia.get('type')
+        if tipo in ('retweeted', 'quoted', 'replied_to'):
+            salida[tipo + '_id'] = referencia.get('id')
     salida['x'] = None
     salida['y'] = None
     geo = tweet.get('geo')
@@ -1229,6 +2648,27 @@ def tweets_to_list(tweets_list,lista,date=None):
         temp = process_tweet(tweet,date)
         lista.append(temp)
 
+def includes_to_lists(includes, date=None, lista_users=None, lista_media=None,
+                      lista_polls=None, lista_places=None, lista_tweets=None):
+    """Agrupa y procesa el objeto includes de una petición en las listas proporcionadas.
+    Cada tipo de objeto se agrega a su lista únicamente si la lista no es None.
+    
+    Tiene la capacidad de agregar una fecha a la info de cada objeto. Esta fecha
+    tiene como objetivo almacenar la fecha en la que se realizó la petición."""
+
+    if includes is None:
+        return
+    if lista_users is not None and includes.get('users') is not None:
+        users_to_list(includes['users'], lista_users, date)
+    if lista_tweets is not None and includes.get('tweets') is not None:
+        tweets_to_list(includes['tweets'], lista_tweets, date)
+    if lista_media is not None and includes.get('media') is not None:
+        media_to_list(includes['media'], lista_media, date)
+    if lista_polls is not None and includes.get('polls') is not None:
+        polls_to_list(includes['polls'], lista_polls, date)
+    if lista_places is not None and includes.get('places') is not None:
+        places_to_list(includes['places'], lista_places, date)
+
 def process_media(media,date=None):
     """Procesa la información de un media entregando solamente info desanidada.
     El objetivo es obtener estructuras de datos que pueden procesarse en un DataFrame
@@ -1333,3 +2773,3639 @@ def places_to_list(place_list,lista,date=None):
         temp = process_place(place,date)
         lista.append(temp)    
 
+esquema_tweets = {
+    "id": 'string',
+    "text": 'string',
+    "author_id": 'string',
+    "conversation_id": 'string',
+    "created_at": 'datetime64[ns, UTC]',
+    "in_reply_to_user_id": 'string',
+    "lang": 'category',
+    "source": 'category',
+    "retweeted_id": 'string',
+    "quoted_id": 'string',
+    "replied_to_id": 'string',
+    "x": 'float64',
+    "y": 'float64',
+    "retweet_count": 'Int64',
+    "reply_count": 'Int64',
+    "like_count": 'Int64',
+    "quote_count": 'Int64',
+    "fecha_peticion": 'datetime64[ns, UTC]',
+}
+
+esquema_users = {
+    "id": 'string',
+    "name": 'string',
+    "username": 'string',
+    "created_at": 'datetime64[ns, UTC]',
+    "description": 'string',
+    "location": 'string',
+    "pinned_tweet_id": 'string',
+    "protected": 'boolean',
+    "followers": 'Int64',
+    "following": 'Int64',
+    "tweets": 'Int64',
+    "listed": 'Int64',
+    "fecha_peticion": 'datetime64[ns, UTC]',
+}
+
+esquema_media = {
+    "media_key": 'string',
+    "type": 'category',
+    "duration_ms": 'Int64',
+    "view_count": 'Int64',
+    "fecha_peticion": 'datetime64[ns, UTC]',
+}
+
+esquema_polls = {
+    "id": 'string',
+    "duration_minutes": 'Int64',
+    "end_datetime": 'datetime64[ns, UTC]',
+    "voting_status": 'category',
+    "fecha_peticion": 'datetime64[ns, UTC]',
+}
+
+esquema_places = {
+    "id": 'string',
+    "full_name": 'string',
+    "name": 'string',
+    "country": 'category',
+    "country_code": 'category',
+    "place_type": 'category',
+    "fecha_peticion": 'datetime64[ns, UTC]',
+}
+
+esquemas = {
+    "tweets": esquema_tweets,
+    "users": esquema_users,
+    "media": esquema_media,
+    "polls": esquema_polls,
+    "places": esquema_places,
+}
+
+def _columna(pd, valores, dtype, n):
+    """Convierte una lista de valores, o un valor único para todas las filas, en una
+    Serie de pandas con el dtype indicado. Las fechas ISO se convierten de forma vectorizada."""
+
+    if dtype.startswith('datetime64'):
+        if not isinstance(valores, list):
+            return pd.Series(pd.Timestamp(valores) if valores is not None else pd.NaT,
+                             index=range(n), dtype=dtype)
+        try:
+            fechas = pd.to_datetime(valores, utc=True, format='ISO8601')
+        except (TypeError, ValueError):
+            fechas = pd.to_datetime(valores, utc=True)
+        return pd.Series(fechas).astype(dtype)
+    if not isinstance(valores, list):
+        valores = [valores] * n
+    return pd.Series(valores, dtype=dtype)
+
+def _columnas_polls(registros):
+    """Regresa las columnas label-N y votos-N presentes en una lista de polls procesados."""
+
+    extra = set()
+    for registro in registros:
+        extra.update(llave for llave in registro if llave.startswith('label-') or llave.startswith('votos-'))
+    return sorted(extra, key=lambda llave: (int(llave.split('-')[1]), llave))
+
+def lista_a_dataframe(lista, tipo):
+    """Convierte una lista de registros procesados con process_* en un DataFrame de pandas
+    con los tipos de dato fijos del esquema de tipo ('tweets', 'users', 'media', 'polls'
+    o 'places'), en lugar de dejar que pandas infiera el tipo de cada columna.
+
+    Las métricas son enteros que admiten nulos, lang y source son categóricas, x y y
+    son flotantes y created_at y fecha_peticion se convierten a fechas UTC de forma
+    vectorizada."""
+
+    import pandas as pd
+
+    esquema = dict(esquemas[tipo])
+    if tipo == 'polls':
+        for llave in _columnas_polls(lista):
+            esquema[llave] = 'string' if llave.startswith('label-') else 'Int64'
+
+    n = len(lista)
+    columnas = {}
+    for columna, dtype in esquema.items():
+        columnas[columna] = _columna(pd, [registro.get(columna) for registro in lista], dtype, n)
+    return pd.DataFrame(columnas, index=range(n))
+
+def _limpiar(serie):
+    return serie.str.replace('[\n\t\r]', ' ', regex=True)
+
+def tweets_a_dataframe(tweets, date=None):
+    """Construye directamente un DataFrame con el esquema de process_tweet a partir de
+    la lista de tweets de una respuesta, sin crear un dict intermedio por tweet.
+    date es la fecha de la petición, compartida por todas las filas de la página."""
+
+    import pandas as pd
+
+    n = len(tweets)
+    metricas = [tweet.get('public_metrics') or {} for tweet in tweets]
+    coordenadas = [((tweet.get('geo') or {}).get('coordinates') or {}).get('coordinates') for tweet in tweets]
+    referencias = [{referencia.get('type'): referencia.get('id')
+                    for referencia in tweet.get('referenced_tweets') or []} for tweet in tweets]
+
+    valores = {
+        "id": [tweet.get('id') for tweet in tweets],
+        "text": [tweet.get('text', '') for tweet in tweets],
+        "author_id": [tweet.get('author_id') for tweet in tweets],
+        "conversation_id": [tweet.get('conversation_id') for tweet in tweets],
+        "created_at": [tweet.get('created_at') for tweet in tweets],
+        "in_reply_to_user_id": [tweet.get('in_reply_to_user_id') for tweet in tweets],
+        "lang": [tweet.get('lang') for tweet in tweets],
+        "source": [tweet.get('source') for tweet in tweets],
+        "retweeted_id": [referencia.get('retweeted') for referencia in referencias],
+        "quoted_id": [referencia.get('quoted') for referencia in referencias],
+        "replied_to_id": [referencia.get('replied_to') for referencia in referencias],
+        "x": [coords[0] if coords is not None else None for coords in coordenadas],
+        "y": [coords[1] if coords is not None else None for coords in coordenadas],
+        "retweet_count": [metrica.get('retweet_count') for metrica in metricas],
+        "reply_count": [metrica.get('reply_count') for metrica in metricas],
+        "like_count": [metrica.get('like_count') for metrica in metricas],
+        "quote_count": [metrica.get('quote_count') for metrica in metricas],
+        "fecha_peticion": date,
+    }
+
+    columnas = {columna: _columna(pd, valores[columna], dtype, n) for columna, dtype in esquema_tweets.items()}
+    columnas['text'] = _limpiar(columnas['text'])
+    return pd.DataFrame(columnas, index=range(n))
+
+def users_a_dataframe(users, date=None):
+    """Construye directamente un DataFrame con el esquema de process_user a partir de
+    la lista de usuarios de una respuesta, sin crear un dict intermedio por usuario.
+    date es la fecha de la petición, compartida por todas las filas de la página."""
+
+    import pandas as pd
+
+    n = len(users)
+    metricas = [usuario.get('public_metrics') or {} for usuario in users]
+
+    valores = {
+        "id": [usuario.get('id') for usuario in users],
+        "name": [usuario.get('name', '') for usuario in users],
+        "username": [usuario.get('username', '') for usuario in users],
+        "created_at": [usuario.get('created_at') for usuario in users],
+        "description": [usuario.get('description', '') for usuario in users],
+        "location": [usuario.get('location', '') for usuario in users],
+        "pinned_tweet_id": [usuario.get('pinned_tweet_id') for usuario in users],
+        "protected": [usuario.get('protected') for usuario in users],
+        "followers": [metrica.get('followers_count') for metrica in metricas],
+        "following": [metrica.get('following_count') for metrica in metricas],
+        "tweets": [metrica.get('tweet_count') for metrica in metricas],
+        "listed": [metrica.get('listed_count') for metrica in metricas],
+        "fecha_peticion": date,
+    }
+
+    columnas = {columna: _columna(pd, valores[columna], dtype, n) for columna, dtype in esquema_users.items()}
+    for columna in ('name', 'username', 'description', 'location'):
+        columnas[columna] = _limpiar(columnas[columna])
+    return pd.DataFrame(columnas, index=range(n))
+
+def pagina_a_dataframes(pagina, date=None):
+    """Convierte una Pagina, o el contenido JSON de una respuesta, en un dict de
+    DataFrames con los esquemas fijos de twigy. Las llaves son 'tweets' o 'users'
+    para los objetos de data, según el endpoint, y los tipos de includes presentes.
+    Los tweets de includes se agregan en la llave 'tweets_includes' si data son tweets."""
+
+    if isinstance(pagina, Pagina):
+        datos, includes, date = pagina.datos, pagina.includes, pagina.fecha
+    else:
+        datos, includes = pagina.get('data'), pagina.get('includes')
+    includes = includes or {}
+
+    frames = {}
+    if datos:
+        if 'username' in datos[0]:
+            frames['users'] = users_a_dataframe(datos, date)
+        else:
+            frames['tweets'] = tweets_a_dataframe(datos, date)
+    if includes.get('tweets'):
+        llave = 'tweets_includes' if 'tweets' in frames else 'tweets'
+        frames[llave] = tweets_a_dataframe(includes['tweets'], date)
+    if includes.get('users') and 'users' not in frames:
+        frames['users'] = users_a_dataframe(includes['users'], date)
+    for tipo, procesar in (('media', process_media), ('polls', process_poll), ('places', process_place)):
+        if includes.get(tipo):
+            frames[tipo] = lista_a_dataframe([procesar(objeto, date) for objeto in includes[tipo]], tipo)
+    return frames
+
+def unir_dataframes(frames):
+    """Concatena DataFrames con el mismo esquema, por ejemplo los de varias páginas,
+    conservando las columnas categóricas."""
+
+    import pandas as pd
+
+    unido = pd.concat(frames, ignore_index=True)
+    for frame in frames[:1]:
+        for columna, dtype in frame.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) and not isinstance(unido[columna].dtype, pd.CategoricalDtype):
+                unido[columna] = unido[columna].astype('category')
+    return unido
+
+def _construir_csr(origen, destino):
+    """Construye la representación CSR (compressed sparse row) de un conjunto de aristas.
+    Recibe dos arreglos de ids de 64 bits de la misma longitud, la arista k va de
+    origen[k] a destino[k]. Las aristas repetidas se eliminan.
+
+    Regresa una tupla con los arreglos (nodos, ptr_salida, idx_salida, ptr_entrada, idx_entrada).
+    nodos es el arreglo ordenado de ids internados, los arreglos idx_* contienen posiciones
+    dentro de nodos y los arreglos ptr_* los límites de la vecindad de cada nodo."""
+
+    nodos = array('q', sorted(set(origen).union(destino)))
+    n = len(nodos)
+
+    origen_idx = array('q', [bisect_left(nodos, x) for x in origen])
+    destino_idx = array('q', [bisect_left(nodos, x) for x in destino])
+
+    grados = [0] * (n + 1)
+    for i in origen_idx:
+        grados[i + 1] += 1
+    for i in range(n):
+        grados[i + 1] += grados[i]
+    posiciones = grados[:]
+    vecinos = array('q', bytes(8 * len(origen_idx)))
+    for i, j in zip(origen_idx, destino_idx):
+        vecinos[posiciones[i]] = j
+        posiciones[i] += 1
+
+    ptr_salida = array('q', [0])
+    idx_salida = array('q')
+    for i in range(n):
+        segmento = sorted(set(vecinos[grados[i]:grados[i + 1]]))
+        idx_salida.extend(segmento)
+        ptr_salida.append(len(idx_salida))
+
+    grados = [0] * (n + 1)
+    for j in idx_salida:
+        grados[j + 1] += 1
+    for i in range(n):
+        grados[i + 1] += grados[i]
+    ptr_entrada = array('q', grados)
+    posiciones = grados[:]
+    idx_entrada = array('q', bytes(8 * len(idx_salida)))
+    for i in range(n):
+        for k in range(ptr_salida[i], ptr_salida[i + 1]):
+            j = idx_salida[k]
+            idx_entrada[posiciones[j]] = i
+            posiciones[j] += 1
+
+    return nodos, ptr_salida, idx_salida, ptr_entrada, idx_entrada
+
+def _copiar_enteros(parte):
+    """Copia a un array('q') un arreglo o una vista de memoria de enteros de 64 bits."""
+
+    copia = array('q')
+    copia.frombytes(memoryview(parte).cast('B'))
+    return copia
+
+def _combinar_filas(ptr, idx, ptr_nuevo, idx_nuevo, filas, posiciones):
+    """Combina las filas de una representación CSR con las de otra más pequeña.
+    idx ya contiene posiciones del arreglo de nodos combinado. Para cada nodo k de
+    la representación nueva, filas[k] es la tupla (i, existe) con su fila en la
+    existente, o la fila antes de la cual se inserta si no existe, y posiciones[k]
+    es su posición en los nodos combinados. Las filas que no cambian se copian
+    por bloques. Regresa los arreglos (ptr, idx) combinados."""
+
+    ptr_combinado = array('q', [0])
+    idx_combinado = array('q')
+    anterior = 0
+    for k, (i, existe) in enumerate(filas):
+        if i > anterior:
+            delta = len(idx_combinado) - ptr[anterior]
+            idx_combinado.extend(idx[ptr[anterior]:ptr[i]])
+            ptr_combinado.extend(p + delta for p in ptr[anterior + 1:i + 1])
+            anterior = i
+        fila = [posiciones[j] for j in idx_nuevo[ptr_nuevo[k]:ptr_nuevo[k + 1]]]
+        if existe:
+            fila = sorted(set(idx[ptr[i]:ptr[i + 1]]).union(fila))
+            anterior = i + 1
+        idx_combinado.extend(fila)
+        ptr_combinado.append(len(idx_combinado))
+    n = len(ptr) - 1
+    if n > anterior:
+        delta = len(idx_combinado) - ptr[anterior]
+        idx_combinado.extend(idx[ptr[anterior]:ptr[n]])
+        ptr_combinado.extend(p + delta for p in ptr[anterior + 1:n + 1])
+    return ptr_combinado, idx_combinado
+
+def _remapear(mapa, idx):
+    """Regresa un array('q') con mapa[j] para cada índice j de idx. Si NumPy
+    está instalado la conversión se hace en un solo paso vectorizado."""
+
+    if extras_disponibles(('numpy',))['numpy']:
+        import numpy as np
+
+        copia = array('q')
+        copia.frombytes(np.frombuffer(mapa, dtype=np.int64)[np.frombuffer(idx, dtype=np.int64)].tobytes())
+        return copia
+    return array('q', map(mapa.__getitem__, idx))
+
+def _combinar_csr(csr, origen, destino):
+    """Agrega aristas a una representación CSR. Las aristas nuevas se convierten
+    en una representación CSR propia y sus filas se combinan con las
+    existentes; el resto de las filas se copian por bloques.
+
+    El costo es O(E) en las aristas existentes: los arreglos de índices se
+    copian completos, y si aparecen nodos nuevos el índice de cada arista se
+    recalcula con _remapear, que sin NumPy recorre las aristas en Python.
+    Regresa una tupla con los mismos arreglos que _construir_csr."""
+
+    nodos, ptr_salida, idx_salida, ptr_entrada, idx_entrada = csr
+    nuevo = _construir_csr(origen, destino)
+    n = len(nodos)
+
+    filas = []
+    agregados = []
+    for x in nuevo[0]:
+        i = bisect_left(nodos, x)
+        existe = i < n and nodos[i] == x
+        filas.append((i, existe))
+        if not existe:
+            agregados.append(x)
+
+    if len(agregados) == 0:
+        combinados = _copiar_enteros(nodos)
+        posiciones = [i for i, existe in filas]
+        salida = _copiar_enteros(idx_salida)
+        entrada = _copiar_enteros(idx_entrada)
+    else:
+        combinados = array('q', sorted(nodos.tolist() + agregados))
+        mapa = array('q')
+        anterior = 0
+        for k, x in enumerate(agregados):
+            p = bisect_left(nodos, x)
+            mapa.extend(range(anterior + k, p + k))
+            anterior = p
+        mapa.extend(range(anterior + len(agregados), n + len(agregados)))
+        posiciones = [bisect_left(combinados, x) for x in nuevo[0]]
+        salida = _remapear(mapa, idx_salida)
+        entrada = _remapear(mapa, idx_entrada)
+
+    ptr_s, idx_s = _combinar_filas(ptr_salida, salida, nuevo[1], nuevo[2], filas, posiciones)
+    ptr_e, idx_e = _combinar_filas(ptr_entrada, entrada, nuevo[3], nuevo[4], filas, posiciones)
+    return combinados, ptr_s, idx_s, ptr_e, idx_e
+
+def _vecinos_csr(csr, user_id, salida):
+    """Regresa los ids vecinos de user_id en una representación CSR.
+    Si salida es True regresa los vecinos a los que apuntan sus aristas,
+    si es False los vecinos cuyas aristas apuntan hacia él."""
+
+    nodos, ptr_salida, idx_salida, ptr_entrada, idx_entrada = csr
+    i = bisect_left(nodos, user_id)
+    if i == len(nodos) or nodos[i] != user_id:
+        return []
+    if salida:
+        ptr, idx = ptr_salida, idx_salida
+    else:
+        ptr, idx = ptr_entrada, idx_entrada
+    return [nodos[j] for j in idx[ptr[i]:ptr[i + 1]]]
+
+class GrafoSeguidores():
+    """Almacén compacto de las relaciones de seguimiento entre usuarios.
+
+    Una arista (a, b) indica que el usuario a sigue al usuario b. Las aristas
+    se guardan como arreglos de enteros de 64 bits en lugar de dicts por usuario
+    y al guardarse los ids se internan en un arreglo ordenado de nodos, de tal
+    forma que cada id se almacena una sola vez.
+
+    El grafo se persiste en un archivo con formato CSR que se abre con mmap, por
+    lo que es posible consultar grafos con millones de aristas sin cargarlos en
+    memoria. Al guardar, las aristas nuevas se combinan con las existentes en el
+    archivo, esto permite acumular en un mismo grafo la información de muchas
+    cuentas semilla recolectadas en distintas ejecuciones.
+
+    Se pueden agregar aristas y consultar el grafo desde otros hilos mientras se
+    guarda: la combinación con el archivo se hace fuera del lock y las aristas
+    agregadas durante ella quedan pendientes para el siguiente guardado.
+
+    El archivo usa el orden de bytes de la máquina que lo escribió."""
+
+    _magia = b'TWIGYCSR'
+    _encabezado = struct.Struct('=8sqq')
+
+    def __init__(self, ruta=None):
+        """Crea un grafo vacío. Si ruta apunta a un archivo existente el grafo
+        guardado en él se abre y sus aristas quedan disponibles para consulta."""
+
+        self._lock = threading.RLock()
+        self._guardando = threading.Lock()
+        self.ruta = ruta
+        self._origen = array('q')
+        self._destino = array('q')
+        self._pendiente = None
+        self._base = None
+        self._vistas = []
+        self._archivo = None
+        self._mapa = None
+
+        if ruta is not None and os.path.exists(ruta):
+            self._abrir(ruta)
+
+    def _abrir(self, ruta):
+        """Abre con mmap un grafo guardado en formato CSR."""
+
+        self._archivo = open(ruta, 'rb')
+        self._mapa = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, n, m = self._encabezado.unpack_from(self._mapa, 0)
+        if magia != self._magia:
+            self.cerrar()
+            raise Exception("El archivo {} no contiene un grafo de twigy".format(ruta))
+
+        crudo = memoryview(self._mapa)
+        vista = crudo[self._encabezado.size:].cast('q')
+        tamanos = [n, n + 1, m, n + 1, m]
+        partes = []
+        inicio = 0
+        for tamano in tamanos:
+            partes.append(vista[inicio:inicio + tamano])
+            inicio = inicio + tamano
+        self._base = tuple(partes)
+        self._vistas = partes + [vista, crudo]
+
+    def cerrar(self):
+        """Libera el archivo abierto con mmap."""
+
+        with self._lock:
+            self._base = None
+            for vista in self._vistas:
+                vista.release()
+            self._vistas = []
+            if self._mapa is not None:
+                self._mapa.close()
+                self._mapa = None
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+    def agregar_seguidores(self, user_id, ids):
+        """Agrega las aristas correspondientes a los usuarios en ids que siguen a user_id."""
+
+        destino = int(user_id)
+        origen = array('q', (int(x) for x in ids))
+        with self._lock:
+            self._origen.extend(origen)
+            self._destino.extend(destino for x in origen)
+            self._pendiente = None
+
+    def agregar_seguidos(self, user_id, ids):
+        """Agrega las aristas correspondientes a los usuarios en ids seguidos por user_id."""
+
+        origen = int(user_id)
+        destino = array('q', (int(x) for x in ids))
+        with self._lock:
+            self._destino.extend(destino)
+            self._origen.extend(origen for x in destino)
+            self._pendiente = None
+
+    def _vecinos(self, user_id, salida):
+        """Combina los vecinos de user_id en el archivo y en las aristas aún no guardadas."""
+
+        user_id = int(user_id)
+        with self._lock:
+            resultado = []
+            if self._base is not None:
+                resultado = _vecinos_csr(self._base, user_id, salida)
+            if len(self._origen) > 0:
+                if self._pendiente is None:
+                    self._pendiente = _construir_csr(self._origen, self._destino)
+                nuevos = _vecinos_csr(self._pendiente, user_id, salida)
+                if len(nuevos) > 0:
+                    resultado = sorted(set(resultado).union(nuevos))
+            return array('q', resultado)
+
+    def seguidores(self, user_id):
+        """Regresa un arreglo ordenado con los ids de los usuarios que siguen a user_id."""
+
+        return self._vecinos(user_id, False)
+
+    def seguidos(self, user_id):
+        """Regresa un arreglo ordenado con los ids de los usuarios a los que sigue user_id."""
+
+        return self._vecinos(user_id, True)
+
+    def num_nodos(self):
+        """Número de usuarios en el archivo del grafo, no incluye aristas aún no guardadas."""
+
+        with self._lock:
+            if self._base is None:
+                return 0
+            return len(self._base[0])
+
+    def num_aristas(self):
+        """Número de aristas en el archivo del grafo, no incluye aristas aún no guardadas."""
+
+        with self._lock:
+            if self._base is None:
+                return 0
+            return len(self._base[2])
+
+    def guardar(self, ruta=None):
+        """Guarda el grafo en formato CSR combinando las aristas del archivo
+        existente con las agregadas desde la última vez que se guardó.
+        Si no se indica ruta se usa la ruta con la que se creó el grafo.
+
+        Las aristas nuevas se combinan con el CSR existente con _combinar_csr:
+        las filas de los nodos sin aristas nuevas se copian por bloques, pero el
+        archivo se reescribe completo y el costo es O(E) en las aristas del
+        grafo. Si las aristas nuevas traen nodos que no estaban en el archivo,
+        los índices de todas las aristas se recalculan, lo que es mucho más
+        rápido con NumPy instalado. Si no hay aristas nuevas y la ruta es la
+        misma no se escribe."""
+
+        if ruta is None:
+            ruta = self.ruta
+        if ruta is None:
+            raise Exception("Es necesario indicar la ruta en donde se guardará el grafo")
+
+        with self._guardando:
+            with self._lock:
+                n = len(self._origen)
+                origen = self._origen[:n]
+                destino = self._destino[:n]
+                base = self._base
+            if base is None:
+                csr = _construir_csr(origen, destino)
+            elif n > 0:
+                csr = _combinar_csr(base, origen, destino)
+            elif ruta == self.ruta:
+                return
+            else:
+                csr = base
+            temporal = ruta + '.tmp'
+            with open(temporal, 'wb') as archivo:
+                archivo.write(self._encabezado.pack(self._magia, len(csr[0]), len(csr[2])))
+                for parte in csr:
+                    archivo.write(parte)
+            csr = base = None
+
+            with self._lock:
+                self.cerrar()
+                os.replace(temporal, ruta)
+                self.ruta = ruta
+                del self._origen[:n]
+                del self._destino[:n]
+                self._pendiente = None
+                self._abrir(ruta)
+
+def diferencia_ids(anterior, actual):
+    """Compara dos arreglos ordenados de ids sin repetidos mediante un merge-join
+    en tiempo lineal. Regresa la tupla (ganados, perdidos) donde ganados son los
+    ids que están en actual pero no en anterior y perdidos los que están en
+    anterior pero no en actual."""
+
+    ganados = array('q')
+    perdidos = array('q')
+    i = 0
+    j = 0
+    n = len(anterior)
+    m = len(actual)
+    while i < n and j < m:
+        a = anterior[i]
+        b = actual[j]
+        if a == b:
+            i = i + 1
+            j = j + 1
+        elif a < b:
+            perdidos.append(a)
+            i = i + 1
+        else:
+            ganados.append(b)
+            j = j + 1
+    perdidos.extend(anterior[i:])
+    ganados.extend(actual[j:])
+    return ganados, perdidos
+
+campos_cambio = {
+    "bulk_timeline": ('tweets',),
+    "bulk_followers": ('followers',),
+    "bulk_following": ('following',),
+}
+
+class MetricasUsuarios():
+    """Almacena las métricas públicas (tweets, followers, following y listed)
+    que tenían los usuarios la última vez que se recolectaron.
+
+    Se guarda en un archivo binario con un registro de cinco enteros de 64 bits
+    por usuario, de modo que cargar las métricas de decenas de miles de cuentas
+    es inmediato. Las métricas ausentes se guardan como -1. Los usuarios se
+    identifican por su id y las métricas se comparan con los registros de
+    process_user. registrar y guardar están protegidos con un lock para que
+    las métricas puedan guardarse mientras otros hilos las registran."""
+
+    _magia = b'TWIGYMET'
+    _encabezado = struct.Struct('=8sq')
+    campos = ('tweets', 'followers', 'following', 'listed')
+
+    def __init__(self, ruta):
+        """Carga las métricas guardadas en ruta, si el archivo existe."""
+
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._datos = {}
+        if os.path.exists(ruta):
+            self._cargar()
+
+    def _cargar(self):
+        with open(self.ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        magia, n = self._encabezado.unpack_from(contenido)
+        if magia != self._magia:
+            raise Exception("El archivo {} no es un archivo de métricas de twigy".format(self.ruta))
+        valores = array('q')
+        valores.frombytes(contenido[self._encabezado.size:])
+        ancho = len(self.campos) + 1
+        for k in range(0, n * ancho, ancho):
+            self._datos[valores[k]] = tuple(valores[k + 1:k + ancho])
+
+    def __len__(self):
+        return len(self._datos)
+
+    def __contains__(self, user_id):
+        return int(user_id) in self._datos
+
+    def anteriores(self, user_id):
+        """Regresa un dict con las métricas guardadas de user_id o None si no existen."""
+
+        valores = self._datos.get(int(user_id))
+        if valores is None:
+            return None
+        return {campo: (None if valor < 0 else valor) for campo, valor in zip(self.campos, valores)}
+
+    def cambio(self, usuario, campos=('tweets',)):
+        """Indica si alguno de los campos del registro usuario es distinto al guardado,
+        o si el usuario no tiene métricas guardadas."""
+
+        valores = self._datos.get(int(usuario['id']))
+        if valores is None:
+            return True
+        for campo in campos:
+            valor = usuario.get(campo)
+            if (-1 if valor is None else valor) != valores[self.campos.index(campo)]:
+                return True
+        return False
+
+    def registrar(self, usuario):
+        """Guarda en memoria las métricas del registro usuario."""
+
+        metricas = tuple(-1 if usuario.get(campo) is None else usuario[campo] for campo in self.campos)
+        with self._lock:
+            self._datos[int(usuario['id'])] = metricas
+
+    def guardar(self):
+        """Escribe las métricas en el archivo de forma atómica."""
+
+        valores = array('q')
+        with self._lock:
+            for user_id, metricas in self._datos.items():
+                valores.append(user_id)
+                valores.extend(metricas)
+            n = len(self._datos)
+        with open(self.ruta + '.tmp', 'wb') as archivo:
+            archivo.write(self._encabezado.pack(self._magia, n))
+            archivo.write(valores.tobytes())
+        os.replace(self.ruta + '.tmp', self.ruta)
+
+class SnapshotsSeguidores():
+    """Almacena snapshots de los ids de los seguidores de una o varias cuentas.
+
+    Cada snapshot se guarda en el directorio indicado como un archivo con los ids
+    ordenados y sin repetidos, codificados como diferencias entre ids consecutivos
+    y comprimidos con zlib, junto con la fecha en la que se tomó. Los snapshots de
+    una misma cuenta se identifican por la clave con la que se guardan, usualmente
+    el user_id de la cuenta."""
+
+    _magia = b'TWIGYSNP'
+    _encabezado = struct.Struct('=8sdq')
+    _formato_fecha = '%Y%m%dT%H%M%S%fZ'
+
+    def __init__(self, directorio):
+        """Crea el almacén de snapshots en directorio, si no existe se crea."""
+
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave, fecha):
+        fecha = fecha.astimezone(timezone.utc)
+        nombre = '{}_{}.snap'.format(clave, fecha.strftime(self._formato_fecha))
+        return os.path.join(self.directorio, nombre)
+
+    def guardar(self, clave, ids, fecha=None):
+        """Guarda un snapshot con los ids proporcionados. Los ids pueden ser
+        cadenas o enteros en cualquier orden. Si no se proporciona fecha se usa
+        la fecha actual; una fecha sin zona horaria se interpreta como hora local.
+        Regresa la fecha del snapshot en UTC."""
+
+        if fecha is None:
+            fecha = datetime.now(timezone.utc)
+        fecha = fecha.astimezone(timezone.utc)
+
+        ordenados = array('q', sorted(set(int(x) for x in ids)))
+        deltas = array('q', ordenados)
+        for k in range(len(deltas) - 1, 0, -1):
+            deltas[k] = deltas[k] - deltas[k - 1]
+
+        ruta = self._ruta(clave, fecha)
+        with open(ruta + '.tmp', 'wb') as archivo:
+            archivo.write(self._encabezado.pack(self._magia, fecha.timestamp(), len(ordenados)))
+            archivo.write(zlib.compress(deltas.tobytes(), 6))
+        os.replace(ruta + '.tmp', ruta)
+        return fecha
+
+    def listar(self, clave):
+        """Regresa la lista ordenada de las fechas de los snapshots de clave."""
+
+        prefijo = '{}_'.format(clave)
+        fechas = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith(prefijo) and nombre.endswith('.snap'):
+                texto = nombre[len(prefijo):-len('.snap')]
+                fecha = datetime.strptime(texto, self._formato_fecha)
+                fechas.append(fecha.replace(tzinfo=timezone.utc))
+        return sorted(fechas)
+
+    def cargar(self, clave, fecha=None):
+        """Regresa el arreglo ordenado de ids del snapshot de clave tomado en fecha.
+        Si no se proporciona fecha se regresa el snapshot más reciente."""
+
+        if fecha is None:
+            fechas = self.listar(clave)
+            if len(fechas) == 0:
+                raise Exception("No hay snapshots guardados para {}".format(clave))
+            fecha = fechas[-1]
+
+        with open(self._ruta(clave, fecha), 'rb') as archivo:
+            contenido = archivo.read()
+
+        magia, marca, n = self._encabezado.unpack_from(contenido, 0)
+        if magia != self._magia:
+            raise Exception("El archivo no contiene un snapshot de twigy")
+
+        ids = array('q')
+        ids.frombytes(zlib.decompress(contenido[self._encabezado.size:]))
+        for k in range(1, n):
+            ids[k] = ids[k] + ids[k - 1]
+        return ids
+
+endpoints_cap = ('users/{}/tweets', 'users/{}/mentions', 'users/{}/liked_tweets', 'tweets/search/recent')
+
+_mascara64 = (1 << 64) - 1
+
+def _mezclar(x):
+    """Mezcla los bits de un entero de 64 bits (splitmix64) para usarlo como hash."""
+
+    x = (x + 0x9E3779B97F4A7C15) & _mascara64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _mascara64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _mascara64
+    return x ^ (x >> 31)
+
+class ConjuntoIds():
+    """Conjunto compacto de ids de tweets o usuarios.
+
+    Los ids se guardan como enteros de 64 bits en una tabla hash de
+    direccionamiento abierto sobre un array, entre 12 y 24 bytes por id en
+    lugar de los más de 100 bytes por id de un set de cadenas. Es exacto: no
+    tiene falsos positivos.
+
+    El conjunto puede guardarse en un archivo con guardar; si ruta apunta a un
+    archivo existente, el conjunto guardado se carga al crearlo. agregar está
+    protegido con un lock para que varios hilos puedan compartir el conjunto."""
+
+    _magia = b'TWIGYSET'
+    _encabezado = struct.Struct('=8sqqq')
+
+    def __init__(self, ruta=None, capacidad=1024):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._n = 0
+        self._cero = False
+        tamano = 16
+        while tamano * 7 < capacidad * 10:
+            tamano = tamano * 2
+        self._tabla = array('q', [0]) * tamano
+
+        if ruta is not None and os.path.exists(ruta):
+            self._cargar(ruta)
+
+    def _cargar(self, ruta):
+        with open(ruta, 'rb') as archivo:
+            magia, n, tamano, cero = self._encabezado.unpack(archivo.read(self._encabezado.size))
+            if magia != self._magia:
+                raise Exception("El archivo {} no contiene un conjunto de ids de twigy".format(ruta))
+            tabla = array('q')
+            tabla.fromfile(archivo, tamano)
+        self._tabla = tabla
+        self._n = n
+        self._cero = bool(cero)
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, valor):
+        valor = int(valor)
+        if valor == 0:
+            return self._cero
+        tabla = self._tabla
+        mascara = len(tabla) - 1
+        i = _mezclar(valor) & mascara
+        while True:
+            actual = tabla[i]
+            if actual == valor:
+                return True
+            if actual == 0:
+                return False
+            i = (i + 1) & mascara
+
+    def _crecer(self, cantidad=1):
+        anterior = self._tabla
+        tamano = len(anterior) * 2
+        while tamano * 7 < (self._n + cantidad) * 10:
+            tamano = tamano * 2
+        tabla = array('q', [0]) * tamano
+        mascara = len(tabla) - 1
+        for valor in anterior:
+            if valor != 0:
+                i = _mezclar(valor) & mascara
+                while tabla[i] != 0:
+                    i = (i + 1) & mascara
+                tabla[i] = valor
+        self._tabla = tabla
+
+    def agregar(self, valor):
+        """Agrega un id. Regresa True si el id no estaba en el conjunto."""
+
+        with self._lock:
+            return self._agregar(int(valor))
+
+    def _agregar(self, valor):
+        if valor == 0:
+            nuevo = not self._cero
+            self._cero = True
+            self._n = self._n + nuevo
+            return nuevo
+        if (self._n + 1) * 10 > len(self._tabla) * 7:
+            self._crecer()
+        tabla = self._tabla
+        mascara = len(tabla) - 1
+        i = _mezclar(valor) & mascara
+        while True:
+            actual = tabla[i]
+            if actual == valor:
+                return False
+            if actual == 0:
+                tabla[i] = valor
+                self._n = self._n + 1
+                return True
+            i = (i + 1) & mascara
+
+    def agregar_varios(self, valores):
+        """Agrega varios ids tomando el lock una sola vez para todo el lote.
+        Regresa el número de ids nuevos."""
+
+        nuevos = 0
+        with self._lock:
+            if hasattr(valores, '__len__') and (self._n + len(valores)) * 10 > len(self._tabla) * 7:
+                self._crecer(len(valores))
+            tabla = self._tabla
+            mascara = len(tabla) - 1
+            maximo = len(tabla) * 7 // 10
+            for valor in valores:
+                valor = int(valor)
+                if valor == 0 or self._n >= maximo:
+                    if self._agregar(valor):
+                        nuevos = nuevos + 1
+                    tabla = self._tabla
+                    mascara = len(tabla) - 1
+                    maximo = len(tabla) * 7 // 10
+                    continue
+                # _mezclar en línea para no hacer una llamada por id
+                x = (valor + 0x9E3779B97F4A7C15) & _mascara64
+                x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _mascara64
+                x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _mascara64
+                i = (x ^ (x >> 31)) & mascara
+                while True:
+                    actual = tabla[i]
+                    if actual == valor:
+                        break
+                    if actual == 0:
+                        tabla[i] = valor
+                        self._n = self._n + 1
+                        nuevos = nuevos + 1
+                        break
+                    i = (i + 1) & mascara
+        return nuevos
+
+    def guardar(self, ruta=None):
+        """Guarda el conjunto en ruta, o en la ruta con la que se creó."""
+
+        if ruta is None:
+            ruta = self.ruta
+        if ruta is None:
+            raise Exception("Es necesario indicar la ruta en donde se guardará el conjunto")
+        with self._lock:
+            with open(ruta + '.tmp', 'wb') as archivo:
+                archivo.write(self._encabezado.pack(self._magia, self._n, len(self._tabla), self._cero))
+                self._tabla.tofile(archivo)
+        os.replace(ruta + '.tmp', ruta)
+        self.ruta = ruta
+
+class ConjuntoBloom():
+    """Conjunto aproximado de ids con memoria acotada: un filtro de Bloom escalable.
+
+    Puede tener falsos positivos, es decir indicar que un id está en el conjunto
+    sin haberse agregado, con probabilidad máxima error, pero nunca falsos
+    negativos. Cada filtro usa alrededor de 1.8 bytes por id de capacidad con
+    error de 0.001, sin importar el tamaño de los ids. Empieza con un filtro para capacidad ids y
+    cuando se llena agrega otro filtro con el doble de capacidad y la mitad del
+    error, de forma que no es necesario conocer de antemano el número de ids.
+
+    Al usarlo para descartar tweets ya vistos, un falso positivo descarta un
+    tweet nuevo. Se guarda y carga igual que ConjuntoIds."""
+
+    _magia = b'TWIGYBLM'
+    _encabezado = struct.Struct('=8sqdq')
+    _encabezado_capa = struct.Struct('=qqqq')
+
+    def __init__(self, ruta=None, capacidad=1000000, error=0.001):
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.error = error
+        self._lock = threading.Lock()
+        self._capas = []
+
+        if ruta is not None and os.path.exists(ruta):
+            self._cargar(ruta)
+        else:
+            self._nueva_capa()
+
+    def _nueva_capa(self):
+        numero = len(self._capas)
+        capacidad = self.capacidad * 2 ** numero
+        error = self.error * 0.5 ** (numero + 1)
+        bits = int(math.ceil(-capacidad * math.log(error) / math.log(2) ** 2))
+        hashes = max(1, int(round(bits / capacidad * math.log(2))))
+        self._capas.append([bytearray((bits + 7) // 8), bits, hashes, capacidad, 0])
+
+    def _cargar(self, ruta):
+        with open(ruta, 'rb') as archivo:
+            magia, capacidad, error, capas = self._encabezado.unpack(archivo.read(self._encabezado.size))
+            if magia != self._magia:
+                raise Exception("El archivo {} no contiene un filtro de Bloom de twigy".format(ruta))
+            self.capacidad = capacidad
+            self.error = error
+            for k in range(capas):
+                bits, hashes, capacidad_capa, n = self._encabezado_capa.unpack(
+                    archivo.read(self._encabezado_capa.size))
+                self._capas.append([bytearray(archivo.read((bits + 7) // 8)), bits, hashes, capacidad_capa, n])
+
+    def __len__(self):
+        return sum(capa[4] for capa in self._capas)
+
+    def _hashes(self, valor):
+        h1 = _mezclar(int(valor))
+        return h1, _mezclar(h1) | 1
+
+    def _en_capa(self, capa, h1, h2):
+        arreglo, bits = capa[0], capa[1]
+        for j in range(capa[2]):
+            posicion = (h1 + j * h2) % bits
+            if not arreglo[posicion >> 3] & (1 << (posicion & 7)):
+                return False
+        return True
+
+    def __contains__(self, valor):
+        h1, h2 = self._hashes(valor)
+        for capa in self._capas:
+            if self._en_capa(capa, h1, h2):
+                return True
+        return False
+
+    def agregar(self, valor):
+        """Agrega un id. Regresa True si el id no estaba, o no parecía estar, en el conjunto."""
+
+        h1, h2 = self._hashes(valor)
+        with self._lock:
+            return self._agregar(h1, h2)
+
+    def _agregar(self, h1, h2):
+        for capa in self._capas:
+            if self._en_capa(capa, h1, h2):
+                return False
+        capa = self._capas[-1]
+        if capa[4] >= capa[3]:
+            self._nueva_capa()
+            capa = self._capas[-1]
+        arreglo, bits = capa[0], capa[1]
+        for j in range(capa[2]):
+            posicion = (h1 + j * h2) % bits
+            arreglo[posicion >> 3] |= 1 << (posicion & 7)
+        capa[4] = capa[4] + 1
+        return True
+
+    def agregar_varios(self, valores):
+        """Agrega varios ids tomando el lock una sola vez para todo el lote.
+        Regresa el número de ids nuevos."""
+
+        nuevos = 0
+        with self._lock:
+            agregar, hashes = self._agregar, self._hashes
+            for valor in valores:
+                nuevos = nuevos + agregar(*hashes(valor))
+        return nuevos
+
+    def guardar(self, ruta=None):
+        """Guarda el filtro en ruta, o en la ruta con la que se creó."""
+
+        if ruta is None:
+            ruta = self.ruta
+        if ruta is None:
+            raise Exception("Es necesario indicar la ruta en donde se guardará el filtro")
+        with self._lock:
+            with open(ruta + '.tmp', 'wb') as archivo:
+                archivo.write(self._encabezado.pack(self._magia, self.capacidad, self.error, len(self._capas)))
+                for arreglo, bits, hashes, capacidad, n in self._capas:
+                    archivo.write(self._encabezado_capa.pack(bits, hashes, capacidad, n))
+                    archivo.write(arreglo)
+        os.replace(ruta + '.tmp', ruta)
+        self.ruta = ruta
+
+class Presupuesto():
+    """Número máximo de tweets del cap que pueden consumir una o varias recolecciones.
+    Un mismo Presupuesto puede compartirse entre varias funciones bulk, incluso en
+    distintos hilos, para limitar el consumo total de un trabajo."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.consumidos = 0
+        self.reservados = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, n):
+        """Reserva n tweets antes de una petición si hay presupuesto suficiente.
+        Regresa True si la reserva se hizo."""
+
+        with self._lock:
+            if self.maximo - self.consumidos - self.reservados < n:
+                return False
+            self.reservados = self.reservados + n
+            return True
+
+    def liberar(self, n):
+        """Libera una reserva hecha con reservar."""
+
+        with self._lock:
+            self.reservados = max(self.reservados - n, 0)
+
+    def consumir(self, n):
+        with self._lock:
+            self.consumidos = self.consumidos + n
+
+    def disponible(self):
+        return self.maximo - self.consumidos - self.reservados
+
+def como_presupuesto(presupuesto):
+    """Convierte un número en un Presupuesto, None y los Presupuesto se regresan igual."""
+
+    if presupuesto is None or isinstance(presupuesto, Presupuesto):
+        return presupuesto
+    return Presupuesto(presupuesto)
+
+class LibroCap():
+    """Registro persistente de los tweets consumidos del cap mensual del proyecto.
+
+    La API de twitter limita el número de tweets que un proyecto puede obtener
+    al mes (500,000 con una cuenta standard). El libro guarda en un archivo JSON
+    los tweets regresados por los endpoints que consumen el cap, separados por
+    endpoint, y reinicia la cuenta cada mes en el día dia_reinicio, que debe
+    coincidir con el día de reinicio del proyecto en el portal de developer.
+
+    El archivo se bloquea en cada registro, de modo que varios procesos pueden
+    compartir el mismo libro. Para no leer el archivo antes de cada página, la
+    cuenta del periodo se conserva en memoria durante vigencia segundos; los
+    registros de este proceso la actualizan de inmediato, pero los de otros
+    procesos pueden tardar hasta vigencia segundos en verse."""
+
+    def __init__(self, ruta, cap=500000, dia_reinicio=1, vigencia=1.0):
+        self.ruta = ruta
+        self.cap = cap
+        self.dia_reinicio = dia_reinicio
+        self.vigencia = vigencia
+        self._lock = threading.Lock()
+        self._cache = None
+
+    def periodo(self, fecha=None):
+        """Regresa el identificador 'AAAA-MM' del periodo de facturación de fecha."""
+
+        if fecha is None:
+            fecha = datetime.now(timezone.utc)
+        anio, mes = fecha.year, fecha.month
+        if fecha.day < self.dia_reinicio:
+            mes = mes - 1
+            if mes == 0:
+                anio, mes = anio - 1, 12
+        return '{:04d}-{:02d}'.format(anio, mes)
+
+    def _leer(self):
+        periodo = self.periodo()
+        datos = {"periodo": periodo, "consumidos": 0, "por_endpoint": {}}
+        if os.path.exists(self.ruta):
+            with open(self.ruta, encoding='utf-8') as archivo:
+                guardados = json.load(archivo)
+            if guardados.get('periodo') == periodo:
+                datos = guardados
+        return datos
+
+    def _bloquear(self, archivo):
+        try:
+            import fcntl
+        except ImportError:
+            return
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+
+    def registrar(self, n, endpoint=None):
+        """Suma n tweets consumidos al periodo actual."""
+
+        with self._lock:
+            with open(self.ruta + '.lock', 'a') as candado:
+                self._bloquear(candado)
+                datos = self._leer()
+                datos['consumidos'] = datos['consumidos'] + n
+                if endpoint is not None:
+                    datos['por_endpoint'][endpoint] = datos['por_endpoint'].get(endpoint, 0) + n
+                with open(self.ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+                    json.dump(datos, archivo)
+                os.replace(self.ruta + '.tmp', self.ruta)
+                self._cache = (datos['periodo'], datos['consumidos'], time.monotonic())
+
+    def consumidos(self):
+        """Número de tweets consumidos en el periodo actual."""
+
+        periodo = self.periodo()
+        cache = self._cache
+        if cache is not None and cache[0] == periodo and time.monotonic() - cache[2] < self.vigencia:
+            return cache[1]
+        consumidos = self._leer()['consumidos']
+        self._cache = (periodo, consumidos, time.monotonic())
+        return consumidos
+
+    def restante(self):
+        """Número de tweets que quedan en el cap del periodo actual."""
+
+        return self.cap - self.consumidos()
+
+class ListaEtiquetada():
+    """Envuelve una lista o un sink para agregar a cada registro la llave con el
+    valor indicado antes de agregarlo, por ejemplo el query que lo obtuvo."""
+
+    def __init__(self, lista, llave, valor):
+        self.lista = lista
+        self.llave = llave
+        self.valor = valor
+
+    def append(self, registro):
+        registro[self.llave] = self.valor
+        self.lista.append(registro)
+
+    def __len__(self):
+        return len(self.lista)
+
+    def fin_pagina(self):
+        fin_pagina = getattr(self.lista, 'fin_pagina', None)
+        if fin_pagina is not None:
+            fin_pagina()
+
+class Vigilante():
+    """Vigila continuamente varios queries con el endpoint recent_search.
+
+    Cada query se consulta únicamente por los tweets posteriores al since_id de
+    su consulta anterior. La primera consulta de un query obtiene solo la página
+    más reciente; las siguientes siguen la paginación hasta obtener todos los
+    tweets nuevos. Los tweets se agregan a lista_tweets con la llave query y los
+    objetos de includes a las listas opcionales, como en bulk_recent_search.
+
+    Los queries se consultan por turnos, con las peticiones espaciadas para no
+    exceder limite peticiones por ventana segundos del endpoint (450 cada 15
+    minutos). El intervalo entre consultas de cada query se adapta a su tasa de
+    tweets nuevos, estimada con un promedio exponencial con peso alfa: se busca
+    obtener alrededor de objetivo tweets por consulta, con un intervalo entre
+    intervalo_min e intervalo_max segundos. Así los queries activos se consultan
+    seguido y los inactivos rara vez.
+
+    Si se indica ruta_estado, el since_id y la tasa de cada query se guardan en
+    ese archivo JSON después de cada consulta, y se cargan al crear el Vigilante.
+    Solamente se vigilan los queries indicados aunque el archivo tenga otros.
+
+    El since_id de un query avanza únicamente cuando su paginación terminó; si
+    se detuvo por el presupuesto o el cap, o una petición falló, la siguiente
+    consulta vuelve a pedir desde el since_id anterior.
+
+    Un mismo tweet puede coincidir con varios queries. Para guardarlo una sola
+    vez se pasa en vistos un ConjuntoIds o un ConjuntoBloom, que en procesos de
+    larga duración ocupa mucha menos memoria que un set."""
+
+    def __init__(self, requester, queries, lista_tweets, lista_users=None, lista_media=None,
+                 lista_polls=None, lista_places=None, ruta_estado=None, objetivo=50,
+                 intervalo_min=30, intervalo_max=3600, alfa=0.3, limite=450, ventana=900,
+                 presupuesto=None, filtro=None, vistos=None):
+        self.requester = requester
+        self.lista_tweets = lista_tweets
+        self.lista_users = lista_users
+        self.lista_media = lista_media
+        self.lista_polls = lista_polls
+        self.lista_places = lista_places
+        self.ruta_estado = ruta_estado
+        self.objetivo = objetivo
+        self.intervalo_min = intervalo_min
+        self.intervalo_max = intervalo_max
+        self.alfa = alfa
+        self.espaciado = ventana / limite
+        self.presupuesto = como_presupuesto(presupuesto)
+        self.filtro = filtro
+        self.vistos = vistos
+        self.peticiones = 0
+        self.tweets = 0
+        self._siguiente = 0.0
+        self._detener = threading.Event()
+
+        guardados = {}
+        if ruta_estado is not None and os.path.exists(ruta_estado):
+            with open(ruta_estado, encoding='utf-8') as archivo:
+                guardados = json.load(archivo)
+        self.estados = {}
+        for query in queries:
+            self.estados[query] = guardados.get(query, {"since_id": None, "tasa": None, "ultimo": None,
+                                                        "proximo": 0.0})
+
+    def detener(self):
+        """Detiene vigilar desde otro hilo al terminar la consulta en curso."""
+
+        self._detener.set()
+
+    def _pedir(self, query, since_id, token):
+        ahora = time.time()
+        espera = self._siguiente - ahora
+        self._siguiente = max(ahora, self._siguiente) + self.espaciado
+        limite = self.requester.limites.get('tweets/search/recent')
+        if limite is not None and limite['restantes'] == 0 and limite['reinicio'] > ahora:
+            espera = max(espera, limite['reinicio'] - ahora)
+        if espera > 0:
+            with medir(self.requester.perfilador, 'espera', 'tweets/search/recent'):
+                time.sleep(espera)
+        self.peticiones = self.peticiones + 1
+        return self.requester.recent_search(query, since_id=since_id, next_token=token)
+
+    def consultar(self, query):
+        """Consulta una vez los tweets nuevos de query y actualiza su tasa e
+        intervalo. Regresa el número de tweets nuevos. Si una petición falla se
+        lanza ErrorPeticion sin modificar el since_id."""
+
+        estado = self.estados[query]
+        since_id = estado['since_id']
+        paginador = Paginador(self.requester, lambda token: self._pedir(query, since_id, token),
+                              profundidad=0, presupuesto=self.presupuesto, cap=True, filtro=self.filtro)
+        etapa = EtapaAplanado(self.requester.procesos, 'tweets', ListaEtiquetada(self.lista_tweets, 'query', query),
+                              self.lista_users, self.lista_media, self.lista_polls, self.lista_places,
+                              perfilador=self.requester.perfilador, vistos=self.vistos,
+                              trabajadores=self.requester.trabajadores)
+        nuevos = 0
+        mas_reciente = None
+        with paginador, etapa:
+            for pagina in paginador:
+                if mas_reciente is None and pagina.meta is not None:
+                    mas_reciente = pagina.meta.get('newest_id')
+                nuevos = nuevos + pagina.num_datos
+                etapa.agregar(pagina)
+                if since_id is None:
+                    break
+
+        ahora = time.time()
+        completa = since_id is None or paginador.token_reanudar is None
+        if mas_reciente is not None and completa:
+            estado['since_id'] = mas_reciente
+        if estado['ultimo'] is not None:
+            tasa = nuevos / max(ahora - estado['ultimo'], 1e-9)
+            if estado['tasa'] is None:
+                estado['tasa'] = tasa
+            else:
+                estado['tasa'] = self.alfa * tasa + (1 - self.alfa) * estado['tasa']
+        intervalo = self.intervalo_min
+        if estado['tasa'] is not None:
+            intervalo = self.intervalo_max
+            if estado['tasa'] > 0:
+                intervalo = min(max(self.objetivo / estado['tasa'], self.intervalo_min), self.intervalo_max)
+        estado['ultimo'] = ahora
+        estado['proximo'] = ahora + intervalo
+        self.tweets = self.tweets + nuevos
+        self.guardar()
+        return nuevos
+
+    def guardar(self):
+        """Guarda el estado de los queries en ruta_estado, si es que tiene una."""
+
+        if self.ruta_estado is None:
+            return
+        with open(self.ruta_estado + '.tmp', 'w', encoding='utf-8') as archivo:
+            json.dump(self.estados, archivo)
+        os.replace(self.ruta_estado + '.tmp', self.ruta_estado)
+
+    def vigilar(self, duracion=None, max_peticiones=None):
+        """Consulta los queries por turnos, cada uno cuando le toca de acuerdo a
+        su intervalo, durante duracion segundos, hasta hacer max_peticiones
+        peticiones o hasta que se llame a detener. Si ambos son None vigila
+        indefinidamente."""
+
+        fin = None if duracion is None else time.time() + duracion
+        turnos = [(estado['proximo'], orden, query) for orden, (query, estado) in enumerate(self.estados.items())]
+        heapq.heapify(turnos)
+        while len(turnos) > 0 and not self._detener.is_set():
+            if max_peticiones is not None and self.peticiones >= max_peticiones:
+                return
+            proximo, orden, query = heapq.heappop(turnos)
+            espera = max(proximo, self._siguiente) - time.time()
+            if fin is not None and time.time() + max(espera, 0) > fin:
+                return
+            if espera > 0 and self._detener.wait(espera):
+                return
+            if self.presupuesto is not None and self.presupuesto.disponible() < 100:
+                print("Presupuesto agotado, {} tweets consumidos.".format(self.presupuesto.consumidos))
+                return
+            try:
+                self.consultar(query)
+            except ErrorPeticion as error:
+                print("Error en {}: {}".format(query, error))
+                self.estados[query]['proximo'] = time.time() + self.intervalo_min
+            heapq.heappush(turnos, (self.estados[query]['proximo'], orden, query))
+
+    def resumen(self):
+        """Regresa un dict con el since_id, la tasa en tweets por minuto y el
+        intervalo actual en segundos de cada query."""
+
+        return {query: {"since_id": estado['since_id'],
+                        "tweets_por_minuto": None if estado['tasa'] is None else estado['tasa'] * 60,
+                        "intervalo": None if estado['ultimo'] is None else estado['proximo'] - estado['ultimo']}
+                for query, estado in self.estados.items()}
+
+class Cobertura():
+    """Duplica las peticiones de consulta que tardan más de lo usual para recortar
+    la latencia de cola (hedged requests).
+
+    Para cada endpoint se guardan las últimas muestras latencias. Si una petición
+    no ha respondido después del percentil de esas latencias (y de al menos minimo
+    segundos), se envía un duplicado, con el token alterno si se indica, y se usa
+    la primera respuesta con status code 200 que llegue; si ninguna lo tiene se
+    usa la de la petición original. La otra se descarta al terminar: requests no
+    permite abortar una petición en curso, por lo que el duplicado sí cuenta en el
+    rate limit. presupuesto es la fracción máxima de peticiones que pueden
+    duplicarse, para no multiplicar la carga cuando la API entera está lenta.
+    Mientras un endpoint tenga menos de 20 latencias observadas no se duplica, y
+    tampoco cuando a la ventana de rate limit del token que haría el duplicado
+    le quedan reserva peticiones o menos.
+
+    Las peticiones se hacen en un pool de hilos con clones del Requester, y la
+    respuesta ganadora se copia a su last_petition."""
+
+    def __init__(self, percentil=95, presupuesto=0.05, token=None, minimo=0.05, muestras=200, hilos=8,
+                 reserva=2):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.percentil = percentil
+        self.presupuesto = presupuesto
+        self.token = token
+        self.minimo = minimo
+        self.muestras = muestras
+        self.reserva = reserva
+        self.peticiones = 0
+        self.duplicadas = 0
+        self.ganadas = 0
+        self._latencias = {}
+        self._limites_alterno = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(hilos)
+
+    def umbral(self, endpoint):
+        """Regresa los segundos después de los cuales se duplica una petición al
+        endpoint, o None si aún no hay suficientes latencias observadas."""
+
+        with self._lock:
+            latencias = sorted(self._latencias.get(endpoint, ()))
+        if len(latencias) < 20:
+            return None
+        posicion = min(len(latencias) - 1, int(len(latencias) * self.percentil / 100))
+        return max(self.minimo, latencias[posicion])
+
+    def _registrar(self, endpoint, latencia):
+        with self._lock:
+            latencias = self._latencias.get(endpoint)
+            if latencias is None:
+                latencias = self._latencias[endpoint] = deque(maxlen=self.muestras)
+            latencias.append(latencia)
+
+    def _ventana_agotada(self, requester, endpoint):
+        limites = self._limites_alterno if self.token is not None else requester.limites
+        limite = limites.get(endpoint)
+        return limite is not None and limite['reinicio'] > time.time() and limite['restantes'] <= self.reserva
+
+    def _reservar(self):
+        with self._lock:
+            if self.duplicadas + 1 > self.presupuesto * self.peticiones:
+                return False
+            self.duplicadas = self.duplicadas + 1
+            return True
+
+    def _pedir(self, clon, url, header, parametros, endpoint, registrar):
+        inicio = time.perf_counter()
+        respuesta = clon.peticion(url, header, parametros)
+        if registrar:
+            self._registrar(endpoint, time.perf_counter() - inicio)
+        return respuesta
+
+    def ejecutar(self, requester, url, header, parametros):
+        """Realiza la petición con requester, duplicándola si tarda más que el umbral."""
+
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        endpoint = nombre_endpoint(url)
+        with self._lock:
+            self.peticiones = self.peticiones + 1
+        umbral = self.umbral(endpoint)
+
+        clon = requester.clonar()
+        futuros = {self._pool.submit(self._pedir, clon, url, header, parametros, endpoint, True): clon}
+        terminados, _ = wait(futuros, timeout=umbral)
+        if len(terminados) == 0 and not self._ventana_agotada(requester, endpoint) and self._reservar():
+            alterno = requester.clonar()
+            header_alterno = header
+            if self.token is not None:
+                alterno.set_token(self.token)
+                alterno.limites = self._limites_alterno
+                header_alterno = alterno.header
+            futuros[self._pool.submit(self._pedir, alterno, url, header_alterno, parametros, endpoint, False)] = alterno
+
+        pendientes = set(futuros)
+        fallidos = []
+        while len(pendientes) > 0:
+            terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                if futuro.exception() is None and futuro.result().status_code == 200:
+                    ganador = futuros[futuro]
+                    if ganador is not clon:
+                        with self._lock:
+                            self.ganadas = self.ganadas + 1
+                    for otro in pendientes:
+                        otro.cancel()
+                    requester.last_petition.update(ganador.last_petition)
+                    return futuro.result()
+                fallidos.append(futuro)
+
+        respaldo = min(fallidos, key=lambda futuro: (futuro.exception() is not None, futuros[futuro] is not clon))
+        requester.last_petition.update(futuros[respaldo].last_petition)
+        return respaldo.result()
+
+    def resumen(self):
+        """Regresa un dict con el número de peticiones, las duplicadas, las que ganó
+        el duplicado y el umbral actual de cada endpoint."""
+
+        with self._lock:
+            endpoints = list(self._latencias)
+        return {"peticiones": self.peticiones, "duplicadas": self.duplicadas, "ganadas": self.ganadas,
+                "umbrales": {endpoint: self.umbral(endpoint) for endpoint in endpoints}}
+
+    def cerrar(self):
+        """Cierra el pool de hilos de la Cobertura."""
+
+        self._pool.shutdown(wait=False)
+
+class Agrupador():
+    """Agrupa peticiones individuales de usuarios y tweets en peticiones de hasta 100 objetos.
+
+    Las funciones user, tweet y user_by_uname del Agrupador no hacen la petición
+    inmediatamente: regresan un Future y acumulan la solicitud durante ventana
+    segundos o hasta que haya maximo solicitudes pendientes del mismo tipo. En ese
+    momento se hace una sola petición a users, tweets o users_by_uname y el resultado
+    se reparte entre las solicitudes. Las solicitudes repetidas dentro de la misma
+    ventana comparten la petición.
+
+    El resultado de cada Future es el dict del objeto tal como lo regresa la API,
+    o None si la API no regresó el objeto (por ejemplo si no existe o está protegido).
+    Si la petición falla, el Future tiene la excepción correspondiente."""
+
+    _tipos = {
+        "user": ('users', 'id'),
+        "tweet": ('tweets', 'id'),
+        "user_by_uname": ('users_by_uname', 'username'),
+    }
+
+    def __init__(self, requester, ventana=0.01, maximo=100):
+        self.requester = requester
+        self.ventana = ventana
+        self.maximo = maximo
+        self.solicitudes = 0
+        self.peticiones = 0
+        self._pendientes = {tipo: {} for tipo in self._tipos}
+        self._inicio = {tipo: None for tipo in self._tipos}
+        self._cerrado = False
+        self._condicion = threading.Condition()
+        self._hilo = threading.Thread(target=self._despachar, daemon=True)
+        self._hilo.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+    def _solicitar(self, tipo, clave):
+        from concurrent.futures import Future
+
+        futuro = Future()
+        with self._condicion:
+            if self._cerrado:
+                raise Exception("El Agrupador está cerrado")
+            pendientes = self._pendientes[tipo]
+            if len(pendientes) == 0:
+                self._inicio[tipo] = time.time()
+            pendientes.setdefault(clave, []).append(futuro)
+            self.solicitudes = self.solicitudes + 1
+            self._condicion.notify_all()
+        return futuro
+
+    def user(self, user_id):
+        """Solicita la información del usuario identificado con user_id. Regresa un Future."""
+
+        check_id(user_id)
+        return self._solicitar('user', user_id)
+
+    def tweet(self, tweet_id):
+        """Solicita la información del tweet identificado con tweet_id. Regresa un Future."""
+
+        check_id(tweet_id)
+        return self._solicitar('tweet', tweet_id)
+
+    def user_by_uname(self, username):
+        """Solicita la información del usuario identificado con username. Regresa un Future."""
+
+        check_uname(username)
+        return self._solicitar('user_by_uname', username.lower())
+
+    def _siguiente_lote(self):
+        """Espera hasta que algún tipo de solicitud deba enviarse y regresa (tipo, lote).
+        Regresa None cuando el Agrupador está cerrado y no quedan solicitudes."""
+
+        with self._condicion:
+            while True:
+                ahora = time.time()
+                espera = None
+                for tipo, pendientes in self._pendientes.items():
+                    if len(pendientes) == 0:
+                        continue
+                    transcurrido = ahora - self._inicio[tipo]
+                    if len(pendientes) >= self.maximo or self._cerrado or transcurrido >= self.ventana:
+                        claves = list(pendientes)[:self.maximo]
+                        lote = {clave: pendientes.pop(clave) for clave in claves}
+                        self._inicio[tipo] = ahora
+                        return tipo, lote
+                    restante = self.ventana - transcurrido
+                    if espera is None or restante < espera:
+                        espera = restante
+                if self._cerrado:
+                    return None
+                self._condicion.wait(espera)
+
+    def _despachar(self):
+        while True:
+            siguiente = self._siguiente_lote()
+            if siguiente is None:
+                return
+            tipo, lote = siguiente
+            self._resolver(tipo, lote)
+
+    def _resolver(self, tipo, lote):
+        """Hace la petición de un lote y reparte los resultados entre los Future."""
+
+        metodo, llave = self._tipos[tipo]
+        try:
+            respuesta = getattr(self.requester, metodo)(list(lote))
+            self.peticiones = self.peticiones + 1
+            if respuesta.status_code == 429:
+                self.requester.esperar_limite(self.peticiones)
+                respuesta = getattr(self.requester, metodo)(list(lote))
+                self.peticiones = self.peticiones + 1
+            if respuesta.status_code != 200:
+                raise Exception("La petición a {} regresó el status code {}".format(metodo, respuesta.status_code))
+            datos = respuesta.json().get('data')
+        except Exception as error:
+            for futuros in lote.values():
+                for futuro in futuros:
+                    futuro.set_exception(error)
+            return
+
+        encontrados = {}
+        for objeto in datos or []:
+            clave = objeto.get(llave)
+            if clave is not None:
+                encontrados[clave.lower() if tipo == 'user_by_uname' else clave] = objeto
+        for clave, futuros in lote.items():
+            for futuro in futuros:
+                futuro.set_result(encontrados.get(clave))
+
+    def cerrar(self):
+        """Envía las solicitudes pendientes y detiene el hilo del Agrupador."""
+
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        self._hilo.join()
+
+endpoints_bulk = {
+    "bulk_followers": 'users/{}/followers',
+    "bulk_following": 'users/{}/following',
+    "bulk_users": 'users',
+    "bulk_timeline": 'users/{}/tweets',
+    "bulk_mentions": 'users/{}/mentions',
+    "bulk_liked": 'users/{}/liked_tweets',
+    "bulk_recent_search": 'tweets/search/recent',
+}
+
+# Peticiones por ventana de 15 minutos (app auth), elementos por página, máximo de
+# elementos que regresa el endpoint y max_tweets por defecto de cada función bulk,
+# tal como vienen en la documentación de cada método.
+limites_bulk = {
+    "bulk_followers": (15, 1000, None, None),
+    "bulk_following": (15, 1000, None, None),
+    "bulk_users": (300, 100, None, None),
+    "bulk_timeline": (1500, 100, 3200, None),
+    "bulk_mentions": (450, 100, 800, None),
+    "bulk_liked": (75, 100, None, 1000),
+    "bulk_recent_search": (450, 100, None, 1000),
+}
+
+metricas_bulk = {
+    "bulk_followers": 'followers',
+    "bulk_following": 'following',
+    "bulk_timeline": 'tweets',
+}
+
+def _duracion(segundos):
+    """Convierte segundos a un texto como '2d 3h 15m'."""
+
+    minutos = int(round(segundos / 60))
+    dias, minutos = divmod(minutos, 1440)
+    horas, minutos = divmod(minutos, 60)
+    if dias > 0:
+        return '{}d {}h {}m'.format(dias, horas, minutos)
+    if horas > 0:
+        return '{}h {}m'.format(horas, minutos)
+    if minutos > 0:
+        return '{}m'.format(minutos)
+    return '{:.0f}s'.format(segundos)
+
+def estimar_semilla(metodo, usuario=None, max_tweets=None):
+    """Estima el número de elementos y de peticiones que hará la función bulk
+    metodo para una semilla.
+
+    usuario es el registro de la semilla como lo regresa process_user. Para
+    followers, following y timeline se usan sus métricas públicas; para los demás
+    endpoints, o si no hay métricas, se supone que se alcanza max_tweets o el
+    máximo del endpoint. Las cuentas protegidas cuentan una sola petición sin
+    elementos. Regresa una tupla (elementos, peticiones)."""
+
+    _, por_pagina, maximo, max_defecto = limites_bulk[metodo]
+    if max_tweets is None:
+        max_tweets = max_defecto
+    if usuario is not None and usuario.get('protected'):
+        return 0, 1
+
+    campo = metricas_bulk.get(metodo)
+    if campo is not None and usuario is not None and usuario.get(campo) is not None:
+        elementos = usuario[campo]
+    elif max_tweets is not None:
+        elementos = max_tweets
+    elif maximo is not None:
+        elementos = maximo
+    else:
+        elementos = por_pagina
+    for tope in (maximo, max_tweets):
+        if tope is not None:
+            elementos = min(elementos, tope)
+    return elementos, max(1, -(-elementos // por_pagina))
+
+class PlanTrabajo():
+    """Estimación de las peticiones, la duración y el consumo de cap de una
+    función bulk sobre un conjunto de semillas, hecha por planear.
+
+    por_token es la lista de peticiones asignadas a cada token y semilla_mayor la
+    semilla con más peticiones junto con su número de peticiones. Las páginas de
+    una semilla se piden en serie con un solo token, por lo que duracion_minima
+    es lo menos que puede tardar el trabajo sin importar cuántos tokens se usen."""
+
+    def __init__(self, metodo, semillas, tokens):
+        self.metodo = metodo
+        self.semillas = semillas
+        self.tokens = tokens
+        self.elementos = 0
+        self.peticiones = 0
+        self.segundos = 0
+        self.duracion_minima = 0
+        self.cap = 0
+        self.cap_restante = None
+        self.peticiones_previas = 0
+        self.por_token = []
+        self.semilla_mayor = (None, 0)
+        self.sin_metricas = 0
+
+    def excede_cap(self):
+        return self.cap_restante is not None and self.cap > self.cap_restante
+
+    def __str__(self):
+        limite = limites_bulk[self.metodo][0]
+        lineas = ["{}: {} semillas, {} tokens".format(self.metodo, self.semillas, self.tokens),
+                  "  peticiones: {} ({} por ventana de 15 minutos por token)".format(self.peticiones, limite),
+                  "  elementos: {}".format(self.elementos),
+                  "  duración estimada: {} (mínima con más tokens: {})".format(
+                      _duracion(self.segundos), _duracion(self.duracion_minima))]
+        if self.semilla_mayor[0] is not None:
+            lineas.append("  semilla mayor: {} con {} peticiones".format(*self.semilla_mayor))
+        if len(self.por_token) > 1:
+            lineas.append("  peticiones por token: {}".format(self.por_token))
+        if self.cap > 0:
+            texto = "  cap: {} tweets".format(self.cap)
+            if self.cap_restante is not None:
+                texto = texto + " de {} restantes{}".format(
+                    self.cap_restante, ", EXCEDE EL CAP" if self.excede_cap() else "")
+            lineas.append(texto)
+        if self.peticiones_previas > 0:
+            lineas.append("  peticiones a users para obtener métricas: {}".format(self.peticiones_previas))
+        if self.sin_metricas > 0:
+            lineas.append("  {} semillas sin métricas, se supuso el máximo".format(self.sin_metricas))
+        return '\n'.join(lineas)
+
+    def __repr__(self):
+        return "PlanTrabajo({}, peticiones={}, segundos={:.0f}, cap={})".format(
+            self.metodo, self.peticiones, self.segundos, self.cap)
+
+def _tiempo_peticiones(peticiones, limite, latencia, hilos=1, ventana=900):
+    """Tiempo que tardan peticiones hechas con un token cuyo límite es limite por ventana."""
+
+    if peticiones == 0:
+        return 0
+    ventanas = -(-peticiones // limite)
+    resto = peticiones - (ventanas - 1) * limite
+    return (ventanas - 1) * max(ventana, limite * latencia / hilos) + resto * latencia / hilos
+
+def planear(metodo, semillas, tokens=1, usuarios=None, max_tweets=None, latencia=0.5,
+            hilos_por_token=1, cap_restante=None, ventana=900):
+    """Estima sin hacer peticiones cuánto costará ejecutar la función bulk metodo
+    (por ejemplo 'bulk_followers') sobre cada semilla.
+
+    usuarios es un dict de id a registro de process_user con las métricas públicas
+    de las semillas, como el que regresa metricas_semillas. Las semillas se
+    reparten entre los tokens empezando por las de más peticiones, cada una al
+    token con menos carga, y la duración es la del token que más tarda. latencia
+    es el tiempo estimado de cada petición. Si se indica cap_restante, el plan
+    indica si los tweets estimados lo exceden. Regresa un PlanTrabajo."""
+
+    limite, por_pagina, _, _ = limites_bulk[metodo]
+    semillas = list(semillas)
+    if metodo == 'bulk_users':
+        semillas = [','.join(semillas[k:k + por_pagina]) for k in range(0, len(semillas), por_pagina)]
+    plan = PlanTrabajo(metodo, len(semillas), tokens)
+    plan.cap_restante = cap_restante
+
+    costos = []
+    for semilla in semillas:
+        usuario = None
+        if usuarios is not None:
+            usuario = usuarios.get(semilla)
+            if metodo in metricas_bulk and (usuario or {}).get(metricas_bulk[metodo]) is None:
+                plan.sin_metricas = plan.sin_metricas + 1
+        if metodo == 'bulk_users':
+            elementos, peticiones = semilla.count(',') + 1, 1
+        else:
+            elementos, peticiones = estimar_semilla(metodo, usuario, max_tweets)
+        plan.elementos = plan.elementos + elementos
+        plan.peticiones = plan.peticiones + peticiones
+        costos.append((peticiones, semilla))
+        if peticiones > plan.semilla_mayor[1]:
+            plan.semilla_mayor = (semilla, peticiones)
+    if endpoints_bulk[metodo] in endpoints_cap:
+        plan.cap = plan.elementos
+
+    cargas = [(0, k) for k in range(tokens)]
+    plan.por_token = [0] * tokens
+    for peticiones, _ in sorted(costos, reverse=True):
+        carga, k = heapq.heappop(cargas)
+        plan.por_token[k] = carga + peticiones
+        heapq.heappush(cargas, (carga + peticiones, k))
+
+    plan.duracion_minima = _tiempo_peticiones(plan.semilla_mayor[1], limite, latencia, 1, ventana)
+    plan.segundos = max([plan.duracion_minima] + [_tiempo_peticiones(carga, limite, latencia, hilos_por_token, ventana)
+                                                  for carga in plan.por_token])
+    return plan
+
+def metricas_semillas(requester, ids):
+    """Obtiene con bulk_users los registros de los usuarios en ids para usarlos
+    en planear. Regresa un dict de id a registro."""
+
+    usuarios = []
+    requester.bulk_users(ids, usuarios)
+    return {usuario['id']: usuario for usuario in usuarios}
+
+class Tarea():
+    """Una llamada a una función bulk del Requester administrada por un Planificador.
+    kwargs tiene todos los argumentos de la llamada por nombre, incluidos los que
+    se pasaron por posición al agregarla, y args queda vacío."""
+
+    def __init__(self, metodo, args, kwargs, prioridad, inquilino, endpoint, orden):
+        self.metodo = metodo
+        self.args = args
+        self.kwargs = kwargs
+        self.prioridad = prioridad
+        self.inquilino = inquilino
+        self.endpoint = endpoint
+        self.orden = orden
+        self.estado = 'pendiente'
+        self.error = None
+        self.cesiones = 0
+
+    def __repr__(self):
+        valores = list(self.args) + list(self.kwargs.values())
+        semilla = repr(valores[0])[:40] if len(valores) > 0 else ''
+        return "Tarea({}({}), prioridad={}, inquilino={}, estado={})".format(
+            self.metodo, semilla, self.prioridad, self.inquilino, self.estado)
+
+class Planificador():
+    """Ejecuta muchas funciones bulk compartiendo las ventanas de rate limit de los tokens.
+
+    Cada tarea corresponde a una llamada a una función bulk con un endpoint, una
+    prioridad y un inquilino. El planificador usa varios hilos por token y cuando
+    un endpoint agota su ventana, en lugar de dormir 900 segundos, la tarea cede su
+    lugar: se vuelve a formar con su token de paginación y el hilo toma una tarea
+    de otro endpoint que aún tenga cuota. Así, mientras followers está detenido,
+    las tareas de timeline o users siguen avanzando.
+
+    El orden en que se toman las tareas es: primero el inquilino que ha recibido
+    menos tiempo de ejecución ponderado por su peso en pesos, dentro de él la
+    tarea de mayor prioridad y al final el orden de llegada. Si se indica
+    umbral_cap y el cap restante en el LibroCap de los Requesters es menor a él,
+    las tareas que consumen el cap solamente se ejecutan cuando no hay otras."""
+
+    def __init__(self, requesters, hilos_por_token=2, pesos=None, umbral_cap=None):
+        if isinstance(requesters, Requester):
+            requesters = [requesters]
+
+        self._requesters = []
+        for requester in requesters:
+            for k in range(hilos_por_token):
+                clon = requester.clonar()
+                clon.ceder_limites = True
+                self._requesters.append(clon)
+
+        self.pesos = pesos if pesos is not None else {}
+        self.umbral_cap = umbral_cap
+        self.tareas = []
+        self._pendientes = []
+        self._en_curso = {}
+        self._bloqueos = {}
+        self._servicio = {}
+        self._orden = 0
+        self._condicion = threading.Condition()
+
+    def agregar(self, metodo, *args, prioridad=0, inquilino=None, endpoint=None, **kwargs):
+        """Agrega una tarea que llama a la función bulk metodo del Requester con args y kwargs.
+        El endpoint se deduce del nombre de la función, para otras funciones debe indicarse.
+        Un presupuesto numérico se convierte en un Presupuesto al crear la tarea, para
+        que se conserve lo consumido cuando la tarea se reanuda. Los argumentos se
+        asocian por nombre con la firma de la función, de forma que al reanudar se
+        reemplazan pagination_token y max_tweets aunque se hayan pasado por posición.
+        Regresa la Tarea creada."""
+
+        import inspect
+
+        if endpoint is None:
+            endpoint = endpoints_bulk.get(metodo)
+        if endpoint is None:
+            raise Exception("No se conoce el endpoint de {}, indícalo con el parámetro endpoint".format(metodo))
+        kwargs = dict(inspect.signature(getattr(Requester, metodo)).bind_partial(None, *args, **kwargs).arguments)
+        kwargs.pop('self')
+        if 'presupuesto' in kwargs:
+            kwargs['presupuesto'] = como_presupuesto(kwargs['presupuesto'])
+
+        with self._condicion:
+            tarea = Tarea(metodo, (), kwargs, prioridad, inquilino, endpoint, self._orden)
+            self._orden = self._orden + 1
+            self.tareas.append(tarea)
+            self._pendientes.append(tarea)
+            self._condicion.notify_all()
+        return tarea
+
+    def _bloqueado(self, requester, endpoint, ahora):
+        if self._bloqueos.get((requester.token, endpoint), 0) > ahora:
+            return True
+        limite = requester.limites.get(endpoint)
+        return limite is not None and limite['restantes'] == 0 and limite['reinicio'] > ahora
+
+    def _servicio_actual(self, inquilino, ahora):
+        servicio = self._servicio.get(inquilino, 0)
+        for tarea, inicio in self._en_curso.items():
+            if tarea.inquilino == inquilino:
+                servicio = servicio + ahora - inicio
+        return servicio / self.pesos.get(inquilino, 1)
+
+    def _tomar(self, requester):
+        """Espera hasta que haya una tarea que pueda ejecutarse con requester y la regresa.
+        Regresa None cuando ya no quedan tareas pendientes ni en curso."""
+
+        with self._condicion:
+            while True:
+                if len(self._pendientes) == 0 and len(self._en_curso) == 0:
+                    self._condicion.notify_all()
+                    return None
+
+                ahora = time.time()
+                cap_bajo = (self.umbral_cap is not None and requester.libro_cap is not None
+                            and requester.libro_cap.restante() < self.umbral_cap)
+                servicios = {}
+                mejor = None
+                mejor_clave = None
+                for tarea in self._pendientes:
+                    if self._bloqueado(requester, tarea.endpoint, ahora):
+                        continue
+                    if tarea.inquilino not in servicios:
+                        servicios[tarea.inquilino] = self._servicio_actual(tarea.inquilino, ahora)
+                    degradada = cap_bajo and tarea.endpoint in endpoints_cap
+                    clave = (degradada, servicios[tarea.inquilino], -tarea.prioridad, tarea.orden)
+                    if mejor_clave is None or clave < mejor_clave:
+                        mejor, mejor_clave = tarea, clave
+
+                if mejor is not None:
+                    self._pendientes.remove(mejor)
+                    self._en_curso[mejor] = ahora
+                    mejor.estado = 'corriendo'
+                    return mejor
+
+                espera = 5
+                for (token, endpoint), reinicio in self._bloqueos.items():
+                    if token == requester.token and reinicio > ahora:
+                        espera = min(espera, reinicio - ahora)
+                self._condicion.wait(max(espera, 0.05))
+
+    def _terminar(self, tarea, requester, error=None):
+        with self._condicion:
+            inicio = self._en_curso.pop(tarea)
+            self._servicio[tarea.inquilino] = self._servicio.get(tarea.inquilino, 0) + time.time() - inicio
+            if isinstance(error, LimiteExcedido):
+                tarea.kwargs['pagination_token'] = error.pagination_token
+                if error.max_elementos is not None:
+                    tarea.kwargs['max_tweets'] = error.max_elementos
+                tarea.cesiones = tarea.cesiones + 1
+                tarea.estado = 'pendiente'
+                self._bloqueos[(requester.token, error.endpoint)] = error.reinicio
+                self._pendientes.append(tarea)
+                print("Rate limit agotado en {}, se reanuda en {:.0f} segundos.".format(
+                    error.endpoint, error.reinicio - time.time()))
+            elif error is not None:
+                tarea.estado = 'error'
+                tarea.error = error
+            else:
+                tarea.estado = 'terminada'
+            self._condicion.notify_all()
+
+    def _trabajador(self, requester):
+        while True:
+            tarea = self._tomar(requester)
+            if tarea is None:
+                return
+            try:
+                getattr(requester, tarea.metodo)(*tarea.args, **tarea.kwargs)
+            except Exception as error:
+                self._terminar(tarea, requester, error)
+            else:
+                self._terminar(tarea, requester)
+
+    def ejecutar(self):
+        """Ejecuta todas las tareas agregadas y regresa la lista de tareas.
+        Las tareas que fallaron tienen estado 'error' y la excepción en su propiedad error."""
+
+        hilos = [threading.Thread(target=self._trabajador, args=(requester,), daemon=True)
+                 for requester in self._requesters]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return self.tareas
+
+class _ColectorVecinos():
+    """Lista que recibe los usuarios de una página de bulk_following o
+    bulk_followers para un nodo del Rastreador. Su método avanzar se pasa como
+    avance a la función bulk y entrega la página a Rastreador._vecinos junto
+    con el token para reanudar el nodo después de ella."""
+
+    def __init__(self, rastreador, nodo):
+        self.rastreador = rastreador
+        self.nodo = nodo
+        self._pagina = []
+        self._recibidos = 0
+
+    def append(self, usuario):
+        self._pagina.append(usuario)
+        self._recibidos = self._recibidos + 1
+
+    def __len__(self):
+        return self._recibidos
+
+    def avanzar(self, token):
+        pagina, self._pagina = self._pagina, []
+        self.rastreador._vecinos(self.nodo, pagina, token)
+
+class Rastreador():
+    """Recorre la red de seguimiento a partir de unas semillas hasta profundidad
+    saltos, con bulk_following (direccion='following') o bulk_followers.
+
+    Los nodos por expandir forman una frontera con prioridad: primero los de
+    menor salto y dentro de ellos los que requieren menos páginas según sus
+    métricas públicas, o el orden que regrese la función prioridad(usuario, salto),
+    donde menor es primero. Los ids ya descubiertos se guardan en un ConjuntoIds,
+    así que cada cuenta se pide una sola vez aunque aparezca en muchas listas.
+
+    Las métricas de cada vecino vienen en la misma página que lo descubre, por lo
+    que se poda antes de pedir nada: no se expanden las cuentas protegidas ni las
+    que no cumplen minimos y maximos, por ejemplo minimos={'followers': 100} y
+    maximos={'following': 5000}, con los campos de process_user. Los vecinos
+    podados sí quedan como aristas.
+
+    Se usa un hilo por cada Requester con ceder_limites activado: cuando un
+    token agota su ventana, el nodo regresa a la frontera con su token de
+    paginación y el hilo espera a que la ventana se reinicie mientras los demás
+    tokens siguen trabajando.
+
+    Las aristas se agregan al GrafoSeguidores grafo al final de cada página y,
+    si se indica, al sink aristas como dicts con origen y destino (quien sigue
+    y a quien sigue). Si grafo tiene ruta se guarda cada guardar_cada nodos. Con
+    ruta_estado la frontera y los ids descubiertos se guardan junto con el grafo
+    y un rastreo interrumpido se reanuda creando el Rastreador con la misma ruta.
+    Los nodos en curso se guardan con el token de la página siguiente a la
+    última registrada, así que al reanudar no se repiten sus páginas.
+
+    Si un nodo falla con un error 5xx después de los reintentos de la función
+    bulk, regresa a la frontera con el token de la página que falló, hasta
+    reintentos veces. Los nodos que fallan con otro error, o que agotan sus
+    reintentos, quedan en errores y se guardan con su token en el estado; al
+    reanudar regresan a la frontera para intentarse de nuevo."""
+
+    def __init__(self, requesters, grafo, profundidad=2, direccion='following', minimos=None, maximos=None,
+                 prioridad=None, aristas=None, ruta_estado=None, guardar_cada=50, max_nodos=None,
+                 reintentos=3):
+        if direccion not in ('following', 'followers'):
+            raise Exception("La dirección debe ser 'following' o 'followers'")
+        if isinstance(requesters, Requester):
+            requesters = [requesters]
+
+        self._requesters = []
+        for requester in requesters:
+            clon = requester.clonar()
+            clon.ceder_limites = True
+            self._requesters.append(clon)
+
+        self.grafo = grafo
+        self.profundidad = profundidad
+        self.direccion = direccion
+        self.minimos = minimos if minimos is not None else {}
+        self.maximos = maximos if maximos is not None else {}
+        self.prioridad = prioridad
+        self.aristas = aristas
+        self.ruta_estado = ruta_estado
+        self.guardar_cada = guardar_cada
+        self.max_nodos = max_nodos
+        self.reintentos = reintentos
+        self.completados = 0
+        self.podados = 0
+        self.cesiones = 0
+        self.errores = {}
+        self.frontera = []
+        self._fallidos = {}
+        self._fallas = {}
+        self._orden = 0
+        self._en_curso = 0
+        self._nodos_en_curso = {}
+        self._bloqueos = {}
+        self._condicion = threading.Condition()
+        self._guardando = threading.Lock()
+        self.descubiertos = ConjuntoIds()
+
+        if ruta_estado is not None and os.path.exists(ruta_estado + '.frontera'):
+            self._cargar()
+
+    def _cargar(self):
+        with open(self.ruta_estado + '.frontera', encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+        self.frontera = [(tuple(clave), orden, user_id, salto, token)
+                         for clave, orden, user_id, salto, token in datos['frontera']]
+        self._orden = datos['orden']
+        self.completados = datos['completados']
+        self.podados = datos['podados']
+        self.errores = datos.get('errores', {})
+        with self._condicion:
+            for clave, orden, user_id, salto, token in datos.get('fallidos', []):
+                self._empujar(tuple(clave), user_id, salto, token, orden)
+        self.descubiertos = ConjuntoIds(self.ruta_estado + '.ids')
+
+    def guardar(self):
+        """Guarda el grafo, si tiene ruta, y el estado del rastreo, si hay ruta_estado.
+
+        Solamente la copia de la frontera y de los ids descubiertos se hace con
+        el lock; el grafo se guarda después, sin detener a los hilos, y contiene
+        al menos las aristas de la copia. El estado se escribe al final, de
+        forma que nunca indica páginas cuyas aristas no están en disco."""
+
+        with self._guardando:
+            datos = None
+            with self._condicion:
+                if self.ruta_estado is not None:
+                    datos = {"frontera": self.frontera + list(self._nodos_en_curso.values()),
+                             "orden": self._orden, "completados": self.completados, "podados": self.podados,
+                             "errores": self.errores, "fallidos": list(self._fallidos.values())}
+                    self.descubiertos.guardar(self.ruta_estado + '.ids.tmp')
+            if self.grafo.ruta is not None:
+                self.grafo.guardar()
+            if datos is None:
+                return
+            flush = getattr(self.aristas, 'flush', None)
+            if flush is not None:
+                flush()
+            with open(self.ruta_estado + '.frontera.tmp', 'w', encoding='utf-8') as archivo:
+                json.dump(datos, archivo)
+            os.replace(self.ruta_estado + '.ids.tmp', self.ruta_estado + '.ids')
+            os.replace(self.ruta_estado + '.frontera.tmp', self.ruta_estado + '.frontera')
+
+    def podar(self, usuario):
+        """Indica si un usuario descubierto no debe expandirse."""
+
+        if usuario.get('protected'):
+            return True
+        for campo, minimo in self.minimos.items():
+            if (usuario.get(campo) or 0) < minimo:
+                return True
+        for campo, maximo in self.maximos.items():
+            if (usuario.get(campo) or 0) > maximo:
+                return True
+        return False
+
+    def _clave(self, usuario, salto):
+        if self.prioridad is not None:
+            return (salto, self.prioridad(usuario, salto))
+        paginas = -(-(usuario.get(self.direccion) or 0) // 1000)
+        return (salto, paginas)
+
+    def _empujar(self, clave, user_id, salto, token=None, orden=None):
+        if orden is None:
+            orden = self._orden
+            self._orden = self._orden + 1
+        heapq.heappush(self.frontera, (clave, orden, user_id, salto, token))
+        self._condicion.notify_all()
+
+    def agregar_semillas(self, ids):
+        """Agrega a la frontera, con salto 0, los ids que aún no se han descubierto."""
+
+        with self._condicion:
+            for user_id in ids:
+                if self.descubiertos.agregar(user_id):
+                    self._empujar((0, 0), str(user_id), 0)
+
+    def _vecinos(self, nodo, usuarios, token):
+        """Registra las aristas de una página de vecinos de un nodo en curso, agrega
+        a la frontera los vecinos nuevos que no se podan y guarda token como el
+        punto desde el que se reanuda el nodo. Después de la última página token
+        es None y el nodo ya no se guarda como en curso."""
+
+        clave, orden, user_id, salto = nodo[:4]
+        ids = [usuario['id'] for usuario in usuarios]
+        with self._condicion:
+            if token is None:
+                self._nodos_en_curso.pop(orden, None)
+            else:
+                self._nodos_en_curso[orden] = (clave, orden, user_id, salto, token)
+            if self.direccion == 'following':
+                self.grafo.agregar_seguidos(user_id, ids)
+            else:
+                self.grafo.agregar_seguidores(user_id, ids)
+            if self.aristas is not None:
+                for vecino in ids:
+                    origen, destino = (user_id, vecino) if self.direccion == 'following' else (vecino, user_id)
+                    self.aristas.append({"origen": origen, "destino": destino})
+                fin_pagina = getattr(self.aristas, 'fin_pagina', None)
+                if fin_pagina is not None:
+                    fin_pagina()
+
+            if salto + 1 >= self.profundidad:
+                return
+            for usuario in usuarios:
+                if not self.descubiertos.agregar(usuario['id']):
+                    continue
+                if self.podar(usuario):
+                    self.podados = self.podados + 1
+                    continue
+                self._empujar(self._clave(usuario, salto + 1), usuario['id'], salto + 1)
+
+    def _bloqueado(self, requester, endpoint, ahora):
+        if self._bloqueos.get(requester.token, 0) > ahora:
+            return True
+        limite = requester.limites.get(endpoint)
+        return limite is not None and limite['restantes'] == 0 and limite['reinicio'] > ahora
+
+    def _tomar(self, requester, endpoint):
+        """Espera hasta que haya un nodo que pueda pedirse con requester y lo regresa.
+        Regresa None cuando la frontera se vació y no hay nodos en curso."""
+
+        with self._condicion:
+            while True:
+                terminado = self.max_nodos is not None and self.completados + self._en_curso >= self.max_nodos
+                if (len(self.frontera) == 0 or terminado) and self._en_curso == 0:
+                    self._condicion.notify_all()
+                    return None
+                ahora = time.time()
+                if len(self.frontera) > 0 and not terminado and not self._bloqueado(requester, endpoint, ahora):
+                    self._en_curso = self._en_curso + 1
+                    nodo = heapq.heappop(self.frontera)
+                    self._nodos_en_curso[nodo[1]] = nodo
+                    return nodo
+                espera = 5
+                reinicio = self._bloqueos.get(requester.token, 0)
+                if reinicio > ahora:
+                    espera = min(espera, reinicio - ahora)
+                self._condicion.wait(max(espera, 0.05))
+
+    def _trabajador(self, requester):
+        metodo = 'bulk_' + self.direccion
+        endpoint = endpoints_bulk[metodo]
+        while True:
+            nodo = self._tomar(requester, endpoint)
+            if nodo is None:
+                return
+            clave, orden, user_id, salto, token = nodo
+            guardar = False
+            colector = _ColectorVecinos(self, nodo)
+            try:
+                getattr(requester, metodo)(user_id, colector, pagination_token=token,
+                                           avance=colector.avanzar)
+            except LimiteExcedido as error:
+                with self._condicion:
+                    self.cesiones = self.cesiones + 1
+                    self._bloqueos[requester.token] = error.reinicio
+                    self._empujar(clave, user_id, salto, error.pagination_token, orden)
+            except ErrorPeticion as error:
+                with self._condicion:
+                    fallas = self._fallas.get(orden, 0)
+                    if error.status_code >= 500 and fallas < self.reintentos:
+                        self._fallas[orden] = fallas + 1
+                        self._empujar(clave, user_id, salto, error.pagination_token, orden)
+                    else:
+                        self._fallar((clave, orden, user_id, salto, error.pagination_token), error)
+            except Exception as error:
+                with self._condicion:
+                    self._fallar(self._nodos_en_curso.get(orden, nodo), error)
+            else:
+                with self._condicion:
+                    self._fallas.pop(orden, None)
+                    self.errores.pop(user_id, None)
+                    self.completados = self.completados + 1
+                    guardar = self.guardar_cada is not None and self.completados % self.guardar_cada == 0
+            finally:
+                with self._condicion:
+                    self._en_curso = self._en_curso - 1
+                    self._nodos_en_curso.pop(orden, None)
+                    self._condicion.notify_all()
+            if guardar:
+                self.guardar()
+
+    def _fallar(self, nodo, error):
+        self._fallas.pop(nodo[1], None)
+        self.errores[nodo[2]] = str(error)
+        self._fallidos[nodo[1]] = nodo
+        print("Error en {}: {}".format(nodo[2], error))
+
+    def rastrear(self, semillas=None):
+        """Agrega las semillas, si se indican, y expande la frontera hasta vaciarla
+        o hasta completar max_nodos. Al terminar guarda el grafo y el estado.
+        Regresa el resumen del rastreo."""
+
+        if semillas is not None:
+            self.agregar_semillas(semillas)
+        hilos = [threading.Thread(target=self._trabajador, args=(requester,), daemon=True)
+                 for requester in self._requesters]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for hilo in hilos:
+                hilo.join()
+        finally:
+            self.guardar()
+        return self.resumen()
+
+    def resumen(self):
+        """Regresa un dict con los nodos completados, en la frontera, descubiertos,
+        podados, con errores y las veces que se cedió un nodo por rate limit."""
+
+        with self._condicion:
+            return {"completados": self.completados, "frontera": len(self.frontera),
+                    "descubiertos": len(self.descubiertos), "podados": self.podados,
+                    "errores": len(self.errores), "cesiones": self.cesiones}
+
+def _serializar(valor):
+    """Convierte a texto los valores que json no sabe serializar, como las fechas de petición."""
+
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+class SinkJsonl():
+    """Destino de registros que los escribe en un archivo JSON Lines.
+
+    Se comporta como las listas que reciben las funciones bulk: los registros
+    se agregan con append y len regresa el número de registros escritos, por lo
+    que puede pasarse en lugar de cualquiera de las listas lista_*. La escritura
+    está protegida con un lock para que varios hilos puedan compartir el sink."""
+
+    def __init__(self, ruta, modo='a'):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._archivo = open(ruta, modo, encoding='utf-8')
+        self._escritos = 0
+
+    def append(self, registro):
+        linea = json.dumps(registro, ensure_ascii=False, default=_serializar)
+        with self._lock:
+            self._archivo.write(linea + '\n')
+            self._escritos = self._escritos + 1
+
+    def __len__(self):
+        return self._escritos
+
+    def flush(self):
+        with self._lock:
+            self._archivo.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._archivo.closed:
+                self._archivo.close()
+
+_sin_particion = '__HIVE_DEFAULT_PARTITION__'
+
+class SinkParticionado():
+    """Destino de registros que los reparte en archivos JSON Lines con un
+    esquema de directorios tipo Hive, por ejemplo
+    directorio/dia=2021-05-01/autor=07/parte-<id>.jsonl.
+
+    particiones es una secuencia con las llaves de partición en orden:
+    'dia' usa el día de created_at (o de fecha_peticion si el registro no la
+    tiene), 'autor' reparte author_id (id en los users) en buckets cubetas
+    con un hash estable y 'query' usa la llave query que agrega Vigilante: los
+    primeros 40 caracteres del query, con los que no son letras, dígitos, '-'
+    o '_' cambiados por '_', seguidos de los 12 primeros dígitos hexadecimales
+    de su sha1, de forma que el nombre es corto y estable aunque el query sea
+    muy largo. Los registros sin el campo van a la partición
+    __HIVE_DEFAULT_PARTITION__.
+
+    Cada partición acumula hasta lote líneas antes de escribirlas. A lo más
+    quedan max_abiertos archivos abiertos a la vez; al pasar el límite se cierra
+    el usado hace más tiempo y se vuelve a abrir en modo append si hace falta.
+    Cada sink escribe en archivos con su propio identificador, de forma que
+    varios procesos o nodos pueden escribir en el mismo directorio."""
+
+    def __init__(self, directorio, particiones=('dia',), tipo='tweets', cubetas=16, max_abiertos=64, lote=1000):
+        import uuid
+
+        for particion in particiones:
+            if particion not in ('dia', 'autor', 'query'):
+                raise Exception("La partición {} no está soportada".format(particion))
+
+        self.directorio = directorio
+        self.particiones = tuple(particiones)
+        self.llave_autor = 'id' if tipo == 'users' else 'author_id'
+        self.cubetas = cubetas
+        self.max_abiertos = max_abiertos
+        self.lote = lote
+        self.identificador = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._en_buffer = 0
+        self._abiertos = OrderedDict()
+        self._escritos = 0
+        self._queries = {}
+
+    def _nombre_query(self, query):
+        import hashlib
+
+        nombre = self._queries.get(query)
+        if nombre is None:
+            prefijo = re.sub(r'[^0-9A-Za-z_-]', '_', query[:40])
+            nombre = '{}-{}'.format(prefijo, hashlib.sha1(query.encode('utf-8')).hexdigest()[:12])
+            self._queries[query] = nombre
+        return nombre
+
+    def _valor(self, particion, registro):
+        if particion == 'dia':
+            fecha = registro.get('created_at') or registro.get('fecha_peticion')
+            if fecha is None:
+                return _sin_particion
+            if isinstance(fecha, datetime):
+                return fecha.strftime('%Y-%m-%d')
+            return str(fecha)[:10]
+        elif particion == 'autor':
+            autor = registro.get(self.llave_autor)
+            if autor is None:
+                return _sin_particion
+            autor = str(autor)
+            if autor.isdigit():
+                cubeta = _mezclar(int(autor) & _mascara64) % self.cubetas
+            else:
+                cubeta = zlib.crc32(autor.encode('utf-8')) % self.cubetas
+            return '{:0{}d}'.format(cubeta, len(str(self.cubetas - 1)))
+        else:
+            query = registro.get('query')
+            if query is None:
+                return _sin_particion
+            return self._nombre_query(str(query))
+
+    def ruta_particion(self, registro):
+        """Regresa el directorio de la partición de un registro."""
+
+        partes = ['{}={}'.format(particion, self._valor(particion, registro)) for particion in self.particiones]
+        return os.path.join(self.directorio, *partes)
+
+    def append(self, registro):
+        ruta = self.ruta_particion(registro)
+        linea = json.dumps(registro, ensure_ascii=False, default=_serializar)
+        with self._lock:
+            buffer = self._buffers.setdefault(ruta, [])
+            buffer.append(linea)
+            self._en_buffer = self._en_buffer + 1
+            self._escritos = self._escritos + 1
+            if len(buffer) >= self.lote:
+                self._vaciar(ruta)
+            elif self._en_buffer >= self.lote * self.max_abiertos:
+                self._vaciar_todo()
+
+    def __len__(self):
+        return self._escritos
+
+    def _archivo(self, ruta):
+        archivo = self._abiertos.get(ruta)
+        if archivo is not None:
+            self._abiertos.move_to_end(ruta)
+            return archivo
+        if len(self._abiertos) >= self.max_abiertos:
+            _, viejo = self._abiertos.popitem(last=False)
+            viejo.close()
+        os.makedirs(ruta, exist_ok=True)
+        archivo = open(os.path.join(ruta, 'parte-{}.jsonl'.format(self.identificador)), 'a', encoding='utf-8')
+        self._abiertos[ruta] = archivo
+        return archivo
+
+    def _vaciar(self, ruta):
+        buffer = self._buffers.pop(ruta, None)
+        if buffer:
+            self._archivo(ruta).write('\n'.join(buffer) + '\n')
+            self._en_buffer = self._en_buffer - len(buffer)
+
+    def _vaciar_todo(self):
+        for ruta in list(self._buffers):
+            self._vaciar(ruta)
+
+    def particiones_escritas(self):
+        """Regresa la lista de directorios de partición que tienen datos de este sink."""
+
+        with self._lock:
+            rutas = set(self._buffers)
+        for raiz, _, archivos in os.walk(self.directorio):
+            if 'parte-{}.jsonl'.format(self.identificador) in archivos:
+                rutas.add(raiz)
+        return sorted(rutas)
+
+    def flush(self):
+        with self._lock:
+            self._vaciar_todo()
+            for archivo in self._abiertos.values():
+                archivo.flush()
+
+    def close(self):
+        with self._lock:
+            self._vaciar_todo()
+            for archivo in self._abiertos.values():
+                archivo.close()
+            self._abiertos.clear()
+
+class ColaPaginas():
+    """Cola FIFO acotada en memoria que, cuando se llena, derrama los elementos
+    a un archivo temporal en lugar de bloquear o descartarlos.
+
+    Mantiene en memoria hasta maximo elementos. Una vez que empieza a derramar,
+    los elementos nuevos se escriben en disco con pickle hasta que el disco se
+    vacía, de forma que el orden se conserva. Los elementos deben poder
+    serializarse con pickle. El archivo temporal se crea en directorio, o en el
+    directorio temporal del sistema, y se trunca cada vez que se vacía.
+
+    Como queue.Queue, quien consume los elementos llama a listo después de
+    procesar cada uno y esperar bloquea hasta que todos fueron procesados.
+    metricas regresa la profundidad actual de la cola en memoria y en disco."""
+
+    def __init__(self, maximo=64, directorio=None):
+        self.maximo = maximo
+        self.directorio = directorio
+        self._memoria = deque()
+        self._archivo = None
+        self._en_disco = 0
+        self._lectura = 0
+        self._sin_terminar = 0
+        self._cerrada = False
+        self._condicion = threading.Condition()
+        self.derramados = 0
+        self.maximo_en_disco = 0
+
+    def poner(self, elemento):
+        """Agrega un elemento. Nunca bloquea por falta de espacio."""
+
+        with self._condicion:
+            if self._cerrada:
+                raise Exception("La cola está cerrada")
+            if self._en_disco == 0 and len(self._memoria) < self.maximo:
+                self._memoria.append(elemento)
+            else:
+                self._derramar(elemento)
+            self._sin_terminar = self._sin_terminar + 1
+            self._condicion.notify_all()
+
+    def _derramar(self, elemento):
+        import pickle
+
+        if self._archivo is None:
+            import tempfile
+            self._archivo = tempfile.TemporaryFile(dir=self.directorio)
+        self._archivo.seek(0, 2)
+        pickle.dump(elemento, self._archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self._en_disco = self._en_disco + 1
+        self.derramados = self.derramados + 1
+        self.maximo_en_disco = max(self.maximo_en_disco, self._en_disco)
+
+    def _recuperar(self):
+        import pickle
+
+        self._archivo.seek(self._lectura)
+        elemento = pickle.load(self._archivo)
+        self._lectura = self._archivo.tell()
+        self._en_disco = self._en_disco - 1
+        if self._en_disco == 0:
+            self._archivo.seek(0)
+            self._archivo.truncate()
+            self._lectura = 0
+        return elemento
+
+    def tomar(self, timeout=None):
+        """Regresa el elemento más antiguo, esperando a que haya uno. Regresa None
+        si la cola se cerró y está vacía, o si pasan timeout segundos sin elementos."""
+
+        with self._condicion:
+            while len(self._memoria) == 0 and self._en_disco == 0:
+                if self._cerrada:
+                    return None
+                if not self._condicion.wait(timeout) and timeout is not None:
+                    return None
+            if len(self._memoria) > 0:
+                return self._memoria.popleft()
+            return self._recuperar()
+
+    def listo(self):
+        """Indica que se terminó de procesar un elemento tomado de la cola."""
+
+        with self._condicion:
+            self._sin_terminar = self._sin_terminar - 1
+            self._condicion.notify_all()
+
+    def esperar(self):
+        """Bloquea hasta que todos los elementos agregados fueron procesados."""
+
+        with self._condicion:
+            while self._sin_terminar > 0:
+                self._condicion.wait()
+
+    def cerrar(self):
+        """Impide agregar más elementos. tomar regresa None cuando se vacía la cola."""
+
+        with self._condicion:
+            self._cerrada = True
+            self._condicion.notify_all()
+
+    def metricas(self):
+        """Regresa un dict con los elementos en memoria y en disco, los bytes en
+        disco, el total de elementos derramados y el máximo que ha habido en disco."""
+
+        with self._condicion:
+            bytes_disco = 0
+            if self._archivo is not None and self._en_disco > 0:
+                bytes_disco = self._archivo.seek(0, 2) - self._lectura
+            return {"en_memoria": len(self._memoria), "en_disco": self._en_disco, "bytes_disco": bytes_disco,
+                    "derramados": self.derramados, "maximo_en_disco": self.maximo_en_disco}
+
+class SinkAsincrono():
+    """Envuelve un sink para que sus escrituras se hagan en un hilo aparte.
+
+    append acumula los registros y al final de cada página, o cada lote
+    registros, los envía como un bloque a una ColaPaginas. Un hilo escribe los
+    bloques en el sink en el mismo orden y llama a su fin_pagina después de cada
+    bloque. Si el sink se atrasa, los bloques se acumulan en memoria hasta
+    maximo y después se derraman a disco, de forma que las peticiones nunca se
+    detienen por un sink lento.
+
+    len regresa el número de registros recibidos. flush espera a que se escriban
+    todos los bloques y close además cierra el sink. Si una escritura falla, el
+    error se guarda en la propiedad error y se lanza en las llamadas siguientes
+    a append, flush y close; los bloques posteriores al error se descartan."""
+
+    def __init__(self, sink, maximo=64, directorio=None, lote=1000):
+        self.sink = sink
+        self.lote = lote
+        self.cola = ColaPaginas(maximo, directorio)
+        self.escritos = 0
+        self.error = None
+        self._bloque = []
+        self._recibidos = 0
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._escribir, daemon=True)
+        self._hilo.start()
+
+    def _revisar(self):
+        if self.error is not None:
+            raise self.error
+
+    def append(self, registro):
+        self._revisar()
+        with self._lock:
+            self._bloque.append(registro)
+            self._recibidos = self._recibidos + 1
+            if len(self._bloque) >= self.lote:
+                self._enviar()
+
+    def __len__(self):
+        return self._recibidos
+
+    def _enviar(self):
+        if len(self._bloque) > 0:
+            self.cola.poner(self._bloque)
+            self._bloque = []
+
+    def fin_pagina(self):
+        with self._lock:
+            self._enviar()
+
+    def _escribir(self):
+        while True:
+            bloque = self.cola.tomar()
+            if bloque is None:
+                return
+            try:
+                if self.error is not None:
+                    continue
+                for registro in bloque:
+                    self.sink.append(registro)
+                fin_pagina = getattr(self.sink, 'fin_pagina', None)
+                if fin_pagina is not None:
+                    fin_pagina()
+                self.escritos = self.escritos + len(bloque)
+            except Exception as error:
+                self.error = error
+                print("Error al escribir en el sink: {}".format(error))
+            finally:
+                self.cola.listo()
+
+    def metricas(self):
+        """Regresa las métricas de la ColaPaginas del sink."""
+
+        return self.cola.metricas()
+
+    def flush(self):
+        self.fin_pagina()
+        self.cola.esperar()
+        self._revisar()
+        flush = getattr(self.sink, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        self.fin_pagina()
+        self.cola.cerrar()
+        self._hilo.join()
+        self.sink.close()
+        self._revisar()
+
+tipos_sql = {
+    "string": 'TEXT',
+    "category": 'TEXT',
+    "datetime64[ns, UTC]": 'TEXT',
+    "Int64": 'BIGINT',
+    "float64": 'DOUBLE',
+    "boolean": 'BOOLEAN',
+}
+
+llaves_sink = {
+    "tweets": 'id',
+    "users": 'id',
+    "media": 'media_key',
+    "polls": 'id',
+    "places": 'id',
+}
+
+def columnas_sink(tipo):
+    """Regresa una lista de pares (columna, tipo SQL) de la tabla de tipo en
+    SinkBaseDatos, de acuerdo al esquema fijo del tipo de registro. Los polls
+    tienen además las columnas label_N y votos_N de sus 4 opciones posibles."""
+
+    columnas = [(columna, tipos_sql[dtype]) for columna, dtype in esquemas[tipo].items()]
+    if tipo == 'polls':
+        for posicion in range(1, 5):
+            columnas.append(('label_{}'.format(posicion), 'TEXT'))
+            columnas.append(('votos_{}'.format(posicion), 'BIGINT'))
+    return columnas
+
+class TablaSink():
+    """Sink de un tipo de registro de SinkBaseDatos. Se comporta como las listas
+    que reciben las funciones bulk: los registros se agregan con append y se
+    escriben en la base de datos al final de cada página."""
+
+    def __init__(self, base, tipo):
+        self.base = base
+        self.tipo = tipo
+        self.columnas = [columna for columna, tipo_sql in columnas_sink(tipo)]
+        self.llaves = [columna.replace('_', '-') if columna[:6] in ('label_', 'votos_') else columna
+                       for columna in self.columnas]
+        self._fecha = self.columnas.index('fecha_peticion')
+        self.pendientes = []
+        self._escritos = 0
+
+    def append(self, registro):
+        fila = [registro.get(llave) for llave in self.llaves]
+        fecha = fila[self._fecha]
+        if isinstance(fecha, datetime):
+            fila[self._fecha] = fecha.isoformat()
+        with self.base._lock:
+            self.pendientes.append(fila)
+            self._escritos = self._escritos + 1
+        if len(self.pendientes) >= self.base.lote:
+            self.base.escribir()
+
+    def __len__(self):
+        return self._escritos
+
+    def fin_pagina(self):
+        self.base.escribir()
+
+    def flush(self):
+        self.base.escribir()
+
+    def close(self):
+        self.base.close()
+
+class SinkBaseDatos():
+    """Destino de registros en una base de datos embebida, SQLite o DuckDB.
+
+    Crea en la base de datos de ruta una tabla por tipo de registro (tweets,
+    users, media, polls y places) con las columnas de process_tweet,
+    process_user, process_media, process_poll y process_place. Las fechas se
+    guardan como texto ISO 8601. Con tabla se obtiene el sink de cada tipo, que
+    puede pasarse en lugar de las listas lista_* de las funciones bulk.
+
+    Los registros se acumulan y se escriben al final de cada página en una sola
+    transacción, con executemany, o cuando se juntan lote registros pendientes.
+    Las escrituras son upserts sobre id (media_key para media): si el registro ya
+    existe se actualiza únicamente si su fecha_peticion es igual o más reciente,
+    conservando los valores existentes de las columnas que vienen nulas. Así las
+    recolecciones repetidas actualizan las métricas en lugar de duplicar registros.
+
+    motor puede ser 'sqlite' o 'duckdb'; duckdb es una dependencia opcional."""
+
+    def __init__(self, ruta, motor='sqlite', lote=10000):
+        if motor == 'sqlite':
+            import sqlite3
+            self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        elif motor == 'duckdb':
+            if not extras_disponibles(('duckdb',))['duckdb']:
+                raise Exception("El motor duckdb requiere el paquete duckdb")
+            import duckdb
+            self._conexion = duckdb.connect(ruta)
+        else:
+            raise Exception("El motor {} no está soportado".format(motor))
+
+        self.ruta = ruta
+        self.motor = motor
+        self.lote = lote
+        self._lock = threading.RLock()
+        self._tablas = {}
+        self._sql = {}
+        for tipo in tipos_sink:
+            columnas = columnas_sink(tipo)
+            llave = llaves_sink[tipo]
+            definicion = ', '.join('{} {}'.format(columna, tipo_sql) + (' PRIMARY KEY' if columna == llave else '')
+                                   for columna, tipo_sql in columnas)
+            self._conexion.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(tipo, definicion))
+            nombres = [columna for columna, tipo_sql in columnas]
+            actualizar = ', '.join('{0} = COALESCE(excluded.{0}, {1}.{0})'.format(columna, tipo)
+                                   for columna in nombres if columna != llave)
+            self._sql[tipo] = ('INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO UPDATE SET {4} '
+                               'WHERE {0}.fecha_peticion IS NULL OR excluded.fecha_peticion >= {0}.fecha_peticion').format(
+                tipo, ', '.join(nombres), ', '.join('?' for columna in nombres), llave, actualizar)
+            self._tablas[tipo] = TablaSink(self, tipo)
+        self._conexion.commit()
+
+    def tabla(self, tipo):
+        """Regresa el sink de los registros de tipo."""
+
+        return self._tablas[tipo]
+
+    def escribir(self):
+        """Escribe en una sola transacción los registros pendientes de todas las tablas."""
+
+        with self._lock:
+            if self._conexion is None or all(len(tabla.pendientes) == 0 for tabla in self._tablas.values()):
+                return
+            self._conexion.execute('BEGIN TRANSACTION')
+            try:
+                for tipo, tabla in self._tablas.items():
+                    if len(tabla.pendientes) > 0:
+                        self._conexion.executemany(self._sql[tipo], tabla.pendientes)
+            except Exception:
+                self._conexion.rollback()
+                raise
+            self._conexion.commit()
+            for tabla in self._tablas.values():
+                tabla.pendientes = []
+
+    def close(self):
+        """Escribe los registros pendientes y cierra la conexión."""
+
+        with self._lock:
+            if self._conexion is not None:
+                self.escribir()
+                self._conexion.close()
+                self._conexion = None
+
+endpoints_cli = {
+    "followers": ('bulk_followers', 'users'),
+    "following": ('bulk_following', 'users'),
+    "timeline": ('bulk_timeline', 'tweets'),
+    "mentions": ('bulk_mentions', 'tweets'),
+    "liked": ('bulk_liked', 'tweets'),
+    "recent_search": ('bulk_recent_search', 'tweets'),
+    "users": ('bulk_users', 'users'),
+}
+
+tipos_sink = ('tweets', 'users', 'media', 'polls', 'places')
+
+def crear_sinks(salida, tipos=tipos_sink):
+    """Crea los sinks de un trabajo de acuerdo a la sección salida del archivo de trabajo.
+    Regresa un dict con un sink para cada tipo de registro en tipos. Con la llave
+    particiones los registros jsonl se reparten con un SinkParticionado en un
+    subdirectorio por tipo. Si salida tiene la llave asincrono, cada sink se envuelve en un SinkAsincrono; su valor
+    puede ser true o un dict con maximo y directorio."""
+
+    formato = salida.get('formato', 'jsonl')
+    directorio = salida.get('directorio', '.')
+    os.makedirs(directorio, exist_ok=True)
+
+    particiones = salida.get('particiones')
+    if formato == 'jsonl' and particiones:
+        sinks = {tipo: SinkParticionado(os.path.join(directorio, tipo), particiones, tipo=tipo,
+                                        cubetas=salida.get('cubetas', 16))
+                 for tipo in tipos}
+    elif formato == 'jsonl':
+        sinks = {tipo: SinkJsonl(os.path.join(directorio, tipo + '.jsonl')) for tipo in tipos}
+    elif formato in ('sqlite', 'duckdb'):
+        base = SinkBaseDatos(os.path.join(directorio, 'twigy.' + formato), motor=formato)
+        sinks = {tipo: base.tabla(tipo) for tipo in tipos}
+    else:
+        raise Exception("El formato de salida {} no está soportado".format(formato))
+
+    asincrono = salida.get('asincrono')
+    if asincrono:
+        opciones = asincrono if isinstance(asincrono, dict) else {}
+        sinks = {tipo: SinkAsincrono(sink, maximo=opciones.get('maximo', 64),
+                                     directorio=opciones.get('directorio'))
+                 for tipo, sink in sinks.items()}
+    return sinks
+
+def _leer_trabajo(ruta):
+    """Lee y valida un archivo de trabajo en formato JSON."""
+
+    with open(ruta, encoding='utf-8') as archivo:
+        trabajo = json.load(archivo)
+
+    if trabajo.get('id') is None:
+        raise Exception("El archivo de trabajo debe tener un id")
+    if trabajo.get('endpoint') not in endpoints_cli:
+        raise Exception("El endpoint debe ser uno de: {}".format(', '.join(endpoints_cli)))
+
+    semillas = list(trabajo.get('semillas', []))
+    if trabajo.get('archivo_semillas') is not None:
+        with open(trabajo['archivo_semillas'], encoding='utf-8') as archivo:
+            semillas.extend(linea.strip() for linea in archivo if linea.strip())
+    if trabajo['endpoint'] != 'recent_search':
+        semillas, reporte = validar_ids(semillas, unicos=True)
+        if reporte.rechazados > 0:
+            warnings.warn(str(reporte))
+    trabajo['semillas'] = semillas
+
+    tokens = list(trabajo.get('tokens', []))
+    for variable in trabajo.get('tokens_env', ['TWIGY_TOKEN']):
+        if os.environ.get(variable):
+            tokens.append(os.environ[variable])
+    if len(tokens) == 0:
+        raise Exception("El trabajo no tiene tokens, usa tokens o tokens_env")
+    trabajo['tokens'] = tokens
+
+    trabajo['ruta'] = os.path.abspath(ruta)
+    return trabajo
+
+class EstadoTrabajo():
+    """Estado persistente de un trabajo de la línea de comandos.
+    Guarda las semillas terminadas, el token de paginación de las semillas
+    en curso y los errores, de forma que el trabajo se puede reanudar por id."""
+
+    def __init__(self, directorio, trabajo_id):
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta = os.path.join(directorio, '{}.json'.format(trabajo_id))
+        self.datos = {"id": trabajo_id, "archivo": None, "completadas": [], "en_curso": {}, "errores": {}}
+        if os.path.exists(self.ruta):
+            with open(self.ruta, encoding='utf-8') as archivo:
+                self.datos.update(json.load(archivo))
+        self._completadas = set(self.datos['completadas'])
+
+    def pendiente(self, semilla):
+        return semilla not in self._completadas
+
+    def cursor(self, semilla):
+        return self.datos['en_curso'].get(semilla)
+
+    def avanzar(self, semilla, token):
+        with self._lock:
+            if token is not None:
+                self.datos['en_curso'][semilla] = token
+
+    def completar(self, semilla):
+        with self._lock:
+            self._completadas.add(semilla)
+            self.datos['completadas'].append(semilla)
+            self.datos['en_curso'].pop(semilla, None)
+            self.datos['errores'].pop(semilla, None)
+
+    def fallar(self, semilla, error):
+        with self._lock:
+            self.datos['errores'][semilla] = str(error)
+
+    def guardar(self, vaciar=None):
+        """Escribe el estado en disco. Si se pasa vaciar, se llama después de
+        copiar el estado y antes de escribirlo, para que los registros de las
+        páginas y semillas guardadas estén en disco antes que su cursor."""
+
+        with self._lock:
+            texto = json.dumps(self.datos)
+        if vaciar is not None:
+            vaciar()
+        with open(self.ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+        os.replace(self.ruta + '.tmp', self.ruta)
+
+def _opciones_trabajo(trabajo):
+    """Regresa los parámetros extra de las funciones bulk de un trabajo."""
+
+    opciones = {"filtro": crear_filtro(trabajo.get('filtro'))}
+    if endpoints_cli[trabajo['endpoint']][1] == 'tweets':
+        if 'max_tweets' in trabajo:
+            opciones['max_tweets'] = trabajo['max_tweets']
+        if trabajo.get('presupuesto') is not None:
+            opciones['presupuesto'] = Presupuesto(trabajo['presupuesto'])
+    return opciones
+
+def _semillas_trabajo(trabajo):
+    """Regresa las semillas de un trabajo. Para el endpoint users cada semilla
+    es un bloque de hasta 100 ids separados por comas."""
+
+    semillas = trabajo['semillas']
+    if trabajo['endpoint'] == 'users':
+        semillas = [','.join(semillas[k:k + 100]) for k in range(0, len(semillas), 100)]
+    return semillas
+
+def _requesters_trabajo(trabajo, perfilador=None):
+    """Crea un Requester por cada hilo de un trabajo, con los tokens asignados
+    de forma circular, y el pool de procesos del trabajo si es que tiene uno.
+    Regresa la lista de Requester y el pool."""
+
+    libro_cap = None
+    if trabajo.get('libro_cap') is not None:
+        libro_cap = LibroCap(trabajo['libro_cap'], cap=trabajo.get('cap', 500000),
+                             dia_reinicio=trabajo.get('dia_reinicio', 1))
+    procesos = None
+    if trabajo.get('procesos'):
+        from concurrent.futures import ProcessPoolExecutor
+        procesos = ProcessPoolExecutor(int(trabajo['procesos']))
+
+    requesters = []
+    for k in range(int(trabajo.get('concurrencia', 1))):
+        requester = Requester(trabajo['tokens'][k % len(trabajo['tokens'])])
+        requester.set_libro_cap(libro_cap)
+        requester.set_procesos(procesos, int(trabajo['procesos']) if procesos is not None else None)
+        requester.set_perfilador(perfilador)
+        requesters.append(requester)
+    return requesters, procesos
+
+def ejecutar_semilla(requester, trabajo, semilla, sinks, cursor=None, opciones=None, avance=None):
+    """Ejecuta la función bulk del endpoint de un trabajo para una semilla,
+    agregando los registros a los sinks. cursor es el token de paginación con
+    el que se reanuda la semilla y avance la función que recibe el token para
+    reanudarla después de escribir cada página en los sinks. Regresa False si
+    la semilla se detuvo por agotar el presupuesto o el cap y True si terminó."""
+
+    metodo, tipo_principal = endpoints_cli[trabajo['endpoint']]
+    if opciones is None:
+        opciones = _opciones_trabajo(trabajo)
+    if trabajo['endpoint'] == 'users':
+        requester.bulk_users(semilla.split(','), sinks['users'], lista_tweets=sinks['tweets'],
+                             pagination_token=cursor, filtro=opciones['filtro'])
+        return True
+    if tipo_principal == 'users':
+        getattr(requester, metodo)(semilla, sinks['users'],
+                                   pagination_token=cursor,
+                                   lista_tweets=sinks['tweets'],
+                                   filtro=opciones['filtro'],
+                                   avance=avance)
+        return True
+    return getattr(requester, metodo)(semilla, sinks['tweets'],
+                                      pagination_token=cursor,
+                                      lista_users=sinks['users'],
+                                      lista_media=sinks['media'],
+                                      lista_polls=sinks['polls'],
+                                      lista_places=sinks['places'],
+                                      avance=avance,
+                                      **opciones)
+
+def _cambios_trabajo(trabajo, requester, estado, semillas):
+    """Revisa con cambios_metricas cuáles semillas de un trabajo con la llave
+    solo_cambios cambiaron desde su última recolección. Solamente las que
+    regresó la API con las mismas métricas se marcan como completadas. Regresa
+    el objeto MetricasUsuarios y un dict de semilla a registro de usuario con
+    las semillas que hay que recolectar; las que no regresó la API tienen None."""
+
+    metodo = endpoints_cli[trabajo['endpoint']][0]
+    if metodo not in campos_cambio:
+        raise Exception("solo_cambios solamente se puede usar con los endpoints timeline, followers y following")
+
+    metricas = MetricasUsuarios(trabajo['solo_cambios'])
+    campos = campos_cambio[metodo]
+    usuarios = []
+    requester.cambios_metricas(semillas, metricas, campos, usuarios)
+    obtenidos = {usuario['id']: usuario for usuario in usuarios}
+    cambiados = {}
+    for semilla in semillas:
+        usuario = obtenidos.get(semilla)
+        if usuario is not None and not metricas.cambio(usuario, campos):
+            estado.completar(semilla)
+        else:
+            cambiados[semilla] = usuario
+    print("[{}] {} de {} semillas cambiaron desde la última recolección".format(
+        trabajo['id'], len(cambiados), len(semillas)))
+    return metricas, cambiados
+
+def _vaciar_sinks(sinks):
+    """Llama al método flush de los sinks que lo tengan."""
+
+    for sink in sinks.values():
+        flush = getattr(sink, 'flush', None)
+        if flush is not None:
+            flush()
+
+def ejecutar_trabajo(trabajo, estado, intervalo=10, perfilador=None):
+    """Ejecuta un trabajo leído con _leer_trabajo repartiendo las semillas
+    entre un pool de hilos. Cada hilo usa su propio Requester y los tokens
+    del trabajo se asignan de forma circular entre los hilos.
+
+    Cada intervalo segundos se imprime el avance, el throughput y el estado
+    de las ventanas de rate limit, y se guarda el estado del trabajo; la espera
+    termina en cuanto terminan los hilos, sin completar el intervalo. El cursor
+    de cada semilla en curso es el token de la última página escrita en los
+    sinks, y los sinks se vacían antes de guardar el estado. Con solo_cambios,
+    las métricas de las semillas completadas se guardan junto con el estado.
+    Si se pasa un Perfilador, todos los Requester del trabajo lo comparten.
+
+    Si una semilla se detiene por agotar el presupuesto o el cap, queda
+    pendiente con su cursor y los hilos dejan de tomar semillas, de forma que
+    el trabajo puede reanudarse cuando haya presupuesto o se reinicie el cap."""
+
+    sinks = crear_sinks(trabajo.get('salida', {}))
+    opciones = _opciones_trabajo(trabajo)
+    requesters, procesos = _requesters_trabajo(trabajo, perfilador)
+
+    semillas = _semillas_trabajo(trabajo)
+    metricas, cambiados = None, None
+    if trabajo.get('solo_cambios') is not None:
+        metricas, cambiados = _cambios_trabajo(trabajo, requesters[0], estado,
+                                               [semilla for semilla in semillas if estado.pendiente(semilla)])
+    pendientes = queue.Queue()
+    for semilla in semillas:
+        if estado.pendiente(semilla):
+            pendientes.put(semilla)
+    total = len(semillas)
+    agotado = threading.Event()
+
+    def trabajador(requester):
+        while not agotado.is_set():
+            try:
+                semilla = pendientes.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                terminada = ejecutar_semilla(requester, trabajo, semilla, sinks, estado.cursor(semilla), opciones,
+                                             lambda token, semilla=semilla: estado.avanzar(semilla, token))
+                _vaciar_sinks(sinks)
+                if not terminada:
+                    agotado.set()
+                    return
+                estado.completar(semilla)
+                if metricas is not None and cambiados[semilla] is not None:
+                    metricas.registrar(cambiados[semilla])
+            except Exception as error:
+                estado.fallar(semilla, error)
+                print("Error en {}: {}".format(semilla, error))
+
+    def guardar():
+        estado.guardar(lambda: _vaciar_sinks(sinks))
+        if metricas is not None:
+            metricas.guardar()
+
+    hilos = []
+    for requester in requesters:
+        hilo = threading.Thread(target=trabajador, args=(requester,), daemon=True)
+        hilos.append((hilo, requester))
+        hilo.start()
+
+    inicio = time.time()
+    try:
+        while True:
+            limite = time.time() + intervalo
+            for hilo, requester in hilos:
+                hilo.join(max(limite - time.time(), 0))
+            if not any(hilo.is_alive() for hilo, requester in hilos):
+                break
+            guardar()
+            _imprimir_avance(trabajo, estado, total, sinks, hilos, inicio)
+    except KeyboardInterrupt:
+        guardar()
+        print("Trabajo {} interrumpido, se puede reanudar con: python -m twigy resume {}".format(trabajo['id'], trabajo['id']))
+        raise
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        if procesos is not None:
+            procesos.shutdown(wait=False)
+        if metricas is not None:
+            metricas.guardar()
+
+    estado.guardar()
+    _imprimir_avance(trabajo, estado, total, sinks, hilos, inicio)
+    if agotado.is_set():
+        print("Trabajo {} detenido al agotar el presupuesto o el cap, se puede reanudar con: python -m twigy resume {}".format(
+            trabajo['id'], trabajo['id']))
+        return False
+    return len(estado.datos['errores']) == 0
+
+def _imprimir_avance(trabajo, estado, total, sinks, hilos, inicio):
+    """Imprime una línea con el avance del trabajo y el estado de los rate limits."""
+
+    transcurrido = max(time.time() - inicio, 1e-9)
+    registros = sum(len(sink) for sink in sinks.values())
+    limites = {}
+    for hilo, requester in hilos:
+        for endpoint, limite in requester.limites.items():
+            actual = limites.get(endpoint)
+            if actual is None or limite['restantes'] < actual['restantes']:
+                limites[endpoint] = limite
+    texto_limites = ' '.join('{}: {}/{} reinicio en {:.0f}s'.format(
+        endpoint, limite['restantes'], limite['limite'], max(limite['reinicio'] - time.time(), 0))
+        for endpoint, limite in limites.items())
+
+    libro_cap = hilos[0][1].libro_cap
+    if libro_cap is not None:
+        texto_limites = texto_limites + ' cap restante: {}'.format(libro_cap.restante())
+
+    colas = [sink.metricas() for sink in sinks.values() if isinstance(sink, SinkAsincrono)]
+    if len(colas) > 0:
+        texto_limites = texto_limites + ' cola de escritura: {} en memoria, {} en disco'.format(
+            sum(cola['en_memoria'] for cola in colas), sum(cola['en_disco'] for cola in colas))
+
+    print("[{}] semillas {}/{} errores {} registros {} ({:.1f}/s) {}".format(
+        trabajo['id'], len(estado.datos['completadas']), total, len(estado.datos['errores']),
+        registros, registros / transcurrido, texto_limites))
+
+class Asignacion():
+    """Semilla de un trabajo asignada a un trabajador por una ColaTrabajo.
+    La asignación vence en el momento vence (epoch en segundos) si el
+    trabajador no la renueva con latir o avanzar."""
+
+    def __init__(self, trabajo, semilla, trabajador, vence, cursor=None, intentos=1):
+        self.trabajo = trabajo
+        self.semilla = semilla
+        self.trabajador = trabajador
+        self.vence = vence
+        self.cursor = cursor
+        self.intentos = intentos
+
+    def __repr__(self):
+        return "Asignacion({}, {}, {})".format(self.trabajo, self.semilla, self.trabajador)
+
+class ColaTrabajo(ABC):
+    """Interfaz de una cola de semillas compartida por varios trabajadores,
+    posiblemente en distintas máquinas.
+
+    Un trabajador toma semillas con tomar y recibe una Asignacion que vence si
+    no la renueva periódicamente con latir o avanzar, que además guarda el
+    token de paginación. Si la asignación vence, la semilla vuelve a estar
+    disponible para otro trabajador, que la reanuda desde el último token
+    guardado. completar marca la semilla como terminada únicamente si la
+    asignación sigue vigente, por lo que cada semilla se completa una sola vez.
+    fallar la regresa a la cola hasta agotar sus intentos."""
+
+    @abstractmethod
+    def agregar(self, trabajo, semillas):
+        """Agrega las semillas de un trabajo. Las que ya estaban en la cola se ignoran."""
+
+    @abstractmethod
+    def tomar(self, trabajo, trabajador, n=1):
+        """Asigna a trabajador hasta n semillas disponibles. Regresa una lista de Asignacion."""
+
+    def latir(self, asignacion):
+        """Renueva una asignación. Regresa False si ya no pertenece al trabajador."""
+        return self.avanzar(asignacion, None)
+
+    @abstractmethod
+    def avanzar(self, asignacion, cursor):
+        """Guarda el token de paginación de una asignación y la renueva.
+        Regresa False si ya no pertenece al trabajador."""
+
+    @abstractmethod
+    def completar(self, asignacion):
+        """Marca como terminada la semilla de una asignación vigente. Regresa True si
+        la semilla quedó completada por esta asignación."""
+
+    @abstractmethod
+    def fallar(self, asignacion, error):
+        """Registra un error en la semilla y la regresa a la cola si le quedan intentos."""
+
+    @abstractmethod
+    def liberar(self, asignacion):
+        """Regresa a la cola una semilla vigente que no terminó, sin contar la
+        asignación como intento, para que se reanude desde su último token."""
+
+    @abstractmethod
+    def resumen(self, trabajo):
+        """Regresa un dict con el número de semillas de un trabajo en cada estado."""
+
+class ColaSQLite(ColaTrabajo):
+    """ColaTrabajo guardada en un archivo SQLite, que pueden compartir varios
+    procesos de una máquina o de varias máquinas con un sistema de archivos
+    compartido que soporte los locks de SQLite.
+
+    duracion es la vigencia en segundos de cada asignación y max_intentos el
+    número de veces que se asigna una semilla antes de marcarla como fallida.
+    Las asignaciones vencidas cuentan como un intento."""
+
+    def __init__(self, ruta, duracion=300, max_intentos=3):
+        import sqlite3
+
+        self.ruta = ruta
+        self.duracion = duracion
+        self.max_intentos = max_intentos
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('CREATE TABLE IF NOT EXISTS semillas ('
+                               'trabajo TEXT, semilla TEXT, estado TEXT, trabajador TEXT, vence REAL, '
+                               'intentos INTEGER, cursor TEXT, error TEXT, PRIMARY KEY (trabajo, semilla))')
+
+    def _transaccion(self, sql, parametros=(), muchos=False):
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                if muchos:
+                    cursor = self._conexion.executemany(sql, parametros)
+                else:
+                    cursor = self._conexion.execute(sql, parametros)
+                filas = cursor.rowcount
+            except Exception:
+                self._conexion.execute('ROLLBACK')
+                raise
+            self._conexion.execute('COMMIT')
+        return filas
+
+    def agregar(self, trabajo, semillas):
+        self._transaccion("INSERT OR IGNORE INTO semillas VALUES (?, ?, 'pendiente', NULL, 0, 0, NULL, NULL)",
+                          [(trabajo, semilla) for semilla in semillas], muchos=True)
+
+    def tomar(self, trabajo, trabajador, n=1):
+        ahora = time.time()
+        vence = ahora + self.duracion
+        with self._lock:
+            self._conexion.execute('BEGIN IMMEDIATE')
+            try:
+                self._conexion.execute("UPDATE semillas SET estado = 'fallida', trabajador = NULL "
+                                       "WHERE trabajo = ? AND estado = 'asignada' AND vence < ? AND intentos >= ?",
+                                       (trabajo, ahora, self.max_intentos))
+                filas = self._conexion.execute(
+                    "SELECT semilla, cursor, intentos FROM semillas WHERE trabajo = ? AND "
+                    "(estado = 'pendiente' OR (estado = 'asignada' AND vence < ?)) LIMIT ?",
+                    (trabajo, ahora, n)).fetchall()
+                self._conexion.executemany(
+                    "UPDATE semillas SET estado = 'asignada', trabajador = ?, vence = ?, intentos = intentos + 1 "
+                    "WHERE trabajo = ? AND semilla = ?",
+                    [(trabajador, vence, trabajo, semilla) for semilla, cursor, intentos in filas])
+            except Exception:
+                self._conexion.execute('ROLLBACK')
+                raise
+            self._conexion.execute('COMMIT')
+        return [Asignacion(trabajo, semilla, trabajador, vence, cursor, intentos + 1)
+                for semilla, cursor, intentos in filas]
+
+    def avanzar(self, asignacion, cursor):
+        vence = time.time() + self.duracion
+        filas = self._transaccion("UPDATE semillas SET vence = ?, cursor = COALESCE(?, cursor) "
+                                  "WHERE trabajo = ? AND semilla = ? AND trabajador = ? AND estado = 'asignada'",
+                                  (vence, cursor, asignacion.trabajo, asignacion.semilla, asignacion.trabajador))
+        if filas == 1:
+            asignacion.vence = vence
+            if cursor is not None:
+                asignacion.cursor = cursor
+        return filas == 1
+
+    def completar(self, asignacion):
+        filas = self._transaccion("UPDATE semillas SET estado = 'completada', error = NULL "
+                                  "WHERE trabajo = ? AND semilla = ? AND trabajador = ? AND estado = 'asignada'",
+                                  (asignacion.trabajo, asignacion.semilla, asignacion.trabajador))
+        return filas == 1
+
+    def fallar(self, asignacion, error):
+        self._transaccion("UPDATE semillas SET estado = CASE WHEN intentos >= ? THEN 'fallida' ELSE 'pendiente' END, "
+                          "trabajador = NULL, error = ? "
+                          "WHERE trabajo = ? AND semilla = ? AND trabajador = ? AND estado = 'asignada'",
+                          (self.max_intentos, str(error), asignacion.trabajo, asignacion.semilla,
+                           asignacion.trabajador))
+
+    def liberar(self, asignacion):
+        self._transaccion("UPDATE semillas SET estado = 'pendiente', trabajador = NULL, intentos = intentos - 1 "
+                          "WHERE trabajo = ? AND semilla = ? AND trabajador = ? AND estado = 'asignada'",
+                          (asignacion.trabajo, asignacion.semilla, asignacion.trabajador))
+
+    def resumen(self, trabajo):
+        with self._lock:
+            filas = self._conexion.execute("SELECT estado, COUNT(*) FROM semillas WHERE trabajo = ? GROUP BY estado",
+                                           (trabajo,)).fetchall()
+        conteo = {"pendiente": 0, "asignada": 0, "completada": 0, "fallida": 0}
+        conteo.update(dict(filas))
+        return conteo
+
+    def errores(self, trabajo):
+        """Regresa un dict con el último error de las semillas fallidas de un trabajo."""
+
+        with self._lock:
+            filas = self._conexion.execute("SELECT semilla, error FROM semillas WHERE trabajo = ? AND estado = 'fallida'",
+                                           (trabajo,)).fetchall()
+        return dict(filas)
+
+    def close(self):
+        with self._lock:
+            self._conexion.close()
+
+class TrabajadorCola():
+    """Toma semillas de una ColaTrabajo y las ejecuta con la función bulk del
+    endpoint del trabajo, agregando los registros a los sinks.
+
+    Mientras se ejecuta una semilla, un hilo renueva la asignación cada latido
+    segundos: vacía los sinks y guarda en la cola el token de la última página
+    escrita en ellos, de forma que si el trabajador muere otro trabajador
+    reanuda la semilla desde ese punto. Si la semilla falla se guarda el mismo
+    token antes de regresarla a la cola. Si la semilla se detiene por agotar el
+    presupuesto o el cap, se guarda su token, se libera y el trabajador deja de
+    tomar semillas. Si la asignación se pierde, los registros escritos después
+    del último latido pueden repetirse cuando otro trabajador la reanude."""
+
+    def __init__(self, cola, trabajo, requester, sinks, nombre=None, latido=None, opciones=None):
+        if nombre is None:
+            import socket
+            nombre = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), threading.get_ident())
+        self.cola = cola
+        self.trabajo = trabajo
+        self.requester = requester
+        self.sinks = sinks
+        self.nombre = nombre
+        self.latido = latido if latido is not None else max(getattr(cola, 'duracion', 300) / 3, 1)
+        self.opciones = opciones if opciones is not None else _opciones_trabajo(trabajo)
+        self.completadas = 0
+        self.fallidas = 0
+
+    def _guardar_avance(self, asignacion, progreso):
+        cursor = progreso[0]
+        _vaciar_sinks(self.sinks)
+        return self.cola.avanzar(asignacion, cursor)
+
+    def _latir(self, asignacion, progreso, detener):
+        while not detener.wait(self.latido):
+            if not self._guardar_avance(asignacion, progreso):
+                print("Se perdió la asignación de {}".format(asignacion.semilla))
+                return
+
+    def ejecutar(self, esperar=0):
+        """Toma y ejecuta semillas hasta que la cola se vacía. Si esperar es mayor a 0,
+        cuando no hay semillas disponibles espera esos segundos y vuelve a intentar
+        mientras queden semillas asignadas a otros trabajadores, que pueden vencer.
+        Regresa el número de semillas completadas."""
+
+        while True:
+            asignaciones = self.cola.tomar(self.trabajo['id'], self.nombre)
+            if len(asignaciones) == 0:
+                if esperar > 0 and self.cola.resumen(self.trabajo['id'])['asignada'] > 0:
+                    time.sleep(esperar)
+                    continue
+                return self.completadas
+            for asignacion in asignaciones:
+                progreso = [asignacion.cursor]
+                detener = threading.Event()
+                latido = threading.Thread(target=self._latir, args=(asignacion, progreso, detener), daemon=True)
+                latido.start()
+
+                def avance(token, progreso=progreso):
+                    if token is not None:
+                        progreso[0] = token
+
+                try:
+                    terminada = ejecutar_semilla(self.requester, self.trabajo, asignacion.semilla, self.sinks,
+                                                 asignacion.cursor, self.opciones, avance)
+                    _vaciar_sinks(self.sinks)
+                    detener.set()
+                    latido.join()
+                    if not terminada:
+                        if self.cola.avanzar(asignacion, progreso[0]):
+                            self.cola.liberar(asignacion)
+                        print("Presupuesto o cap agotado en {}".format(asignacion.semilla))
+                        return self.completadas
+                    if self.cola.completar(asignacion):
+                        self.completadas = self.completadas + 1
+                except Exception as error:
+                    detener.set()
+                    latido.join()
+                    self.fallidas = self.fallidas + 1
+                    try:
+                        self._guardar_avance(asignacion, progreso)
+                    except Exception as error_sink:
+                        print("No se pudo guardar el avance de {}: {}".format(asignacion.semilla, error_sink))
+                    self.cola.fallar(asignacion, error)
+                    print("Error en {}: {}".format(asignacion.semilla, error))
+
+def trabajar_cola(trabajo, cola, intervalo=10, perfilador=None, esperar=30):
+    """Agrega las semillas de un trabajo a la cola y las ejecuta con un
+    TrabajadorCola por cada hilo de concurrencia del trabajo. Varios nodos pueden
+    ejecutar el mismo trabajo sobre la misma cola, cada uno con sus tokens y su
+    salida. Cada intervalo segundos se imprime el resumen de la cola."""
+
+    cola.agregar(trabajo['id'], _semillas_trabajo(trabajo))
+    sinks = crear_sinks(trabajo.get('salida', {}))
+    opciones = _opciones_trabajo(trabajo)
+    requesters, procesos = _requesters_trabajo(trabajo, perfilador)
+
+    hilos = []
+    for k, requester in enumerate(requesters):
+        trabajador = TrabajadorCola(cola, trabajo, requester, sinks, opciones=opciones)
+        trabajador.nombre = '{}-{}'.format(trabajador.nombre, k)
+        hilo = threading.Thread(target=trabajador.ejecutar, args=(esperar,), daemon=True)
+        hilos.append(hilo)
+        hilo.start()
+
+    try:
+        while any(hilo.is_alive() for hilo in hilos):
+            for hilo in hilos:
+                hilo.join(intervalo / len(hilos))
+            conteo = cola.resumen(trabajo['id'])
+            print("[{}] pendientes {} asignadas {} completadas {} fallidas {} registros {}".format(
+                trabajo['id'], conteo['pendiente'], conteo['asignada'], conteo['completada'],
+                conteo['fallida'], sum(len(sink) for sink in sinks.values())))
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        if procesos is not None:
+            procesos.shutdown(wait=False)
+    return cola.resumen(trabajo['id'])['fallida'] == 0
+
+def planear_trabajo(trabajo, latencia=0.5, metricas=True):
+    """Estima un trabajo leído con _leer_trabajo sin ejecutarlo. Para followers,
+    following y timeline obtiene las métricas de las semillas con bulk_users, lo
+    que cuesta una petición por cada 100 semillas. Regresa un PlanTrabajo."""
+
+    metodo = endpoints_cli[trabajo['endpoint']][0]
+    tokens = len(trabajo['tokens'])
+    concurrencia = int(trabajo.get('concurrencia', 1))
+
+    usuarios = None
+    if metricas and metodo in metricas_bulk:
+        usuarios = metricas_semillas(Requester(trabajo['tokens'][0]), trabajo['semillas'])
+    cap_restante = None
+    if trabajo.get('libro_cap') is not None:
+        cap_restante = LibroCap(trabajo['libro_cap'], cap=trabajo.get('cap', 500000),
+                                dia_reinicio=trabajo.get('dia_reinicio', 1)).restante()
+
+    plan = planear(metodo, trabajo['semillas'], tokens=min(tokens, concurrencia), usuarios=usuarios,
+                   max_tweets=trabajo.get('max_tweets'), latencia=latencia,
+                   hilos_por_token=max(1, concurrencia // tokens), cap_restante=cap_restante)
+    if usuarios is not None:
+        plan.peticiones_previas = -(-len(trabajo['semillas']) // 100)
+    return plan
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos de twigy.
+
+    python -m twigy run trabajo.json   ejecuta un trabajo, si ya existe su estado lo reanuda
+    python -m twigy resume ID          reanuda el trabajo con el id indicado
+    python -m twigy status ID          muestra el avance guardado de un trabajo
+    python -m twigy work trabajo.json --cola cola.sqlite
+                                       ejecuta un trabajo compartido entre varios nodos
+    python -m twigy plan trabajo.json  estima peticiones, duración y cap sin ejecutar"""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m twigy', description="Ejecuta trabajos de recolección con twigy.")
+    parser.add_argument('--estado', default='.twigy', help="directorio donde se guarda el estado de los trabajos")
+    parser.add_argument('--intervalo', type=float, default=10, help="segundos entre reportes de avance")
+    parser.add_argument('--perfil', action='store_true', help="al terminar imprime en qué se fue el tiempo por endpoint")
+    parser.add_argument('--traza', help="archivo donde se guarda la traza del perfil en formato Chrome trace")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    correr = comandos.add_parser('run', help="ejecuta un archivo de trabajo")
+    correr.add_argument('archivo')
+    correr.add_argument('--reiniciar', action='store_true', help="ignora el estado guardado del trabajo")
+    reanudar = comandos.add_parser('resume', help="reanuda un trabajo por su id")
+    reanudar.add_argument('id')
+    avance = comandos.add_parser('status', help="muestra el avance de un trabajo por su id")
+    avance.add_argument('id')
+    trabajar = comandos.add_parser('work', help="ejecuta un trabajo tomando las semillas de una cola compartida")
+    trabajar.add_argument('archivo')
+    trabajar.add_argument('--cola', required=True, help="archivo SQLite de la cola compartida")
+    trabajar.add_argument('--duracion', type=float, default=300, help="segundos de vigencia de cada asignación")
+    estimar = comandos.add_parser('plan', help="estima peticiones, duración y cap de un trabajo sin ejecutarlo")
+    estimar.add_argument('archivo')
+    estimar.add_argument('--latencia', type=float, default=0.5, help="segundos estimados por petición")
+    estimar.add_argument('--sin-metricas', action='store_true', help="no pide las métricas de las semillas a users")
+    args = parser.parse_args(argv)
+
+    if args.comando == 'plan':
+        plan = planear_trabajo(_leer_trabajo(args.archivo), latencia=args.latencia, metricas=not args.sin_metricas)
+        print(plan)
+        return 2 if plan.excede_cap() else 0
+
+    perfilador = None
+    if args.perfil or args.traza:
+        perfilador = Perfilador(traza=args.traza is not None)
+
+    if args.comando == 'run':
+        trabajo = _leer_trabajo(args.archivo)
+        if args.reiniciar:
+            ruta = os.path.join(args.estado, '{}.json'.format(trabajo['id']))
+            if os.path.exists(ruta):
+                os.remove(ruta)
+    elif args.comando == 'work':
+        trabajo = _leer_trabajo(args.archivo)
+    else:
+        estado = EstadoTrabajo(args.estado, args.id)
+        if estado.datos['archivo'] is None:
+            print("No hay estado guardado para el trabajo {}".format(args.id))
+            return 1
+        if args.comando == 'status':
+            print("Trabajo {}: {} semillas completadas, {} en curso, {} con errores".format(
+                args.id, len(estado.datos['completadas']), len(estado.datos['en_curso']),
+                len(estado.datos['errores'])))
+            for semilla, error in estado.datos['errores'].items():
+                print("  {}: {}".format(semilla, error))
+            return 0
+        trabajo = _leer_trabajo(estado.datos['archivo'])
+
+    try:
+        if args.comando == 'work':
+            cola = ColaSQLite(args.cola, duracion=args.duracion)
+            exito = trabajar_cola(trabajo, cola, intervalo=args.intervalo, perfilador=perfilador)
+        else:
+            estado = EstadoTrabajo(args.estado, trabajo['id'])
+            estado.datos['archivo'] = trabajo['ruta']
+            exito = ejecutar_trabajo(trabajo, estado, intervalo=args.intervalo, perfilador=perfilador)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if perfilador is not None:
+            perfilador.imprimir()
+            if args.traza:
+                perfilador.guardar_traza(args.traza)
+    return 0 if exito else 1
+
+if __name__ == '__main__':
+    sys.exit(main())